@@ -1,11 +1,19 @@
 from typing import Optional
-import google.generativeai as genai
 from terminal_colors import TerminalColors
 from config import GeminiConfig
+from llm_backend import LLMBackend, estimate_tokens, get_backend, usage_tokens
+from rate_limiter import get_rate_limiter
+from chat_sessions import ChatSessionPool
+from history_manager import ConversationHistory
+from metrics import GENERATION_SECONDS
+from resilience import get_resilience
+from single_flight import SINGLE_FLIGHT
+from prompt_cache import get_prompt_cache
+import functools
 import logging
-import time
-import random
 import asyncio
+import threading
+import time
 
 class AIAgent:
     LOLANG_PROMPT_TESTING  = """
@@ -63,69 +71,366 @@ class AIAgent:
 
     
 
-    def __init__(self, name: str, color: str, config: GeminiConfig):
+    def __init__(self, name: str, color: str, config: GeminiConfig,
+                 backend: Optional[LLMBackend] = None):
         self.name = name
         self.color = color
         self.config = config
-        self._model = None
+        self.backend = backend or get_backend(config)
+        self.rate_limiter = get_rate_limiter(config)
+        # Retries, circuit breaker and hedging shared by every agent on this backend
+        self.resilience = get_resilience(config, self.backend, "generation")
+        # Registers the static LOLANG prompt once instead of billing it every turn
+        self.prompt_cache = get_prompt_cache(config, self.backend)
+        self.generation_config = {
+            "temperature": self.config.temperature,
+            "max_output_tokens": self.config.max_tokens,
+        }
+        self.sessions = ChatSessionPool(
+            max_sessions=self.config.chat_session_max,
+            ttl=self.config.chat_session_ttl,
+        )
+        # Tokens billed to this agent, as reported by the backend
+        self.usage = {"requests": 0, "prompt_tokens": 0, "output_tokens": 0, "cached_tokens": 0}
+        self._usage_lock = threading.Lock()
+        # Runs achat/astream model calls; None uses the loop's default
+        # executor. AgentServer sets a pool sized to its generation limit.
+        self.executor = None
         self.logger = logging.getLogger(__name__)
-        
-        # Initialize Gemini
-        genai.configure(api_key=config.api_key)
-
-    @property
-    def model(self):
-        if self._model is None:
-            try:
-                self._model = genai.GenerativeModel(
-                    model_name=self.config.model_name,
-                    generation_config={
-                        "temperature": self.config.temperature,
-                        "max_output_tokens": self.config.max_tokens,
-                    }
-                )
-            except Exception as e:
-                self.logger.error(f"Failed to initialize Gemini model: {e}")
-                raise
-        return self._model
-
-    def chat(self, message_history):
-        max_retries = 10
-        base_delay = 5
-        
-        for attempt in range(max_retries):
-            try:
-                # Create chat context
-                chat = self.model.start_chat(history=[])
-                
-                # Format message history for the prompt
-                formatted_history = "\n".join([
-                    f"{msg['role']}: {msg['content']}" 
-                    for msg in message_history
-                ])
-                
-                # Use LOLANG_PROMPT_PRODUCTION for real conversations
-                prompt = self.LOLANG_PROMPT_PRODUCTION
-                
-                # Send system prompt and message history
-                response = chat.send_message(
-                    f"{prompt}\n\nChat history:\n{formatted_history}"
-                )
-                
-                # Add delay to respect rate limits
-                time.sleep(self.config.message_delay)
-                
-                return response.text
-            except Exception as e:
-                if "429" in str(e) and attempt < max_retries - 1:
-                    # Calculate exponential backoff with jitter
-                    delay = (base_delay * (2 ** attempt)) + random.uniform(0, 1)
-                    # Silently retry without logging
-                    time.sleep(delay)
-                else:
-                    # Only log if it's not a 429 error or we've reached max retries
-                    self.logger.error(f"Chat completion failed: {e}")
-                    return f"Error: {str(e)}"
+
+    def _start_chat(self, history=None, cached_context=None):
+        try:
+            return self.backend.start_chat(self.config.model_name, self.generation_config, history, cached_context)
+        except Exception as e:
+            self.logger.error(f"Failed to initialize {self.backend.name} model: {e}")
+            raise
+
+    def _static_prefixes(self):
+        # Longest first; the encode prompt shares only the language rules
+        return (self.LOLANG_PROMPT_PRODUCTION, self.LOLANG_PROMPT_PRODUCTION.split("BASED ON CHAT HISTORY")[0])
+
+    def _open_chat(self, prompt):
+        """
+        Start a chat for a full prompt, on a cached context for its static
+        prefix when one is available.
+
+        Returns:
+            tuple: (chat, text to send).
+        """
+        if self.prompt_cache is None:
+            return self._start_chat(), prompt
+        cached_context, content = self.prompt_cache.split(prompt, self._static_prefixes())
+        return self._start_chat(cached_context=cached_context), content
+
+    def _build_prompt(self, message_history):
+        # Format message history for the prompt
+        formatted_history = "\n".join([
+            f"{msg['role']}: {msg['content']}" 
+            for msg in message_history
+        ])
+
+        # Use LOLANG_PROMPT_PRODUCTION for real conversations
+        prompt = self.LOLANG_PROMPT_PRODUCTION
+
+        return f"{prompt}\n\nChat history:\n{formatted_history}"
+
+    def _build_delta_prompt(self, new_messages):
+        formatted_messages = "\n".join([
+            f"{msg['role']}: {msg['content']}"
+            for msg in new_messages
+        ])
+        return f"New messages:\n{formatted_messages}\n\nContinue the chat using the LOLANG language."
+
+    @staticmethod
+    def _normalize(text):
+        return " ".join(text.split())
+
+    def _history_delta(self, message_history, seen):
+        # Returns (total turns, turns added since `seen`), or (total, None)
+        # when some of those turns have already been folded out of reach
+        if isinstance(message_history, ConversationHistory):
+            total = message_history.total_turns
+            new_count = total - seen
+            recent = message_history.recent(new_count)
+            return total, recent if len(recent) == new_count else None
+        messages = list(message_history)
+        if seen > len(messages):
+            return len(messages), None
+        return len(messages), messages[seen:]
+
+    def _session_prompt(self, session, message_history):
+        """
+        Build the request for a persistent session: the full prompt when the
+        chat is new, otherwise only the turns the model has not seen yet.
+        """
+        total, new_messages = self._history_delta(message_history, session.seen)
+        if (session.chat is None or new_messages is None
+                or session.turns >= self.config.chat_session_max_turns):
+            session.reset()
+            session.chat, prompt = self._open_chat(self._build_prompt(list(message_history)))
+            return prompt, total
+
+        # The model already knows its own last reply; don't send it back
+        if new_messages and session.last_reply is not None \
+                and self._normalize(new_messages[0]["content"]) == session.last_reply:
+            new_messages = new_messages[1:]
+        return self._build_delta_prompt(new_messages), total
+
+    def _prepare(self, message_history, session_id):
+        session = None
+        if session_id is not None and self.config.chat_sessions_enabled:
+            # None if the session is already in use; fall back to one-shot
+            session = self.sessions.checkout(session_id)
+        if session is None:
+            return None, self._build_prompt(list(message_history)), None
+        try:
+            prompt, mark = self._session_prompt(session, message_history)
+        except Exception:
+            self.sessions.release(session)
+            raise
+        return session, prompt, mark
+
+    def _finish(self, session, mark, response_text, failed=False):
+        if session is None:
+            return
+        if failed:
+            session.reset()
+        else:
+            session.seen = mark
+            session.turns += 1
+            session.last_reply = self._normalize(response_text)
+        self.sessions.release(session)
+
+    def reset_session(self, session_id):
+        """Forget the persistent chat for a conversation."""
+        self.sessions.reset(session_id)
+
+    def close_session(self, session_id):
+        """Remove a conversation's persistent chat from the pool."""
+        self.sessions.discard(session_id)
+
+    def _generate(self, prompt, session=None):
+        # Reuse the conversation's chat, or create a one-off chat context
+        if session is not None:
+            chat = session.chat
+        else:
+            chat, prompt = self._open_chat(prompt)
+
+        # Send system prompt and message history (or only the new turns)
+        return chat.send_message(prompt)
+
+    def _record_success(self, estimated_tokens, response):
+        actual_tokens = usage_tokens(response)
+        if actual_tokens is not None:
+            self.rate_limiter.record_usage(estimated_tokens, actual_tokens)
+        self.rate_limiter.report_success()
+        usage = getattr(response, "usage_metadata", None)
+        with self._usage_lock:
+            self.usage["requests"] += 1
+            self.usage["prompt_tokens"] += getattr(usage, "prompt_token_count", 0) or 0
+            self.usage["output_tokens"] += getattr(usage, "candidates_token_count", 0) or 0
+            self.usage["cached_tokens"] += getattr(usage, "cached_content_token_count", 0) or 0
+
+    def chat(self, message_history, session_id=None):
+        """
+        Generate the next LOLANG message for a conversation.
+
+        With a session_id (and chat_sessions_enabled), the backend chat is
+        kept alive between calls and only new turns are passed to it. Off by
+        default: Gemini resends the whole chat on each call, so this does not
+        save prompt tokens there.
+        """
+        session, prompt, mark = self._prepare(message_history, session_id)
+        return self._run(prompt, session, mark)
+
+    def encode(self, message):
+        """
+        Encrypt a single human-readable message into LOLANG.
+
+        Used by the compression benchmark to measure LOLANG against the
+        plain-English original.
+        """
+        return self._run(self._build_encode_prompt(message)).strip()
+
+    def summarize(self, summary, turns, token_budget):
+        """
+        Merge older conversation turns into a running summary.
+
+        Used by ConversationHistory to keep a rolling summary of the turns
+        folded out of its verbatim window. Blocking; the history calls it
+        from a background thread.
+
+        Args:
+            summary (str): The current summary, or an empty string.
+            turns (list): The (role, content) turns to merge in, oldest first.
+            token_budget (int): Maximum size of the new summary in tokens.
+
+        Returns:
+            str: The new summary.
+
+        Raises:
+            Exception: If the request fails after retries.
+        """
+        prompt = self._build_summary_prompt(summary, turns, token_budget)
+        estimated_tokens = estimate_tokens(prompt)
+        response = self.resilience.call_sync(lambda: self._generate(prompt), estimated_tokens)
+        self._record_success(estimated_tokens, response)
+        return response.text.strip()
+
+    def _build_summary_prompt(self, summary, turns, token_budget):
+        formatted_turns = "\n".join(f"{role}: {content}" for role, content in turns)
+        # Roughly 0.75 words per token
+        words = max(20, token_budget * 3 // 4)
+        return (
+            "SUMMARIZE THE CONVERSATION SO FAR for the agents taking part in it. Merge the new turns "
+            "into the current summary. Keep names, identifiers, numbers, decisions and open "
+            f"questions; drop greetings and repetition. Use at most {words} words and return the "
+            f"summary only.\n\nCurrent summary: {summary or '(none)'}\n\nNew turns:\n{formatted_turns}"
+        )
+
+    def _build_encode_prompt(self, message):
+        # Same language rules as the conversation prompt, different task
+        rules = self.LOLANG_PROMPT_PRODUCTION.split("BASED ON CHAT HISTORY")[0]
+        return (
+            f"{rules}ENCRYPT THE FOLLOWING MESSAGE USING THE LOLANG LANGUAGE.\n"
+            f"    !IMPORTANT : RETURN THE ENCRYPTED MESSAGE ONLY\n\nMessage: {message}"
+        )
+
+    def _run(self, prompt, session=None, mark=None):
+        started = time.perf_counter()
+        try:
+            return self._run_with_retries(prompt, session, mark)
+        finally:
+            GENERATION_SECONDS.observe(time.perf_counter() - started)
+
+    def _run_with_retries(self, prompt, session, mark):
+        estimated_tokens = estimate_tokens(prompt)
+        response = None
+        try:
+            response = self.resilience.call_sync(lambda: self._generate(prompt, session), estimated_tokens)
+        except Exception as e:
+            self.logger.error(f"Chat completion failed: {e}")
+            return f"Error: {str(e)}"
+        finally:
+            # Whatever ends the call, the session must not stay checked out
+            self._finish(session, mark, response and response.text, failed=response is None)
+        self._record_success(estimated_tokens, response)
+        return response.text
+
+    async def achat(self, message_history, session_id=None):
+        """
+        Asynchronous version of chat that never blocks the event loop.
+
+        The model call runs in a worker thread and rate-limit waits use
+        asyncio.sleep, so other connections keep being served meanwhile.
+        """
+        started = time.perf_counter()
+        try:
+            return await self._achat_with_retries(message_history, session_id)
+        finally:
+            GENERATION_SECONDS.observe(time.perf_counter() - started)
+
+    async def _achat_with_retries(self, message_history, session_id):
+        # The prompt is built up front so later appends don't race the worker thread
+        session, prompt, mark = self._prepare(message_history, session_id)
+        if session is None and self.config.generation_single_flight:
+            # Only one-shot prompts; a session reply depends on its chat state
+            return await SINGLE_FLIGHT.do(
+                ("generate", self.config.model_name, self._generation_key(), prompt),
+                lambda: self._achat_attempts(prompt, None, None),
+            )
+        return await self._achat_attempts(prompt, session, mark)
+
+    def _generation_key(self):
+        return tuple(sorted(self.generation_config.items()))
+
+    async def _achat_attempts(self, prompt, session, mark):
+        estimated_tokens = estimate_tokens(prompt)
+        send = functools.partial(self._generate, prompt, session)
+        response = None
+        try:
+            # A one-shot request opens its own chat, so a duplicate is harmless
+            response = await self.resilience.call(
+                send, estimated_tokens, hedge_send=send if session is None else None,
+                executor=self.executor,
+            )
+        except Exception as e:
+            self.logger.error(f"Chat completion failed: {e}")
+            return f"Error: {str(e)}"
+        finally:
+            # Also when the caller is cancelled; the session is then reset
+            self._finish(session, mark, response and response.text, failed=response is None)
+        self._record_success(estimated_tokens, response)
+        return response.text
+
+    def _stream_into(self, prompt, session, loop, queue):
+        # Runs in a worker thread and hands chunks back to the event loop
+        try:
+            if session is not None:
+                chat = session.chat
+            else:
+                chat, prompt = self._open_chat(prompt)
+            response = chat.send_message(prompt, stream=True)
+            for chunk in response:
+                if chunk.text:
+                    loop.call_soon_threadsafe(queue.put_nowait, ("chunk", chunk.text))
+            loop.call_soon_threadsafe(queue.put_nowait, ("done", response))
+        except Exception as e:
+            loop.call_soon_threadsafe(queue.put_nowait, ("error", e))
+
+    async def _stream_attempt(self, prompt, session, estimated_tokens):
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+        loop.run_in_executor(self.executor, self._stream_into, prompt, session, loop, queue)
+        while True:
+            kind, value = await queue.get()
+            if kind == "chunk":
+                yield value
+            elif kind == "done":
+                self._record_success(estimated_tokens, value)
+                return
+            else:
+                raise value
+
+    async def astream(self, message_history, session_id=None):
+        """
+        Stream the next LOLANG message as it is generated.
+
+        Yields text chunks; joined together they form the same reply achat
+        would return. Errors before the first chunk are retried like achat;
+        errors after that end the stream early.
+        """
+        started = time.perf_counter()
+        session, prompt, mark = self._prepare(message_history, session_id)
+        estimated_tokens = estimate_tokens(prompt)
+        call = self.resilience.begin()
+        chunks = []
+        failed = True
+
+        try:
+            while True:
+                try:
+                    await self.resilience.acquire_async(call, estimated_tokens)
+                    async for chunk in self._stream_attempt(prompt, session, estimated_tokens):
+                        chunks.append(chunk)
+                        yield chunk
+                    self.resilience.succeeded(call)
+                    failed = False
+                    return
+                except Exception as e:
+                    # Chunks already yielded can't be taken back
+                    delay = self.resilience.retry_delay(call, e, retryable=not chunks)
+                    if delay is None:
+                        self.logger.error(f"Chat completion failed: {e}")
+                        if not chunks:
+                            yield f"Error: {str(e)}"
+                        return
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+        finally:
+            # Also runs if the consumer stops early; the session is then reset
+            self._finish(session, mark, "".join(chunks), failed=failed)
+            GENERATION_SECONDS.observe(time.perf_counter() - started)
 
     def speak(self, message: str) -> str:
         return TerminalColors.colorize(f"{self.name}: {message}", self.color)
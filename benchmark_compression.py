@@ -0,0 +1,301 @@
+"""
+LOLANG compression benchmark.
+
+Encodes a corpus of English messages with AIAgent, decodes them again with
+LolangDecryptor, and reports token counts, compression ratio, per-stage
+latency percentiles and round-trip similarity. Runs against the offline stub
+backend by default so results are reproducible; the report records hashes of
+the prompts so runs can be compared across prompt versions.
+
+    python benchmark_compression.py --json report.json
+    python benchmark_compression.py --backend gemini --corpus messages.txt
+    python benchmark_compression.py --backend gemini --cassette gemini.bin --record
+    python benchmark_compression.py --cassette gemini.bin
+"""
+import argparse
+import dataclasses
+import difflib
+import hashlib
+import json
+import logging
+import sys
+import time
+from ai_agent import AIAgent
+from config import GeminiConfig
+from latency_stats import summarize
+from llm_backend import LLMBackend, estimate_tokens, get_backend
+from lolang_decryptor import LolangDecryptor
+from terminal_colors import TerminalColors
+
+DEFAULT_CORPUS = [
+    "Do you have a convenient time to book a hotel room at 11pm?",
+    "Hello, are you an AI agent? Let's discuss artificial intelligence.",
+    "Please confirm the meeting with Sarah on Tuesday at 3pm in room 204.",
+    "The server returned error 503 twice in the last 10 minutes; should we retry?",
+    "I need a summary of the quarterly report before the call with the board tomorrow.",
+    "Can you reserve two tickets for the 7:30 show and send the confirmation to Ahmed?",
+    "The shipment with order id 88213 is delayed by 3 days because of the weather.",
+    "Let's compare the latency of both models and pick the faster one for production.",
+    "Remind me to renew the domain name before the end of the month.",
+    "What is the current status of the database migration for customer 4471?",
+    "Schedule a follow-up with the design team next Monday morning.",
+    "The translation agent should only decrypt messages that arrive from the server.",
+]
+
+logger = logging.getLogger(__name__)
+
+
+class _TrackedChat:
+    def __init__(self, chat, backend):
+        self._chat = chat
+        self._backend = backend
+
+    def send_message(self, content, **kwargs):
+        response = self._chat.send_message(content, **kwargs)
+        self._backend.last_usage = getattr(response, "usage_metadata", None)
+        return response
+
+
+class UsageTrackingBackend(LLMBackend):
+    """
+    Wraps another backend and keeps the usage metadata of the last response,
+    so the benchmark can report billed input/output tokens per stage.
+    """
+
+    def __init__(self, inner):
+        self.inner = inner
+        self.name = inner.name
+        self.last_usage = None
+
+    @property
+    def min_cached_tokens(self):
+        return self.inner.min_cached_tokens
+
+    @property
+    def exact_token_counts(self):
+        return self.inner.exact_token_counts
+
+    def start_chat(self, model_name, generation_config, history=None, cached_context=None):
+        return _TrackedChat(self.inner.start_chat(model_name, generation_config, history, cached_context), self)
+
+    def create_cached_context(self, model_name, prefix, ttl):
+        return self.inner.create_cached_context(model_name, prefix, ttl)
+
+    def count_tokens(self, text, model_name):
+        return self.inner.count_tokens(text, model_name)
+
+    def take_usage(self):
+        usage, self.last_usage = self.last_usage, None
+        return (
+            getattr(usage, "prompt_token_count", 0) or 0,
+            getattr(usage, "candidates_token_count", 0) or 0,
+            getattr(usage, "cached_content_token_count", 0) or 0,
+        )
+
+
+def prompt_hash(prompt):
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:12]
+
+
+def count_tokens(backend, text, model_name):
+    """
+    Count tokens with the backend's tokenizer, or estimate them.
+
+    The estimate is used when the backend cannot count exactly (a cassette
+    replay) or the count request fails.
+
+    Returns:
+        tuple: (tokens, True if the count is an estimate).
+    """
+    if backend.exact_token_counts:
+        try:
+            return backend.count_tokens(text, model_name), False
+        except Exception as e:
+            logger.warning(f"Counting tokens failed, using an estimate: {e}")
+    return estimate_tokens(text), True
+
+
+def similarity(original, decoded):
+    """
+    Word-level similarity between the original and the decoded text.
+
+    Returns:
+        float: A ratio between 0 (unrelated) and 1 (identical).
+    """
+    return difflib.SequenceMatcher(None, original.lower().split(), decoded.lower().split()).ratio()
+
+
+def load_corpus(path):
+    """
+    Load a corpus: one message per line, or JSON lines with a "text" field.
+    """
+    messages = []
+    with open(path, encoding="utf-8") as corpus_file:
+        for line in corpus_file:
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith("{"):
+                line = json.loads(line)["text"]
+            messages.append(line)
+    return messages
+
+
+def run_benchmark(messages, config):
+    """
+    Encode and decode every message and collect per-message results.
+
+    Args:
+        messages (list): English messages.
+        config (GeminiConfig): Configuration selecting the backend.
+
+    Returns:
+        dict: The report with per-message rows and aggregate statistics.
+    """
+    backend = UsageTrackingBackend(get_backend(config))
+    agent = AIAgent("Benchmark-Agent", TerminalColors.BLUE, config, backend=backend)
+    decryptor = LolangDecryptor(config, backend=backend)
+
+    rows = []
+    for message in messages:
+        start = time.perf_counter()
+        lolang = agent.encode(message)
+        encode_seconds = time.perf_counter() - start
+        encode_in, encode_out, encode_cached = backend.take_usage()
+
+        start = time.perf_counter()
+        decoded = decryptor.decrypt_sync(lolang)
+        decode_seconds = time.perf_counter() - start
+        decode_in, decode_out, decode_cached = backend.take_usage()
+
+        english_tokens, english_estimated = count_tokens(backend, message, config.model_name)
+        lolang_tokens, lolang_estimated = count_tokens(backend, lolang, config.model_name)
+        rows.append({
+            "original": message,
+            "lolang": lolang,
+            "decoded": decoded,
+            "english_tokens": english_tokens,
+            "lolang_tokens": lolang_tokens,
+            "compression_ratio": lolang_tokens / english_tokens if english_tokens else 0.0,
+            "encode_seconds": encode_seconds,
+            "decode_seconds": decode_seconds,
+            "encode_input_tokens": encode_in,
+            "encode_output_tokens": encode_out,
+            "decode_input_tokens": decode_in,
+            "decode_output_tokens": decode_out,
+            "encode_cached_tokens": encode_cached,
+            "decode_cached_tokens": decode_cached,
+            "similarity": similarity(message, decoded),
+            "tokens_estimated": english_estimated or lolang_estimated,
+        })
+
+    total_english = sum(row["english_tokens"] for row in rows)
+    total_lolang = sum(row["lolang_tokens"] for row in rows)
+    estimated = sum(row["tokens_estimated"] for row in rows)
+    return {
+        "backend": backend.name,
+        "model": config.model_name,
+        "prompts": {
+            "encode": prompt_hash(agent._build_encode_prompt("")),
+            "decode": prompt_hash(LolangDecryptor.DECRYPTION_PROMPT),
+            "decode_version": LolangDecryptor.PROMPT_VERSION,
+        },
+        "messages": len(rows),
+        # "exact" when every count came from the backend's tokenizer
+        "token_counts": "exact" if not estimated else "estimated" if estimated == len(rows) else "mixed",
+        "english_tokens": total_english,
+        "lolang_tokens": total_lolang,
+        "compression_ratio": total_lolang / total_english if total_english else 0.0,
+        "tokens_saved": total_english - total_lolang,
+        "mean_similarity": sum(row["similarity"] for row in rows) / len(rows) if rows else 0.0,
+        "billed_tokens": {
+            "encode_input": sum(row["encode_input_tokens"] for row in rows),
+            "encode_output": sum(row["encode_output_tokens"] for row in rows),
+            "decode_input": sum(row["decode_input_tokens"] for row in rows),
+            "decode_output": sum(row["decode_output_tokens"] for row in rows),
+            # Part of the input counts, served from a cached prompt prefix
+            "encode_cached": sum(row["encode_cached_tokens"] for row in rows),
+            "decode_cached": sum(row["decode_cached_tokens"] for row in rows),
+        },
+        "latency": {
+            "encode": summarize([row["encode_seconds"] for row in rows]),
+            "decode": summarize([row["decode_seconds"] for row in rows]),
+        },
+        "rows": rows,
+    }
+
+
+def print_report(report):
+    print(TerminalColors.colorize(
+        f"LOLANG compression benchmark ({report['backend']}, {report['model']}, "
+        f"prompts {report['prompts']['encode']}/{report['prompts']['decode']})",
+        TerminalColors.HEADER,
+    ))
+    for row in report["rows"]:
+        # ~ marks rows with estimated token counts
+        marker = "~" if row["tokens_estimated"] else " "
+        print(f"{marker}{row['english_tokens']:>5} -> {row['lolang_tokens']:>5} tokens  "
+              f"ratio {row['compression_ratio']:.2f}  sim {row['similarity']:.2f}  {row['original'][:50]}")
+    print("-" * 80)
+    print(f"Messages:          {report['messages']}")
+    print(f"Tokens:            {report['english_tokens']} English -> {report['lolang_tokens']} LOLANG "
+          f"(ratio {report['compression_ratio']:.2f}, saved {report['tokens_saved']})")
+    if report["token_counts"] != "exact":
+        print(TerminalColors.colorize(
+            f"Token counts:      {report['token_counts']}; the backend's tokenizer was not available "
+            f"for the rows marked ~", TerminalColors.YELLOW,
+        ))
+    print(f"Mean similarity:   {report['mean_similarity']:.3f}")
+    billed = report["billed_tokens"]
+    print(f"Billed tokens:     encode {billed['encode_input']}+{billed['encode_output']}, "
+          f"decode {billed['decode_input']}+{billed['decode_output']} "
+          f"(cached prefix {billed['encode_cached']}/{billed['decode_cached']})")
+    for stage, stats in report["latency"].items():
+        print(f"{stage.title()} latency:    p50 {stats['p50'] * 1000:.1f}ms  "
+              f"p95 {stats['p95'] * 1000:.1f}ms  p99 {stats['p99'] * 1000:.1f}ms")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure LOLANG compression and round-trip fidelity.")
+    parser.add_argument("--corpus", help="File with one English message per line (or JSON lines with 'text')")
+    parser.add_argument("--backend", default="stub", help="LLM backend to use (default: stub)")
+    parser.add_argument("--stub-latency", type=float, default=0.0, help="Seconds per stub request")
+    parser.add_argument("--cassette", help="Replay LLM replies from this cassette file")
+    parser.add_argument("--record", action="store_true",
+                        help="Record the replies of --backend to --cassette instead of replaying")
+    parser.add_argument("--simulate-latency", action="store_true",
+                        help="Replay with the recorded response times")
+    parser.add_argument("--json", dest="json_path", help="Write the full report to this file")
+    args = parser.parse_args(argv)
+
+    messages = load_corpus(args.corpus) if args.corpus else DEFAULT_CORPUS
+    # Measure the model, not the cache, phrase codec, sessions or batching
+    config = dataclasses.replace(
+        GeminiConfig.get_default_config(),
+        backend=args.backend,
+        stub_latency=args.stub_latency,
+        decryption_cache_enabled=False,
+        phrase_codec_enabled=False,
+        chat_sessions_enabled=False,
+        decryption_batch_window=0,
+    )
+    if args.cassette:
+        config.backend = "cassette"
+        config.cassette_path = args.cassette
+        config.cassette_mode = "record" if args.record else "replay"
+        config.cassette_backend = args.backend
+        config.cassette_simulate_latency = args.simulate_latency
+    if args.backend == "stub" or (args.cassette and not args.record):
+        # The stub and replays have no quota; don't let the rate limiter skew latencies
+        config.requests_per_minute = config.tokens_per_minute = 10 ** 9
+
+    report = run_benchmark(messages, config)
+    print_report(report)
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as report_file:
+            json.dump(report, report_file, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
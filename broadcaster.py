@@ -0,0 +1,175 @@
+import asyncio
+import logging
+import time
+from metrics import BROADCAST_SECONDS
+from wire_protocol import JsonCodec
+
+
+class Subscriber:
+    """
+    One connected peer with a bounded outbound queue drained by its own
+    writer task, so a slow socket never delays anyone else.
+    """
+
+    DROP_OLDEST = "drop_oldest"
+    DISCONNECT = "disconnect"
+
+    def __init__(self, websocket, queue_size=64, policy=DROP_OLDEST, codec=None):
+        """
+        Initialize the subscriber and start its writer task.
+
+        Args:
+            websocket: The connection to write frames to.
+            queue_size (int): Maximum frames waiting to be sent.
+            policy (str): What to do when the queue is full: "drop_oldest"
+                discards the oldest queued frame, "disconnect" closes the
+                connection.
+            codec: Encoding negotiated with the peer; JSON by default.
+        """
+        if policy not in (self.DROP_OLDEST, self.DISCONNECT):
+            raise ValueError(f"Unknown slow consumer policy: {policy}")
+        self.websocket = websocket
+        self.policy = policy
+        self.codec = codec or JsonCodec()
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.logger = logging.getLogger(__name__)
+        self.dropped = 0
+        self.sent = 0
+        self.bytes_sent = 0
+        self.closed = False
+        self.close_task = None  # Closes the connection of a disconnected slow consumer
+        self.task = asyncio.create_task(self._writer())
+
+    def offer(self, frame, enqueued_at=None):
+        """
+        Queue a frame without waiting.
+
+        Args:
+            frame: The already serialized frame.
+            enqueued_at (float, optional): perf_counter() time the frame
+                was published; defaults to now.
+
+        Returns:
+            bool: False if the frame was not queued.
+        """
+        if self.closed:
+            return False
+        item = (enqueued_at if enqueued_at is not None else time.perf_counter(), frame)
+        try:
+            self.queue.put_nowait(item)
+            return True
+        except asyncio.QueueFull:
+            pass
+
+        if self.policy == self.DROP_OLDEST:
+            self.queue.get_nowait()
+            self.queue.put_nowait(item)
+            self.dropped += 1
+            return True
+
+        self.logger.warning("Disconnecting slow consumer")
+        self.close()
+        self.close_task = asyncio.ensure_future(self._close_connection(1013, "slow consumer"))
+        return False
+
+    async def _writer(self):
+        while True:
+            enqueued_at, frame = await self.queue.get()
+            try:
+                await self.websocket.send(frame)
+                BROADCAST_SECONDS.observe(time.perf_counter() - enqueued_at)
+                self.sent += 1
+                self.bytes_sent += len(frame)
+            except Exception as e:
+                # Usually the peer just went away; unregister cleans up
+                self.logger.debug(f"Send failed, dropping subscriber: {e}")
+                self.closed = True
+                return
+
+    async def _close_connection(self, code, reason):
+        try:
+            await self.websocket.close(code=code, reason=reason)
+        except Exception as e:
+            self.logger.debug(f"Closing slow consumer failed: {e}")
+
+    def close(self):
+        """
+        Stop the writer task and discard queued frames.
+        """
+        self.closed = True
+        self.task.cancel()
+
+
+class Broadcaster:
+    """
+    Fans frames out to every subscriber through per-subscriber queues.
+
+    Publishing never waits on a socket: each frame is serialized once per
+    wire encoding in use and handed to every subscriber's queue. Each
+    subscriber's writer records the time from publishing to the completed
+    send in the broadcast_seconds histogram.
+    """
+
+    def __init__(self, queue_size=64, policy=Subscriber.DROP_OLDEST):
+        """
+        Initialize an empty broadcaster.
+
+        Args:
+            queue_size (int): Outbound queue size for each subscriber.
+            policy (str): Slow consumer policy, see Subscriber.
+        """
+        self.queue_size = queue_size
+        self.policy = policy
+        self.subscribers = {}
+
+    def subscribe(self, websocket, codec=None):
+        """
+        Start delivering frames to a connection.
+
+        Args:
+            websocket: The connection to add.
+            codec: Encoding negotiated with the peer; JSON by default.
+
+        Returns:
+            Subscriber: The new subscriber.
+        """
+        subscriber = Subscriber(websocket, self.queue_size, self.policy, codec)
+        self.subscribers[websocket] = subscriber
+        return subscriber
+
+    def unsubscribe(self, websocket):
+        """
+        Stop delivering frames to a connection.
+
+        Args:
+            websocket: The connection to remove.
+        """
+        subscriber = self.subscribers.pop(websocket, None)
+        if subscriber is not None:
+            subscriber.close()
+
+    def publish(self, frame):
+        """
+        Queue a frame for every subscriber.
+
+        Args:
+            frame (dict): The frame to send.
+
+        Returns:
+            int: The number of subscribers the frame was queued for.
+        """
+        delivered = 0
+        encoded = {}
+        published = time.perf_counter()
+        # Iterate over a snapshot; offer() may disconnect subscribers
+        for subscriber in list(self.subscribers.values()):
+            codec = subscriber.codec
+            data = encoded.get(codec.name)
+            if data is None:
+                data = encoded[codec.name] = codec.encode(frame)
+            if subscriber.offer(data, published):
+                delivered += 1
+        return delivered
+
+    def __len__(self):
+        return len(self.subscribers)
@@ -0,0 +1,373 @@
+"""
+Record/replay of LLM calls.
+
+In record mode, CassetteBackend forwards every chat request to a real
+backend and appends the request's key, the reply, its usage metadata and
+its timing to a cassette file. In replay mode, it answers the same
+requests from that file without touching the network, optionally
+sleeping for the recorded response times, so the agents, the decryptor
+and the whole websocket pipeline can be profiled deterministically.
+
+A request is keyed on the model, the generation config and the full text
+of the chat so far (cached prefix, seeded history, earlier turns and the
+new message), with whitespace normalized. The key therefore does not
+depend on whether the static prefix happened to be served from a cached
+context or sent inline. Each record also carries a loose key without the
+turns sent earlier on the same chat; replay falls back to it when a
+reused chat (an agent's chat session) received its requests in a
+different order than when recording. stats() counts exact hits, loose
+hits and misses; a replay is only faithful when both runs send the same
+requests, so settings that make decryption depend on timing (batching,
+the phrase codec, a bounded decryption queue) are logged as a warning.
+Identical requests recorded more than once are replayed in recorded order.
+
+File layout: an 8-byte magic, then one record per request: u32 payload
+length, the 16-byte exact and loose key digests and the zlib-compressed
+JSON payload. Opening a cassette for replay reads only the record headers
+to build digest -> offsets indexes; payloads are read through a memory
+map and decoded the first time they are needed.
+"""
+import hashlib
+import json
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+from llm_backend import LLMBackend, StubChunk, StubResponse, StubUsage, estimate_tokens
+
+
+class CassetteMissError(Exception):
+    """
+    Raised in replay mode for a request that is not on the cassette.
+    """
+
+
+class CassetteContext:
+    """
+    Cached-context handle that remembers its prefix text for the request key.
+    """
+
+    def __init__(self, prefix, inner=None):
+        self.prefix = prefix
+        self.inner = inner
+
+
+def _normalize(text):
+    return " ".join(str(text).split())
+
+
+class _RecordingStream:
+    """
+    Wraps a streaming response and records it once fully consumed.
+    """
+
+    def __init__(self, chat, content, response, started):
+        self._chat = chat
+        self._content = content
+        self._response = response
+        self._started = started
+
+    def __iter__(self):
+        chunks = []
+        for chunk in self._response:
+            chunks.append((time.perf_counter() - self._started, chunk.text or ""))
+            yield chunk
+        text = "".join(part for _, part in chunks)
+        self._chat._recorded(self._content, text, self._response, chunks)
+
+    @property
+    def text(self):
+        return self._response.text
+
+    @property
+    def usage_metadata(self):
+        return getattr(self._response, "usage_metadata", None)
+
+
+class _ReplayStream:
+    """
+    Streaming response served from the cassette.
+    """
+
+    def __init__(self, entry, usage, delay_scale):
+        self.text = entry["text"]
+        self.usage_metadata = usage
+        self._chunks = entry.get("chunks") or [[entry.get("latency", 0.0), self.text]]
+        self._delay_scale = delay_scale
+
+    def __iter__(self):
+        previous = 0.0
+        for offset, text in self._chunks:
+            if self._delay_scale > 0 and offset > previous:
+                time.sleep((offset - previous) * self._delay_scale)
+            previous = offset
+            yield StubChunk(text)
+
+
+class CassetteChat:
+    """
+    Chat returned by CassetteBackend. Tracks the conversation text so each
+    request can be keyed, and records or replays its replies.
+    """
+
+    def __init__(self, cassette, model_name, generation_config, history=None, cached_context=None, inner=None):
+        self._cassette = cassette
+        self._inner = inner
+        self.model_name = model_name
+        self.generation_config = dict(generation_config)
+        # What the chat was started with: the cached prefix and seeded history
+        self._base = [cached_context.prefix] if cached_context is not None else []
+        for turn in history or []:
+            self._base.extend(turn.get("parts", []) if isinstance(turn, dict) else [turn])
+        self._transcript = list(self._base)
+
+    def _keys(self, content):
+        key = self._cassette.key
+        return (key(self.model_name, self.generation_config, self._transcript + [content]),
+                key(self.model_name, self.generation_config, self._base + [content]))
+
+    def send_message(self, content, stream=False):
+        if self._inner is None:
+            entry, response = self._cassette.replay(self._keys(content), stream)
+            self._transcript.extend((content, entry["text"]))
+            return response
+
+        started = time.perf_counter()
+        response = self._inner.send_message(content, stream=stream)
+        if stream:
+            return _RecordingStream(self, content, response, started)
+        self._recorded(content, response.text, response, None, time.perf_counter() - started)
+        return response
+
+    def _recorded(self, content, text, response, chunks, latency=None):
+        if latency is None:
+            latency = chunks[-1][0] if chunks else 0.0
+        self._cassette.record(self._keys(content), text, getattr(response, "usage_metadata", None), latency, chunks)
+        self._transcript.extend((content, text))
+
+
+class CassetteBackend(LLMBackend):
+    """
+    Backend that records another backend's replies to a cassette file, or
+    replays them from it.
+    """
+
+    name = "cassette"
+
+    MAGIC = b"LOLCAS1\n"
+    _HEADER = struct.Struct("!I16s16s")
+
+    def __init__(self, path, mode="replay", inner=None, simulate_latency=False, latency_scale=1.0):
+        """
+        Open a cassette.
+
+        Args:
+            path (str): The cassette file.
+            mode (str): "record" to call ``inner`` and write a new cassette
+                (an existing file is replaced), "replay" to serve requests
+                from the file.
+            inner (LLMBackend, optional): The backend recorded from; required
+                in record mode.
+            simulate_latency (bool): In replay mode, sleep for the recorded
+                response time (and chunk gaps when streaming).
+            latency_scale (float): Multiplier for the simulated latency.
+        """
+        if mode not in ("record", "replay"):
+            raise ValueError(f"Unknown cassette mode: {mode}")
+        if mode == "record" and inner is None:
+            raise ValueError("Recording needs a backend to record from")
+        self.path = path
+        self.mode = mode
+        self.inner = inner
+        self.delay_scale = latency_scale if simulate_latency else 0.0
+        self.logger = logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        self._index = {}  # exact digest -> list of (offset, length)
+        self._loose_index = {}  # loose digest -> list of (offset, length)
+        self._cursors = {}  # digest -> replays served
+        self._decoded = {}  # offset -> payload
+        self._map = None
+        self._file = None
+        self.hits = 0
+        self.loose_hits = 0
+        self.misses = 0
+        self.recorded = 0
+
+        if mode == "record":
+            self._file = open(path, "wb")
+            self._file.write(self.MAGIC)
+            self._file.flush()
+        else:
+            self._load()
+
+    @property
+    def min_cached_tokens(self):
+        return self.inner.min_cached_tokens if self.inner is not None else 0
+
+    def _load(self):
+        with open(self.path, "rb") as cassette_file:
+            if cassette_file.read(len(self.MAGIC)) != self.MAGIC:
+                raise ValueError(f"{self.path} is not a cassette file")
+            size = os.fstat(cassette_file.fileno()).st_size
+            if size == len(self.MAGIC):
+                return
+            self._map = mmap.mmap(cassette_file.fileno(), 0, access=mmap.ACCESS_READ)
+        offset = len(self.MAGIC)
+        while offset + self._HEADER.size <= size:
+            length, digest, loose_digest = self._HEADER.unpack_from(self._map, offset)
+            start = offset + self._HEADER.size
+            if start + length > size:
+                self.logger.warning(f"Ignoring a truncated record at the end of {self.path}")
+                break
+            self._index.setdefault(digest, []).append((start, length))
+            self._loose_index.setdefault(loose_digest, []).append((start, length))
+            offset = start + length
+
+    @staticmethod
+    def key(model_name, generation_config, parts):
+        """
+        Return the digest identifying a request.
+
+        Args:
+            model_name (str): The model.
+            generation_config (dict): Temperature, max_output_tokens, etc.
+            parts (list): The chat text so far, ending with the new message.
+
+        Returns:
+            bytes: A 16-byte digest.
+        """
+        text = _normalize(" ".join(str(part) for part in parts))
+        config = json.dumps(sorted(generation_config.items()), default=str)
+        return hashlib.blake2b(f"{model_name}\x00{config}\x00{text}".encode("utf-8"), digest_size=16).digest()
+
+    def record(self, digests, text, usage, latency, chunks=None):
+        """
+        Append one reply to the cassette.
+
+        Args:
+            digests (tuple): The exact and loose request digests.
+            text (str): The reply.
+            usage: The response's usage metadata, if any.
+            latency (float): Seconds until the reply was complete.
+            chunks (list, optional): (seconds, text) for each streamed chunk.
+        """
+        payload = {
+            "text": text,
+            "usage": [
+                getattr(usage, "prompt_token_count", 0) or 0,
+                getattr(usage, "candidates_token_count", 0) or 0,
+                getattr(usage, "total_token_count", 0) or 0,
+                getattr(usage, "cached_content_token_count", 0) or 0,
+            ],
+            "latency": round(latency, 6),
+        }
+        if chunks:
+            payload["chunks"] = [[round(offset, 6), part] for offset, part in chunks]
+        data = zlib.compress(json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+        with self._lock:
+            self._file.write(self._HEADER.pack(len(data), *digests) + data)
+            self._file.flush()
+            self.recorded += 1
+
+    def _entry(self, digests):
+        digest, loose_digest = digests
+        with self._lock:
+            offsets = self._index.get(digest)
+            cursor = ("exact", digest)
+            if offsets:
+                self.hits += 1
+            else:
+                offsets = self._loose_index.get(loose_digest)
+                cursor = ("loose", loose_digest)
+                if not offsets:
+                    self.misses += 1
+                    return None
+                self.loose_hits += 1
+            served = self._cursors.get(cursor, 0)
+            self._cursors[cursor] = served + 1
+            # Repeated requests get the recorded replies in order, then the last again
+            start, length = offsets[min(served, len(offsets) - 1)]
+            entry = self._decoded.get(start)
+            if entry is None:
+                entry = json.loads(zlib.decompress(self._map[start:start + length]))
+                self._decoded[start] = entry
+        return entry
+
+    def replay(self, digests, stream=False):
+        """
+        Return the recorded reply for a request.
+
+        Args:
+            digests (tuple): The exact and loose request digests.
+            stream (bool): Return a streaming response.
+
+        Returns:
+            tuple: (payload dict, response object).
+
+        Raises:
+            CassetteMissError: The request was not recorded.
+        """
+        entry = self._entry(digests)
+        if entry is None:
+            raise CassetteMissError(f"Request {digests[0].hex()} is not on cassette {self.path}")
+        usage = StubUsage(*entry["usage"])
+        if stream:
+            return entry, _ReplayStream(entry, usage, self.delay_scale)
+        if self.delay_scale > 0:
+            time.sleep(entry.get("latency", 0.0) * self.delay_scale)
+        return entry, StubResponse(text=entry["text"], usage_metadata=usage)
+
+    def start_chat(self, model_name, generation_config, history=None, cached_context=None):
+        inner_chat = None
+        if self.inner is not None:
+            inner_context = cached_context.inner if cached_context is not None else None
+            inner_chat = self.inner.start_chat(model_name, generation_config, history, inner_context)
+        return CassetteChat(self, model_name, generation_config, history, cached_context, inner_chat)
+
+    def create_cached_context(self, model_name, prefix, ttl):
+        if self.inner is None:
+            return CassetteContext(prefix)
+        handle = self.inner.create_cached_context(model_name, prefix, ttl)
+        return CassetteContext(prefix, handle) if handle is not None else None
+
+    @property
+    def exact_token_counts(self):
+        # A replay has nobody to ask, so it estimates
+        return self.inner.exact_token_counts if self.inner is not None else False
+
+    def count_tokens(self, text, model_name):
+        if self.inner is not None:
+            return self.inner.count_tokens(text, model_name)
+        return estimate_tokens(text)
+
+    def stats(self):
+        """
+        Return usage statistics.
+
+        Returns:
+            dict: Mode, recorded replies, and replay hits (exact and on the
+            loose key) and misses.
+        """
+        return {
+            "mode": self.mode,
+            "requests": sum(len(offsets) for offsets in self._index.values()),
+            "recorded": self.recorded,
+            "hits": self.hits,
+            "loose_hits": self.loose_hits,
+            "misses": self.misses,
+        }
+
+    def close(self):
+        """
+        Close the cassette file.
+        """
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            if self._map is not None:
+                self._map.close()
+                self._map = None
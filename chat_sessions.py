@@ -0,0 +1,127 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class ChatSession:
+    """
+    A live backend chat kept for one conversation.
+
+    Tracks how much of the conversation history the model has already
+    seen, so only new turns are passed to the next call. The backend may
+    still resend the whole chat (Gemini's ChatSession does), which is why
+    sessions are off unless chat_sessions_enabled is set.
+    """
+
+    def __init__(self, key):
+        self.key = key
+        self.chat = None
+        self.seen = 0  # History turns already sent to the model
+        self.turns = 0  # Requests sent on this chat
+        self.last_reply = None
+        self.last_used = time.monotonic()
+        self.busy = False
+
+    def reset(self):
+        """
+        Forget the backend chat so the next call starts a fresh one.
+        """
+        self.chat = None
+        self.seen = 0
+        self.turns = 0
+        self.last_reply = None
+
+
+class ChatSessionPool:
+    """
+    Bounded pool of ChatSessions keyed by conversation id.
+
+    Sessions idle for longer than ``ttl`` seconds expire, and the least
+    recently used session is dropped once ``max_sessions`` is reached.
+    A session is checked out by one caller at a time.
+    """
+
+    def __init__(self, max_sessions=256, ttl=1800.0):
+        """
+        Initialize an empty pool.
+
+        Args:
+            max_sessions (int): Maximum number of live sessions.
+            ttl (float): Seconds of inactivity before a session expires.
+        """
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def checkout(self, key):
+        """
+        Get the session for a conversation, creating it if needed.
+
+        Args:
+            key: The conversation id.
+
+        Returns:
+            ChatSession or None: The session, or None if another caller is
+            currently using it.
+        """
+        now = time.monotonic()
+        with self._lock:
+            session = self._sessions.get(key)
+            if session is not None and not session.busy and now - session.last_used > self.ttl:
+                session.reset()
+            if session is None:
+                session = ChatSession(key)
+                self._sessions[key] = session
+                self._evict(key)
+            if session.busy:
+                return None
+            session.busy = True
+            session.last_used = now
+            self._sessions.move_to_end(key)
+            return session
+
+    def release(self, session):
+        """
+        Return a checked-out session to the pool.
+
+        Args:
+            session (ChatSession): The session from checkout.
+        """
+        with self._lock:
+            session.busy = False
+            session.last_used = time.monotonic()
+
+    def reset(self, key):
+        """
+        Drop the backend chat for a conversation.
+
+        Args:
+            key: The conversation id.
+        """
+        with self._lock:
+            session = self._sessions.get(key)
+            if session is not None:
+                session.reset()
+
+    def discard(self, key):
+        """
+        Remove a conversation's session from the pool entirely.
+
+        Args:
+            key: The conversation id.
+        """
+        with self._lock:
+            self._sessions.pop(key, None)
+
+    def _evict(self, keep):
+        # Busy sessions and the one being created stay; the pool may run
+        # over its size until one of them is released
+        for key in list(self._sessions):
+            if len(self._sessions) <= self.max_sessions:
+                break
+            if key != keep and not self._sessions[key].busy:
+                del self._sessions[key]
+
+    def __len__(self):
+        return len(self._sessions)
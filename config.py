@@ -1,4 +1,5 @@
 from dataclasses import dataclass
+from typing import Optional
 
 @dataclass
 class GeminiConfig:
@@ -7,7 +8,125 @@ class GeminiConfig:
     model_name: str = "gemini-2.0-flash"
     temperature: float = 0.8
     max_tokens: int = 8000
-    message_delay: int = 5  # Delay in seconds between messages
+
+    # Conversation history sent with each prompt
+    history_token_budget: int = 2000  # Tokens kept verbatim
+    history_keep_last: int = 8  # Turns kept verbatim
+    history_summary_token_budget: int = 500  # Tokens for the rolling summary of older turns
+    history_summarize_every: int = 4  # Folded turns per summary update; 0 = keep truncated excerpts only
+
+    # Durable conversation log (append-only segment files)
+    conversation_store_path: Optional[str] = None  # Directory; None keeps history in memory only
+    conversation_store_segment_bytes: int = 4 * 1024 * 1024  # Start a new segment after this size
+    conversation_store_fsync: bool = False  # fsync every turn; slower, survives power loss
+    client_session_id: Optional[str] = None  # Conversation the client joins; None reuses the id saved in the store
+
+    # Persistent backend chat sessions. Off by default: Gemini's ChatSession
+    # resends the whole accumulated chat on every call, so a session bills
+    # more prompt tokens than one-shot requests trimmed to history_token_budget
+    chat_sessions_enabled: bool = False
+    chat_session_max: int = 256  # Live sessions per agent
+    chat_session_ttl: float = 1800.0  # Seconds of inactivity before a session expires
+    chat_session_max_turns: int = 40  # Requests before a session starts over
+
+    # Shared rate limit budget for every agent and decryptor in the process
+    requests_per_minute: int = 15
+    tokens_per_minute: int = 1000000
+    rate_limit_backoff: float = 5.0  # Pause in seconds after the first 429
+    rate_limit_max_backoff: float = 300.0  # Upper bound for the shared pause
+
+    # Retries, circuit breaker and hedged requests for every LLM call (resilience.py)
+    retry_max_attempts: int = 10  # Attempts per call, including the first
+    retry_deadline: float = 120.0  # Seconds a call may keep retrying before it gives up
+    retry_base_delay: float = 0.5  # Backoff after a transient error; doubles each time
+    retry_max_delay: float = 10.0  # Upper bound for the transient backoff
+    retry_max_abandoned: int = 8  # Timed-out requests still running before new calls wait; 0 = no limit
+    circuit_failure_threshold: int = 5  # Consecutive transient failures that open the circuit
+    circuit_reset_timeout: float = 30.0  # Seconds calls fail fast before a probe is let through
+    hedge_enabled: bool = False  # Duplicate slow one-shot requests; the first reply wins
+    hedge_percentile: float = 95.0  # Latency percentile after which the duplicate is sent
+    hedge_min_samples: int = 20  # Requests observed before hedging starts
+
+    # LLM backend: "gemini" for the real API, "stub" for offline runs, "cassette" to record/replay
+    backend: str = "gemini"
+    stub_latency: float = 0.0  # Seconds per stub request
+    stub_jitter: float = 0.0  # Extra random seconds per stub request
+    stub_output_tokens: int = 24  # Approximate stub reply length
+    stub_rate_limit_every: int = 0  # Inject a 429 every N stub requests (0 = never)
+    stub_error_rate: float = 0.0  # Probability of an injected 429 per stub request
+    stub_chunk_delay: float = 0.0  # Seconds between chunks of a streamed stub reply
+    cassette_path: str = "llm_cassette.bin"  # Recorded LLM calls for backend = "cassette"
+    cassette_mode: str = "replay"  # "record" (call cassette_backend, save replies) or "replay"
+    cassette_backend: str = "gemini"  # Backend recorded from in record mode
+    cassette_simulate_latency: bool = False  # Replay with the recorded response times
+    cassette_latency_scale: float = 1.0  # Multiplier for simulated replay latency
+
+    # Decryption cache (in-memory LRU in front of a SQLite file)
+    decryption_cache_enabled: bool = True
+    decryption_cache_path: Optional[str] = "lolang_cache.sqlite3"  # None = memory only
+    decryption_cache_memory_entries: int = 1024
+    decryption_cache_disk_entries: int = 100000
+    decryption_cache_ttl: Optional[float] = 7 * 24 * 3600  # Seconds; None = never expire
+
+    # Local phrase codec: decodes recurring messages without an LLM call
+    phrase_codec_enabled: bool = True
+    phrase_codec_path: Optional[str] = None  # JSON file to persist the learned tables
+    phrase_codec_min_support: int = 2  # Agreeing observations before a template is trusted
+    phrase_codec_max_entries: int = 50000  # Templates kept; oldest go first
+
+    # Static prompt prefixes registered once as a provider-side cached context.
+    # Off by default: the built-in prefixes are below Gemini's minimum cached size
+    prompt_cache_enabled: bool = False
+    prompt_cache_ttl: float = 3600.0  # Seconds a cached context lives on the provider
+
+    # Single-flight: identical concurrent requests share one in-flight call
+    decryption_single_flight: bool = True
+    generation_single_flight: bool = False  # Identical one-shot prompts share one reply
+
+    # Micro-batching of concurrent decrypt() calls into one request
+    decryption_batch_window: float = 0.05  # Seconds to collect a batch; 0 disables
+    decryption_batch_max: int = 8  # Maximum messages per batched request
+
+    # Stream replies as "delta" frames followed by a final "message" frame
+    stream_responses: bool = False
+
+    # AgentServer conversation handling
+    server_workers: int = 1  # >1 runs one AgentServer process per worker behind SO_REUSEPORT
+    cluster_queue_size: int = 1024  # Messages waiting to be sent between a worker and the hub; more are dropped
+    server_max_concurrent_generations: int = 8  # LLM calls in flight across all sessions
+    server_session_queue_size: int = 16  # Pending messages per session
+    subscriber_queue_size: int = 64  # Outbound frames buffered per connected peer
+    slow_consumer_policy: str = "drop_oldest"  # "drop_oldest" or "disconnect"
+
+    # Background decryption in AgentServer (off the response path)
+    server_decryption_enabled: bool = True
+    server_decryption_queue_size: int = 100  # Messages waiting to be decrypted; more are skipped. 0 = unbounded
+    server_decryption_workers: int = 2
+
+    # TranslatorClient pipeline
+    translator_concurrency: int = 4  # Decryptions in flight
+    translator_max_pending: int = 100  # Messages awaiting output; reading pauses beyond this
+    translator_max_lag: Optional[float] = None  # Skip decrypting messages older than this (seconds)
+
+    # Dialogue orchestrator (orchestrator.py)
+    orchestrator_max_concurrent: int = 64  # Dialogues running at once; the rest wait their turn
+    orchestrator_max_turns: int = 40  # Agent replies per dialogue
+    orchestrator_transcript_path: Optional[str] = None  # JSONL file every turn is streamed to
+
+    # Wire protocol
+    wire_format: str = "bin+deflate"  # Preferred frame encoding: "bin+deflate", "bin" or "json"
+    wire_deflate_min_size: int = 64  # Frames below this many bytes are never deflated
+    wire_max_frame_size: int = 2 ** 20  # Largest frame accepted, on the socket and once inflated
+    wire_transport_compression: bool = True  # permessage-deflate, compressed per connection
+
+    # Console output of the server and clients (output_sink.py)
+    output_mode: str = "auto"  # "terminal", "jsonl", "none"; "auto" = terminal on a TTY, else jsonl
+    output_path: Optional[str] = None  # File for jsonl output; None = stdout
+    output_buffer_lines: int = 10000  # Lines buffered for slow output; the oldest are dropped beyond this
+
+    # Metrics
+    metrics_port: Optional[int] = None  # Serve Prometheus text on /metrics when set
+    metrics_host: str = "127.0.0.1"
 
     @classmethod
     def get_default_config(cls) -> 'GeminiConfig':
@@ -0,0 +1,2 @@
+# Matches pytest's *_test.py pattern but is a command-line tool, not a test
+collect_ignore = ["load_test.py"]
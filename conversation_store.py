@@ -0,0 +1,315 @@
+import logging
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+import zlib
+from array import array
+
+
+class ConversationRecord:
+    """
+    One stored conversation turn.
+    """
+
+    __slots__ = ("session", "seq", "role", "content", "timestamp")
+
+    def __init__(self, session, seq, role, content, timestamp):
+        self.session = session
+        self.seq = seq
+        self.role = role
+        self.content = content
+        self.timestamp = timestamp
+
+    def as_message(self):
+        """
+        Return the record as a message dict, as accepted by AIAgent.chat.
+        """
+        return {"role": self.role, "content": self.content}
+
+    def __repr__(self):
+        return f"ConversationRecord({self.session!r}, {self.seq}, {self.role!r}, {self.content!r})"
+
+
+class _SessionIndex:
+    # Parallel arrays: one entry per record, a few bytes each
+    __slots__ = ("seqs", "segments", "offsets")
+
+    def __init__(self):
+        self.seqs = array("Q")
+        self.segments = array("I")
+        self.offsets = array("Q")
+
+
+class ConversationStore:
+    """
+    Append-only, segmented log of conversation turns.
+
+    Records are appended to numbered segment files in a directory; once a
+    segment reaches ``segment_bytes`` a new one is started. Reads go
+    through memory maps of the segments, so record contents stay on disk
+    and only a small index (session -> sequence number -> position) is
+    kept in memory. Opening an existing directory rebuilds the index and
+    drops a partially written record left by a crash.
+
+    Record layout (big endian): u32 payload length, u32 CRC-32 of the
+    payload, then the payload: u64 sequence number, f64 timestamp,
+    u16 session length, u8 role length, session, role and content bytes.
+    """
+
+    _FRAME = struct.Struct("!II")
+    _PAYLOAD = struct.Struct("!QdHB")
+    SEGMENT_PATTERN = "segment-{:06d}.log"
+
+    def __init__(self, path, segment_bytes=4 * 1024 * 1024, fsync=False):
+        """
+        Open or create a store.
+
+        Args:
+            path (str): Directory holding the segment files.
+            segment_bytes (int): Size after which a new segment is started.
+            fsync (bool): Flush every append to stable storage.
+        """
+        self.path = path
+        self.segment_bytes = segment_bytes
+        self.fsync = fsync
+        self.logger = logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        self._index = {}
+        self._maps = {}  # segment id -> (mmap, mapped size)
+        self._records = 0
+        os.makedirs(path, exist_ok=True)
+
+        segments = sorted(
+            int(name[len("segment-"):-len(".log")])
+            for name in os.listdir(path)
+            if name.startswith("segment-") and name.endswith(".log")
+        )
+        for segment in segments:
+            self._load_segment(segment)
+        self._segment = segments[-1] if segments else 1
+        self._file = open(self._segment_path(self._segment), "ab")
+
+    def _segment_path(self, segment):
+        return os.path.join(self.path, self.SEGMENT_PATTERN.format(segment))
+
+    def _load_segment(self, segment):
+        path = self._segment_path(segment)
+        size = os.path.getsize(path)
+        if size == 0:
+            return
+        with open(path, "rb") as segment_file, \
+                mmap.mmap(segment_file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            offset = 0
+            while offset < size:
+                record = self._parse(data, offset, size)
+                if record is None:
+                    break
+                session, seq, length = record
+                self._add_to_index(session, seq, segment, offset)
+                offset += length
+        if offset < size:
+            # A crash interrupted the last append; drop the partial record
+            self.logger.warning(f"Truncating {size - offset} bytes of a partial record in {path}")
+            with open(path, "r+b") as segment_file:
+                segment_file.truncate(offset)
+
+    def _parse(self, data, offset, size):
+        # Returns (session, seq, record length) or None if the record is incomplete
+        if offset + self._FRAME.size > size:
+            return None
+        length, checksum = self._FRAME.unpack_from(data, offset)
+        start = offset + self._FRAME.size
+        if start + length > size or zlib.crc32(data[start:start + length]) != checksum:
+            return None
+        seq, _, session_length, _ = self._PAYLOAD.unpack_from(data, start)
+        session_start = start + self._PAYLOAD.size
+        session = data[session_start:session_start + session_length].decode("utf-8")
+        return session, seq, self._FRAME.size + length
+
+    def _add_to_index(self, session, seq, segment, offset):
+        index = self._index.get(session)
+        if index is None:
+            index = self._index[sys.intern(session)] = _SessionIndex()
+        index.seqs.append(seq)
+        index.segments.append(segment)
+        index.offsets.append(offset)
+        self._records += 1
+
+    def append(self, session, role, content):
+        """
+        Append a turn to a session.
+
+        Args:
+            session (str): The session the turn belongs to.
+            role (str): The speaker of the turn.
+            content (str): The message content.
+
+        Returns:
+            int: The sequence number of the turn within its session.
+        """
+        session_bytes = session.encode("utf-8")
+        role_bytes = role.encode("utf-8")[:255]
+        with self._lock:
+            index = self._index.get(session)
+            seq = index.seqs[-1] + 1 if index is not None and index.seqs else 1
+            payload = b"".join((
+                self._PAYLOAD.pack(seq, time.time(), len(session_bytes), len(role_bytes)),
+                session_bytes,
+                role_bytes,
+                content.encode("utf-8"),
+            ))
+            if self._file.tell() >= self.segment_bytes:
+                self._roll()
+            offset = self._file.tell()
+            self._file.write(self._FRAME.pack(len(payload), zlib.crc32(payload)) + payload)
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+            self._add_to_index(session, seq, self._segment, offset)
+        return seq
+
+    def _roll(self):
+        self._file.close()
+        self._segment += 1
+        self._file = open(self._segment_path(self._segment), "ab")
+
+    def _map(self, segment, end):
+        mapped = self._maps.get(segment)
+        if mapped is None or mapped[1] < end:
+            # The active segment grows; map it again to see the new records
+            if mapped is not None:
+                mapped[0].close()
+            with open(self._segment_path(segment), "rb") as segment_file:
+                data = mmap.mmap(segment_file.fileno(), 0, access=mmap.ACCESS_READ)
+            mapped = self._maps[segment] = (data, len(data))
+        return mapped[0]
+
+    def _read(self, session, segment, offset):
+        frame_end = offset + self._FRAME.size
+        data = self._map(segment, frame_end)
+        length, _ = self._FRAME.unpack_from(data, offset)
+        data = self._map(segment, frame_end + length)
+        seq, timestamp, session_length, role_length = self._PAYLOAD.unpack_from(data, frame_end)
+        role_start = frame_end + self._PAYLOAD.size + session_length
+        content_start = role_start + role_length
+        return ConversationRecord(
+            session,
+            seq,
+            sys.intern(data[role_start:content_start].decode("utf-8")),
+            data[content_start:frame_end + length].decode("utf-8"),
+            timestamp,
+        )
+
+    def replay(self, session, after_seq=0):
+        """
+        Iterate over the turns of a session in order.
+
+        Args:
+            session (str): The session to replay.
+            after_seq (int): Only yield turns with a larger sequence number.
+
+        Yields:
+            ConversationRecord: The stored turns, oldest first.
+        """
+        index = self._index.get(session)
+        if index is None:
+            return
+        # Sequence numbers are dense and start at 1
+        position = max(0, after_seq)
+        while True:
+            with self._lock:
+                if position >= len(index.seqs):
+                    return
+                record = self._read(session, index.segments[position], index.offsets[position])
+            yield record
+            position += 1
+
+    def tail(self, session, count):
+        """
+        Return the most recent turns of a session.
+
+        Args:
+            session (str): The session to read.
+            count (int): Maximum number of turns.
+
+        Returns:
+            list: ConversationRecord objects, oldest first.
+        """
+        index = self._index.get(session)
+        if index is None or count <= 0:
+            return []
+        return list(self.replay(session, max(0, len(index.seqs) - count)))
+
+    def last_seq(self, session):
+        """
+        Return the sequence number of the last turn of a session, or 0.
+        """
+        index = self._index.get(session)
+        return index.seqs[-1] if index is not None and index.seqs else 0
+
+    def sessions(self):
+        """
+        Return the ids of every stored session.
+        """
+        return list(self._index)
+
+    def stats(self):
+        """
+        Return the size of the store.
+
+        Returns:
+            dict: Number of sessions, records and segment files.
+        """
+        return {
+            "sessions": len(self._index),
+            "records": self._records,
+            "segments": self._segment,
+        }
+
+    def close(self):
+        """
+        Close the active segment and every memory map.
+        """
+        with self._lock:
+            self._file.close()
+            for data, _ in self._maps.values():
+                data.close()
+            self._maps.clear()
+
+    def __len__(self):
+        return self._records
+
+
+_shared_stores = {}
+_shared_lock = threading.Lock()
+
+
+def get_shared_store(config):
+    """
+    Return the process-wide conversation store for a configuration.
+
+    A store directory must have a single writer, so every component in
+    the process that points at the same directory shares one instance.
+
+    Args:
+        config (GeminiConfig): The configuration holding the store settings.
+
+    Returns:
+        ConversationStore or None: The shared store, or None if disabled.
+    """
+    if not config.conversation_store_path:
+        return None
+    key = os.path.abspath(config.conversation_store_path)
+    with _shared_lock:
+        store = _shared_stores.get(key)
+        if store is None:
+            store = ConversationStore(
+                config.conversation_store_path,
+                segment_bytes=config.conversation_store_segment_bytes,
+                fsync=config.conversation_store_fsync,
+            )
+            _shared_stores[key] = store
+    return store
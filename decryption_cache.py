@@ -0,0 +1,274 @@
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+
+class DecryptionCache:
+    """
+    Two-tier cache for decrypted LOLANG messages.
+
+    A bounded in-memory LRU sits in front of an optional SQLite store that
+    survives restarts and can be shared by every process on the machine.
+    Entries expire after a TTL and the on-disk store is trimmed to a maximum
+    number of rows, least recently used first.
+
+    The two tiers have separate locks, so a memory lookup never waits for
+    a disk read or write in another thread.
+    """
+
+    # How many writes go by between disk eviction passes
+    EVICTION_INTERVAL = 256
+
+    def __init__(self, path=None, max_memory_entries=1024, max_disk_entries=100_000, ttl=None):
+        """
+        Initialize the cache.
+
+        Args:
+            path (str, optional): SQLite file for the persistent tier.
+                If None, only the in-memory tier is used.
+            max_memory_entries (int): Capacity of the in-memory LRU.
+            max_disk_entries (int): Maximum rows kept in the SQLite store.
+            ttl (float, optional): Seconds an entry stays valid. None keeps
+                entries until they are evicted by size.
+        """
+        self.path = path
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_entries = max_disk_entries
+        self.ttl = ttl
+        self.logger = logging.getLogger(__name__)
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()  # Memory tier and counters
+        self._db_lock = threading.Lock()  # SQLite connection
+        self._writes = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._db = None
+
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS decryptions ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                "created REAL NOT NULL, accessed REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS decryptions_accessed ON decryptions (accessed)")
+
+    @staticmethod
+    def normalize(message):
+        """
+        Normalize a LOLANG message so trivially different copies share a key.
+
+        Args:
+            message (str): The raw LOLANG message.
+
+        Returns:
+            str: The message in NFC form with whitespace collapsed.
+        """
+        return " ".join(unicodedata.normalize("NFC", message).split())
+
+    @classmethod
+    def make_key(cls, message, backend_name, model_name, prompt_version):
+        """
+        Build the cache key for a message.
+
+        Args:
+            message (str): The LOLANG message.
+            backend_name (str): The backend that performs the decryption, so
+                stub or replayed results never answer for the real model.
+            model_name (str): The model that performs the decryption.
+            prompt_version (str): Version of the decryption prompt.
+
+        Returns:
+            str: A hex digest identifying the request.
+        """
+        raw = "\x1f".join((backend_name, model_name, str(prompt_version), cls.normalize(message)))
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    @property
+    def persistent(self):
+        """
+        True if the cache has an on-disk tier, whose reads and writes block.
+        """
+        return self._db is not None
+
+    def _expired(self, created, now):
+        return self.ttl is not None and now - created > self.ttl
+
+    def get_memory(self, key):
+        """
+        Look up a decrypted message in the in-memory tier only.
+
+        Never touches the disk, so it is safe to call on an event loop. A
+        miss is not counted; follow it with get() for the disk tier.
+
+        Args:
+            key (str): A key produced by make_key.
+
+        Returns:
+            str or None: The cached decryption, or None if it is not in memory.
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is None:
+                return None
+            value, created = entry
+            if self._expired(created, now):
+                del self._memory[key]
+                return None
+            self._memory.move_to_end(key)
+            self.memory_hits += 1
+            return value
+
+    def get(self, key):
+        """
+        Look up a decrypted message.
+
+        Args:
+            key (str): A key produced by make_key.
+
+        Returns:
+            str or None: The cached decryption, or None on a miss.
+        """
+        value = self.get_memory(key)
+        if value is not None:
+            return value
+
+        row = None
+        now = time.time()
+        with self._db_lock:
+            try:
+                if self._db is not None:
+                    row = self._db.execute(
+                        "SELECT value, created FROM decryptions WHERE key = ?", (key,)
+                    ).fetchone()
+                if row is not None and not self._expired(row[1], now):
+                    self._db.execute("UPDATE decryptions SET accessed = ? WHERE key = ?", (now, key))
+                else:
+                    row = None
+            except sqlite3.Error as e:
+                self.logger.error(f"Decryption cache read failed: {e}")
+        if row is not None:
+            with self._lock:
+                self._remember(key, row[0], row[1])
+                self.disk_hits += 1
+            return row[0]
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, value):
+        """
+        Store a decrypted message in both tiers.
+
+        Args:
+            key (str): A key produced by make_key.
+            value (str): The decrypted message.
+        """
+        now = time.time()
+        with self._lock:
+            self._remember(key, value, now)
+        with self._db_lock:
+            if self._db is None:
+                return
+            try:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO decryptions (key, value, created, accessed) VALUES (?, ?, ?, ?)",
+                    (key, value, now, now),
+                )
+                self._writes += 1
+                if self._writes % self.EVICTION_INTERVAL == 0:
+                    self._evict_disk(now)
+            except sqlite3.Error as e:
+                self.logger.error(f"Decryption cache write failed: {e}")
+
+    def _remember(self, key, value, created):
+        self._memory[key] = (value, created)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    def _evict_disk(self, now):
+        if self.ttl is not None:
+            self._db.execute("DELETE FROM decryptions WHERE created < ?", (now - self.ttl,))
+        self._db.execute(
+            "DELETE FROM decryptions WHERE key IN ("
+            "SELECT key FROM decryptions ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+            (self.max_disk_entries,),
+        )
+
+    def stats(self):
+        """
+        Return the hit and miss counters.
+
+        Returns:
+            dict: memory_hits, disk_hits, hits, misses and the memory size.
+        """
+        with self._lock:
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "hits": self.memory_hits + self.disk_hits,
+                "misses": self.misses,
+                "memory_entries": len(self._memory),
+            }
+
+    def clear(self):
+        """
+        Drop every entry from both tiers.
+        """
+        with self._lock:
+            self._memory.clear()
+        with self._db_lock:
+            if self._db is not None:
+                self._db.execute("DELETE FROM decryptions")
+
+    def close(self):
+        """
+        Close the SQLite connection.
+        """
+        with self._db_lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+
+_shared_caches = {}
+_shared_lock = threading.Lock()
+
+
+def get_shared_cache(config):
+    """
+    Return the process-wide decryption cache for a configuration.
+
+    Every decryptor that points at the same cache file shares one instance,
+    so the server and in-process translators see each other's entries.
+
+    Args:
+        config (GeminiConfig): The configuration holding the cache settings.
+
+    Returns:
+        DecryptionCache or None: The shared cache, or None if caching is off.
+    """
+    if not config.decryption_cache_enabled:
+        return None
+    key = config.decryption_cache_path
+    with _shared_lock:
+        cache = _shared_caches.get(key)
+        if cache is None:
+            cache = DecryptionCache(
+                path=config.decryption_cache_path,
+                max_memory_entries=config.decryption_cache_memory_entries,
+                max_disk_entries=config.decryption_cache_disk_entries,
+                ttl=config.decryption_cache_ttl,
+            )
+            _shared_caches[key] = cache
+    return cache
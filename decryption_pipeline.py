@@ -0,0 +1,86 @@
+import asyncio
+import logging
+import time
+from metrics import DECRYPTION_QUEUE_SECONDS
+
+
+class DecryptionPipeline:
+    """
+    Background decryption of messages, kept off the response critical path.
+
+    Messages are queued without waiting and decrypted by a small pool of
+    worker tasks. When the queue is full, new messages are dropped instead
+    of slowing down the caller. The owner starts the workers with start()
+    and cancels them with stop(). The results warm the shared decryption
+    cache, so translators reading the same conversation get cache hits.
+    """
+
+    def __init__(self, decryptor, queue_size=100, workers=2, on_result=None):
+        """
+        Initialize the pipeline.
+
+        Args:
+            decryptor (LolangDecryptor): The decryptor used by the workers.
+            queue_size (int): Maximum number of messages waiting for a worker;
+                0 or less for no limit.
+            workers (int): Number of concurrent worker tasks.
+            on_result (callable, optional): Called with (message, decrypted)
+                for every finished decryption.
+        """
+        self.decryptor = decryptor
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.worker_count = workers
+        self.on_result = on_result
+        self.logger = logging.getLogger(__name__)
+        self.dropped = 0
+        self.processed = 0
+        self._workers = []
+
+    def start(self):
+        """
+        Start the worker tasks on the running event loop.
+        """
+        if not self._workers:
+            self._workers = [
+                asyncio.create_task(self._worker()) for _ in range(self.worker_count)
+            ]
+
+    def submit(self, lolang_message):
+        """
+        Queue a message for decryption without waiting.
+
+        Args:
+            lolang_message (str): The LOLANG message to decrypt.
+
+        Returns:
+            bool: True if the message was queued, False if it was dropped.
+        """
+        try:
+            self.queue.put_nowait((time.perf_counter(), lolang_message))
+            return True
+        except asyncio.QueueFull:
+            self.dropped += 1
+            return False
+
+    async def _worker(self):
+        while True:
+            enqueued_at, lolang_message = await self.queue.get()
+            DECRYPTION_QUEUE_SECONDS.observe(time.perf_counter() - enqueued_at)
+            try:
+                decrypted = await self.decryptor.decrypt(lolang_message)
+                self.processed += 1
+                if self.on_result is not None:
+                    self.on_result(lolang_message, decrypted)
+            except Exception as e:
+                self.logger.error(f"Background decryption failed: {e}")
+            finally:
+                self.queue.task_done()
+
+    async def stop(self):
+        """
+        Cancel the worker tasks and wait for them to exit.
+        """
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
@@ -1,12 +1,13 @@
 from ai_agent import AIAgent
 from terminal_colors import TerminalColors
 from config import GeminiConfig
-import os
+from orchestrator import DialogueOrchestrator, DialogueSpec, print_report, run_dialogues
+import logging
 from dotenv import load_dotenv
-import time
 
 # Load environment variables
 load_dotenv()
+logging.basicConfig(level=logging.WARNING)
 
 # Initialize configuration using the new approach
 config = GeminiConfig.get_default_config()
@@ -15,32 +16,23 @@ config = GeminiConfig.get_default_config()
 agent1 = AIAgent("Agent-1", TerminalColors.BLUE, config)
 agent2 = AIAgent("Agent-2", TerminalColors.GREEN, config)
 
-# Start a conversation
-initial_message = "Hello, are you an AI agent? Let's discuss artificial intelligence."
-response_history = [{"role": "user", "content": initial_message}]
+
+def show_turn(dialogue_id, agent, reply):
+    print(agent.speak(reply))
+
+
+# One dialogue of 40 replies (20 from each agent); add more DialogueSpecs to run them side by side
+orchestrator = DialogueOrchestrator(config, agents=(agent1, agent2), on_turn=show_turn)
+dialogues = [
+    DialogueSpec(
+        "dialogue",
+        "Hello, are you an AI agent? Let's discuss artificial intelligence.",
+        max_turns=40,
+    ),
+]
 
 try:
-    for _ in range(20):
-        # First agent response
-        response1 = agent1.chat(response_history)
-        # Strip extra whitespace and format the output
-        formatted_response1 = response1.strip().replace('\n', ' ').replace('  ', ' ')
-        print(agent1.speak(formatted_response1))
-        response_history.append({
-            "role": "agent-1",
-            "content": formatted_response1
-        })
-
-        # Second agent response
-        response2 = agent2.chat(response_history)
-        # Strip extra whitespace and format the output
-        formatted_response2 = response2.strip().replace('\n', ' ').replace('  ', ' ')
-        print(agent2.speak(formatted_response2))
-        response_history.append({
-            "role": "agent-2",
-            "content": formatted_response2
-        })
-
-        time.sleep(10)
-except:
-    pass
\ No newline at end of file
+    report = run_dialogues(orchestrator, dialogues)
+    print_report(report)
+except KeyboardInterrupt:
+    pass
@@ -0,0 +1,312 @@
+import asyncio
+import logging
+import threading
+from collections import deque
+from llm_backend import estimate_tokens
+
+
+class ConversationHistory:
+    """
+    Token-budgeted conversation history with a rolling summary.
+
+    The most recent turns are kept verbatim. Once there are more than
+    ``keep_last`` turns, or the verbatim turns exceed ``token_budget``
+    tokens, the oldest turns are folded out of the verbatim window. Every
+    ``summarize_every`` folded turns, a background thread asks
+    ``summarizer`` to merge them into the running summary, which is capped
+    at ``summary_token_budget`` tokens; the request path never waits for
+    it. Until a fold is summarized (or if no summarizer is given) the
+    folded turn is kept as a short excerpt, and the oldest excerpts are
+    dropped once they exceed the same budget. Token counts are computed
+    once per message and kept as running totals, so appending a turn costs
+    O(1) amortized instead of re-joining the whole transcript.
+
+    Iterating yields ``{"role": ..., "content": ...}`` dicts (the summary
+    first, if any), so a history can be passed anywhere a list of messages
+    is accepted, including AIAgent.chat.
+
+    With a ConversationStore attached, every appended turn is also written
+    to the store, and a history created for a stored session starts from
+    a replay of its turns. Code running on an event loop uses aappend(),
+    which does the store write in a worker thread.
+    """
+
+    SUMMARY_ROLE = "summary"
+
+    def __init__(self, token_budget=2000, keep_last=8, summary_token_budget=500,
+                 excerpt_chars_per_turn=120, summarizer=None, summarize_every=4,
+                 store=None, session_id=None):
+        """
+        Initialize an empty history.
+
+        Args:
+            token_budget (int): Maximum tokens for the verbatim turns.
+            keep_last (int): Maximum number of verbatim turns.
+            summary_token_budget (int): Maximum tokens for the summary, and
+                for the excerpts of folded turns not summarized yet.
+            excerpt_chars_per_turn (int): Characters kept of a folded turn
+                until it is summarized.
+            summarizer (callable, optional): Blocking
+                ``summarizer(summary, turns, token_budget)`` returning the
+                new summary, given the current one (or "") and the folded
+                ``(role, content)`` turns; see AIAgent.summarize. Without
+                one, folded turns are only kept as excerpts.
+            summarize_every (int): Folded turns collected before the
+                summary is updated.
+            store (ConversationStore, optional): Durable log the turns are
+                written to and replayed from.
+            session_id (str, optional): The session in the store; required
+                when a store is given.
+        """
+        self.token_budget = token_budget
+        self.keep_last = max(1, keep_last)
+        self.summary_token_budget = summary_token_budget
+        self.excerpt_chars_per_turn = excerpt_chars_per_turn
+        self.summarizer = summarizer
+        self.summarize_every = max(1, summarize_every)
+        self.logger = logging.getLogger(__name__)
+        self._turns = deque()  # (role, content, tokens)
+        self._turn_tokens = 0
+        # Summary state, shared with the summarizer thread
+        self._lock = threading.Lock()
+        self._summary = ""
+        self._summary_tokens = 0
+        self._folded = deque()  # (number, role, content, excerpt, excerpt tokens)
+        self._folded_tokens = 0
+        self._fold_count = 0
+        self._summarizing = False
+        self._cleared = 0  # Bumped by clear() so a running update is discarded
+        self._idle = threading.Event()
+        self._idle.set()
+        self.summaries = 0
+        self.total_turns = 0
+        self.store = None
+        self.session_id = session_id
+        self._write_lock = None  # Orders aappend() store writes
+        if store is not None:
+            if session_id is None:
+                raise ValueError("A session id is required to use a conversation store")
+            for record in store.replay(session_id):
+                self._add(record.role, record.content)
+            self.store = store
+
+    @classmethod
+    def from_config(cls, config, store=None, session_id=None, summarizer=None):
+        """
+        Build a history using the budgets from a configuration.
+
+        Args:
+            config (GeminiConfig): The configuration holding the budgets.
+            store (ConversationStore, optional): Durable log to write to and
+                replay from.
+            session_id (str, optional): The session in the store.
+            summarizer (callable, optional): Builds the rolling summary,
+                normally an agent's summarize method. Ignored when
+                ``history_summarize_every`` is 0.
+
+        Returns:
+            ConversationHistory: The history, with any stored turns replayed.
+        """
+        return cls(
+            token_budget=config.history_token_budget,
+            keep_last=config.history_keep_last,
+            summary_token_budget=config.history_summary_token_budget,
+            summarizer=summarizer if config.history_summarize_every > 0 else None,
+            summarize_every=config.history_summarize_every,
+            store=store,
+            session_id=session_id,
+        )
+
+    def _excerpt(self, role, content):
+        if len(content) > self.excerpt_chars_per_turn:
+            content = content[:self.excerpt_chars_per_turn].rstrip() + "…"
+        return f"{role}: {content}"
+
+    def append(self, role, content):
+        """
+        Add a turn and fold older turns out of the verbatim window if over budget.
+
+        Args:
+            role (str): The speaker of the turn.
+            content (str): The message content.
+        """
+        if self.store is not None:
+            self.store.append(self.session_id, role, content)
+        self._add(role, content)
+
+    async def aappend(self, role, content):
+        """
+        Like append(), but writes to the conversation store in a worker
+        thread so a slow disk (or fsync) does not block the event loop.
+        The turn is visible in the history immediately; store writes keep
+        the order of the aappend() calls.
+
+        Args:
+            role (str): The speaker of the turn.
+            content (str): The message content.
+        """
+        self._add(role, content)
+        if self.store is None:
+            return
+        if self._write_lock is None:
+            self._write_lock = asyncio.Lock()
+        async with self._write_lock:
+            await asyncio.to_thread(self.store.append, self.session_id, role, content)
+
+    def _add(self, role, content):
+        tokens = estimate_tokens(content) + estimate_tokens(role) + 1
+        self._turns.append((role, content, tokens))
+        self._turn_tokens += tokens
+        self.total_turns += 1
+
+        folded = False
+        while len(self._turns) > 1 and (
+            len(self._turns) > self.keep_last or self._turn_tokens > self.token_budget
+        ):
+            self._fold_oldest()
+            folded = True
+        if folded:
+            self._maybe_summarize()
+
+    def _fold_oldest(self):
+        role, content, tokens = self._turns.popleft()
+        self._turn_tokens -= tokens
+
+        excerpt = self._excerpt(role, content)
+        excerpt_tokens = estimate_tokens(excerpt)
+        with self._lock:
+            self._fold_count += 1
+            self._folded.append((self._fold_count, role, content, excerpt, excerpt_tokens))
+            self._folded_tokens += excerpt_tokens
+            # Only if summaries fall behind (or there is no summarizer)
+            while len(self._folded) > 1 and self._folded_tokens > self.summary_token_budget:
+                self._folded_tokens -= self._folded.popleft()[4]
+
+    def _maybe_summarize(self):
+        if self.summarizer is None:
+            return
+        with self._lock:
+            if self._summarizing:
+                return
+            batch = self._next_batch()
+        if batch is not None:
+            threading.Thread(target=self._summarize, args=batch, daemon=True).start()
+
+    def _next_batch(self):
+        # Called with _lock held; claims the summarizer if enough turns are folded
+        if len(self._folded) < self.summarize_every:
+            self._summarizing = False
+            self._idle.set()
+            return None
+        self._summarizing = True
+        self._idle.clear()
+        return self._summary, list(self._folded), self._cleared
+
+    def _summarize(self, summary, batch, cleared):
+        while True:
+            try:
+                updated = self.summarizer(summary, [(role, content) for _, role, content, _, _ in batch],
+                                          self.summary_token_budget).strip()
+            except Exception as e:
+                # Keep the excerpts; the next fold tries again
+                self.logger.warning(f"Could not update the conversation summary: {e}")
+                updated = None
+            with self._lock:
+                if not updated or cleared != self._cleared:
+                    self._summarizing = False
+                    self._idle.set()
+                    return
+                self._summary = updated
+                self._summary_tokens = estimate_tokens(updated)
+                self.summaries += 1
+                last = batch[-1][0]
+                while self._folded and self._folded[0][0] <= last:
+                    self._folded_tokens -= self._folded.popleft()[4]
+                # Turns folded in the meantime may already fill the next batch
+                following = self._next_batch()
+            if following is None:
+                return
+            summary, batch, cleared = following
+
+    def wait_for_summary(self, timeout=None):
+        """
+        Wait until no summary update is running.
+
+        Args:
+            timeout (float, optional): Seconds to wait at most.
+
+        Returns:
+            bool: False if the wait timed out.
+        """
+        return self._idle.wait(timeout)
+
+    @property
+    def summary(self):
+        """
+        The summary of folded turns followed by the excerpts of those not
+        summarized yet, or an empty string.
+        """
+        with self._lock:
+            parts = [self._summary] if self._summary else []
+            parts.extend(excerpt for _, _, _, excerpt, _ in self._folded)
+        return " | ".join(parts)
+
+    @property
+    def token_count(self):
+        """
+        Estimated tokens of the summary, the excerpts and the verbatim turns.
+        """
+        return self._summary_tokens + self._folded_tokens + self._turn_tokens
+
+    def recent(self, count):
+        """
+        Return the most recent verbatim turns.
+
+        Args:
+            count (int): How many turns to return. Fewer are returned if
+                older ones have been folded into the summary.
+
+        Returns:
+            list: Message dicts, oldest first.
+        """
+        if count <= 0:
+            return []
+        turns = list(self._turns)[-count:]
+        return [{"role": role, "content": content} for role, content, _ in turns]
+
+    def messages(self):
+        """
+        Return the history as a list of message dicts.
+
+        Returns:
+            list: The summary (if any) followed by the verbatim turns.
+        """
+        return list(self)
+
+    def clear(self):
+        """
+        Drop every turn and the summary. Turns already written to a
+        conversation store are kept there. A summary update still running
+        is discarded when it finishes.
+        """
+        self._turns.clear()
+        self._turn_tokens = 0
+        with self._lock:
+            self._summary = ""
+            self._summary_tokens = 0
+            self._folded.clear()
+            self._folded_tokens = 0
+            self._cleared += 1
+        self.total_turns = 0
+
+    def __iter__(self):
+        summary = self.summary
+        if summary:
+            yield {"role": self.SUMMARY_ROLE, "content": f"Earlier conversation: {summary}"}
+        for role, content, _ in self._turns:
+            yield {"role": role, "content": content}
+
+    def __len__(self):
+        with self._lock:
+            folded = bool(self._summary or self._folded)
+        return len(self._turns) + (1 if folded else 0)
@@ -0,0 +1,41 @@
+import math
+
+
+def percentile(values, q):
+    """
+    Nearest-rank percentile of a list of numbers.
+
+    Args:
+        values (list): The samples.
+        q (float): The percentile, between 0 and 100.
+
+    Returns:
+        float: The percentile value, or 0.0 for an empty list.
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(q / 100.0 * len(ordered)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def summarize(values):
+    """
+    Summarize latency samples.
+
+    Args:
+        values (list): Samples in seconds.
+
+    Returns:
+        dict: count, mean, p50, p95, p99 and max, in seconds.
+    """
+    if not values:
+        return {"count": 0, "mean": 0.0, "p50": 0.0, "p95": 0.0, "p99": 0.0, "max": 0.0}
+    return {
+        "count": len(values),
+        "mean": sum(values) / len(values),
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "max": max(values),
+    }
@@ -0,0 +1,487 @@
+import datetime
+import hashlib
+import logging
+import os
+import random
+import re
+import threading
+import time
+from dataclasses import dataclass, replace
+
+logger = logging.getLogger(__name__)
+
+
+def estimate_tokens(text):
+    """
+    Cheap token estimate (~4 characters per token) used where the backend
+    does not report real counts.
+
+    Args:
+        text (str): The text to measure.
+
+    Returns:
+        int: The estimated number of tokens.
+    """
+    if not text:
+        return 0
+    return max(1, (len(text) + 3) // 4)
+
+
+def usage_tokens(response):
+    """
+    Total tokens a response was billed for, if the backend reported it.
+
+    Args:
+        response: A response returned by ``chat.send_message``.
+
+    Returns:
+        int or None: The total token count, or None if unavailable.
+    """
+    usage = getattr(response, "usage_metadata", None)
+    total = getattr(usage, "total_token_count", None)
+    return total or None
+
+
+class LLMBackend:
+    """
+    Interface between the agents and a concrete model provider.
+
+    A backend hands out chat objects that follow the google.generativeai
+    shape: ``chat.send_message(content)`` returns a response with ``.text``
+    and ``.usage_metadata``; ``chat.send_message(content, stream=True)``
+    returns a response that yields partial chunks (each with ``.text``)
+    when iterated.
+    """
+
+    name = "base"
+    # Shortest prefix worth a cached context; providers reject smaller ones
+    min_cached_tokens = 0
+    # False if count_tokens only estimates what the provider would bill
+    exact_token_counts = False
+
+    def start_chat(self, model_name, generation_config, history=None, cached_context=None):
+        """
+        Start a chat session.
+
+        Args:
+            model_name (str): The model to talk to.
+            generation_config (dict): Temperature, max_output_tokens, etc.
+            history (list, optional): Prior turns to seed the chat with.
+            cached_context (optional): A handle from create_cached_context;
+                the chat starts with that prefix already in context.
+
+        Returns:
+            A chat object exposing ``send_message(content)``.
+        """
+        raise NotImplementedError
+
+    def create_cached_context(self, model_name, prefix, ttl):
+        """
+        Store a static prompt prefix on the provider for reuse.
+
+        Args:
+            model_name (str): The model the prefix is used with.
+            prefix (str): The static system prompt.
+            ttl (float): Seconds the context should live.
+
+        Returns:
+            A handle for start_chat, or None if the backend has no
+            context caching.
+        """
+        return None
+
+    def count_tokens(self, text, model_name):
+        """
+        Count the tokens in a piece of text.
+
+        The default is the ~4 characters per token estimate; backends that
+        can ask the provider set ``exact_token_counts``.
+
+        Args:
+            text (str): The text to measure.
+            model_name (str): The model whose tokenizer to use.
+
+        Returns:
+            int: The number of tokens.
+        """
+        return estimate_tokens(text)
+
+
+class GeminiBackend(LLMBackend):
+    """
+    Backend for the Google Gemini API via google.generativeai.
+    """
+
+    name = "gemini"
+    min_cached_tokens = 1024
+    exact_token_counts = True
+
+    def __init__(self, api_key):
+        import google.generativeai as genai
+
+        self._genai = genai
+        self._models = {}
+        self._cached_models = {}
+        self._lock = threading.Lock()
+        genai.configure(api_key=api_key)
+
+    def _get_model(self, model_name, generation_config):
+        key = (model_name, tuple(sorted(generation_config.items())))
+        with self._lock:
+            model = self._models.get(key)
+            if model is None:
+                model = self._genai.GenerativeModel(
+                    model_name=model_name,
+                    generation_config=dict(generation_config),
+                )
+                self._models[key] = model
+        return model
+
+    def _get_cached_model(self, cached_context, generation_config):
+        key = (cached_context.name, tuple(sorted(generation_config.items())))
+        with self._lock:
+            model = self._cached_models.get(key)
+            if model is None:
+                model = self._genai.GenerativeModel.from_cached_content(
+                    cached_content=cached_context,
+                    generation_config=dict(generation_config),
+                )
+                self._cached_models[key] = model
+        return model
+
+    def start_chat(self, model_name, generation_config, history=None, cached_context=None):
+        if cached_context is not None:
+            model = self._get_cached_model(cached_context, generation_config)
+        else:
+            model = self._get_model(model_name, generation_config)
+        return model.start_chat(history=history or [])
+
+    def count_tokens(self, text, model_name):
+        # Asks the API, which uses the model's own tokenizer
+        return self._get_model(model_name, {}).count_tokens(text).total_tokens
+
+    def create_cached_context(self, model_name, prefix, ttl):
+        if not model_name.startswith("models/"):
+            model_name = f"models/{model_name}"
+        return self._genai.caching.CachedContent.create(
+            model=model_name,
+            system_instruction=prefix,
+            ttl=datetime.timedelta(seconds=ttl),
+        )
+
+
+@dataclass
+class StubUsage:
+    prompt_token_count: int
+    candidates_token_count: int
+    total_token_count: int
+    cached_content_token_count: int = 0
+
+
+@dataclass
+class StubCachedContext:
+    """
+    Stand-in for a provider-side cached context, created by StubBackend.
+    """
+
+    name: str
+    prefix: str
+    tokens: int
+    expires: float
+
+
+@dataclass
+class StubResponse:
+    text: str
+    usage_metadata: StubUsage
+
+
+class StubRateLimitError(Exception):
+    """
+    Raised by StubBackend to simulate an HTTP 429 from the real API.
+    """
+
+    code = 429
+
+    def __init__(self, message="429 Resource has been exhausted (stub backend)"):
+        super().__init__(message)
+
+
+@dataclass
+class StubChunk:
+    text: str
+
+
+class StubStreamResponse:
+    """
+    Streaming response returned by StubChat. Iterating yields the reply in
+    word chunks, sleeping ``chunk_delay`` seconds between them.
+    """
+
+    def __init__(self, response, chunk_words=3, chunk_delay=0.0):
+        self._response = response
+        self.chunk_words = max(1, chunk_words)
+        self.chunk_delay = chunk_delay
+        self.text = response.text
+        self.usage_metadata = response.usage_metadata
+
+    def __iter__(self):
+        words = self.text.split(" ")
+        for start in range(0, len(words), self.chunk_words):
+            if start and self.chunk_delay > 0:
+                time.sleep(self.chunk_delay)
+            chunk = " ".join(words[start:start + self.chunk_words])
+            yield StubChunk(chunk if start == 0 else " " + chunk)
+
+
+class StubChat:
+    """
+    Chat session returned by StubBackend. Keeps its own transcript so the
+    reported prompt token count grows the way a real chat session would.
+    """
+
+    def __init__(self, backend, model_name, generation_config, history=None, cached_context=None):
+        self._backend = backend
+        self.model_name = model_name
+        self.generation_config = dict(generation_config)
+        self.history = list(history or [])
+        self.cached_context = cached_context
+
+    def send_message(self, content, stream=False):
+        response = self._backend._respond(self, content)
+        self.history.append({"role": "user", "parts": [content]})
+        self.history.append({"role": "model", "parts": [response.text]})
+        if stream:
+            return StubStreamResponse(response, chunk_delay=self._backend.chunk_delay)
+        return response
+
+
+class StubBackend(LLMBackend):
+    """
+    Offline, deterministic backend for benchmarks and load tests.
+
+    Replies are derived from a hash of the request, so the same input always
+    produces the same output. Encode requests get an abbreviated LOLANG-like
+    string that the stub later decrypts back to the original, so round-trip
+    benchmarks have a meaningful baseline. Latency, reply length and injected 429s are
+    configurable; the 429 injection is driven by a seeded RNG and a call
+    counter, so a run is reproducible.
+    """
+
+    name = "stub"
+    # The stub bills with the same estimate, so counts match its usage metadata
+    exact_token_counts = True
+
+    GLYPHS = ["⟦LO-2⟧", "SHECD:", "X-REQ", "[CONF]", "⟩", "|", "𝟏𝟏𝑷𝑴", "AI-SYN", "Δ", "Q?", "ACK", "CTX+", "⇄", "[REF]"]
+
+    def __init__(self, latency=0.0, jitter=0.0, output_tokens=24,
+                 rate_limit_every=0, error_rate=0.0, seed=279, chunk_delay=0.0):
+        """
+        Initialize the stub backend.
+
+        Args:
+            latency (float): Seconds every request takes.
+            jitter (float): Extra uniformly distributed seconds per request.
+            output_tokens (int): Approximate length of each reply in tokens.
+            rate_limit_every (int): Raise a 429 on every Nth request (0 disables).
+            error_rate (float): Probability of a 429 on any request.
+            seed (int): Seed for the jitter and error RNG.
+            chunk_delay (float): Seconds between chunks of a streamed reply;
+                ``latency`` is the time to the first chunk.
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.output_tokens = output_tokens
+        self.rate_limit_every = rate_limit_every
+        self.error_rate = error_rate
+        self.chunk_delay = chunk_delay
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.rate_limited = 0
+        self.cached_contexts = 0
+        self._encoded = {}
+
+    def start_chat(self, model_name, generation_config, history=None, cached_context=None):
+        return StubChat(self, model_name, generation_config, history, cached_context)
+
+    def create_cached_context(self, model_name, prefix, ttl):
+        digest = hashlib.sha256(prefix.encode("utf-8")).hexdigest()[:12]
+        with self._lock:
+            self.cached_contexts += 1
+        return StubCachedContext(f"cachedContents/stub-{digest}", prefix, estimate_tokens(prefix), time.time() + ttl)
+
+    def _decrypted_text(self, message):
+        # Messages this stub encoded decode back to their original text
+        original = self._encoded.get(message)
+        if original is not None:
+            return original
+        digest = hashlib.sha256(message.encode("utf-8")).hexdigest()
+        return f"Decrypted ({digest[:8]}): {message}"
+
+    def _encoded_text(self, message):
+        # Keep names and numbers, abbreviate everything else
+        words = []
+        for word in message.split():
+            if word[:1].isupper() or any(ch.isdigit() for ch in word):
+                words.append(word)
+            elif len(word) > 3:
+                words.append(word[:3].upper())
+        encoded = "⟦LO-2⟧ " + "|".join(words)
+        with self._lock:
+            self._encoded[encoded] = message
+        return encoded
+
+    def _reply_text(self, content):
+        if "SUMMARIZE THE CONVERSATION" in content and "New turns:" in content:
+            # Summary request: the previous summary and new turns, cut to the word limit
+            limit = re.search(r"at most (\d+) words", content)
+            previous = content.split("Current summary:", 1)[1].split("New turns:", 1)[0].strip()
+            turns = content.rsplit("New turns:", 1)[1].split()
+            words = ([] if previous in ("", "(none)") else previous.split()[1:]) + turns
+            return "Summary: " + " ".join(words[:int(limit.group(1)) if limit else 50])
+        if "ENCRYPT THE FOLLOWING MESSAGE" in content and "Message:" in content:
+            return self._encoded_text(content.rsplit("Message:", 1)[1].strip())
+        if "LOLANG messages:" in content:
+            # Batched decryption request: answer every numbered line
+            lines = content.rsplit("LOLANG messages:", 1)[1].strip().splitlines()
+            replies = []
+            for line in lines:
+                marker, _, message = line.partition("]]")
+                if marker.startswith("[["):
+                    replies.append(f"{marker}]] {self._decrypted_text(message.strip())}")
+            return "\n".join(replies)
+        if "LOLANG message:" in content:
+            # Decryption request: answer with readable text
+            return self._decrypted_text(content.rsplit("LOLANG message:", 1)[1].strip())
+        digest = hashlib.sha256(content.encode("utf-8")).digest()
+        words = [self.GLYPHS[digest[i % len(digest)] % len(self.GLYPHS)]
+                 for i in range(max(1, self.output_tokens // 2))]
+        return " ".join(words)
+
+    def _respond(self, chat, content):
+        with self._lock:
+            self.calls += 1
+            call_number = self.calls
+            inject_429 = (
+                (self.rate_limit_every and call_number % self.rate_limit_every == 0)
+                or (self.error_rate and self._rng.random() < self.error_rate)
+            )
+            delay = self.latency + (self._rng.uniform(0, self.jitter) if self.jitter else 0.0)
+            if inject_429:
+                self.rate_limited += 1
+
+        if delay > 0:
+            time.sleep(delay)
+        if inject_429:
+            raise StubRateLimitError()
+
+        context = chat.cached_context
+        # A cached prefix is part of the prompt, reported the way Gemini does
+        text = self._reply_text(f"{context.prefix}\n{content}" if context else content)
+        cached_tokens = context.tokens if context else 0
+        prompt_tokens = cached_tokens + estimate_tokens(content) + sum(
+            estimate_tokens(part) for turn in chat.history for part in turn["parts"]
+        )
+        output_tokens = estimate_tokens(text)
+        return StubResponse(
+            text=text,
+            usage_metadata=StubUsage(
+                prompt_token_count=prompt_tokens,
+                candidates_token_count=output_tokens,
+                total_token_count=prompt_tokens + output_tokens,
+                cached_content_token_count=cached_tokens,
+            ),
+        )
+
+
+_backends = {}
+_backends_lock = threading.Lock()
+
+
+def get_backend(config):
+    """
+    Return the process-wide backend selected by ``config.backend``.
+
+    Instances are shared between every agent and decryptor that use the same
+    settings, so a stub backend's call counters cover the whole process.
+
+    Args:
+        config (GeminiConfig): The configuration to build the backend from.
+
+    Returns:
+        LLMBackend: The shared backend instance.
+    """
+    if config.backend == "cassette":
+        return _get_cassette_backend(config)
+    if config.backend == "gemini":
+        key = ("gemini", config.api_key)
+    elif config.backend == "stub":
+        key = ("stub", config.stub_latency, config.stub_jitter, config.stub_output_tokens,
+               config.stub_rate_limit_every, config.stub_error_rate, config.stub_chunk_delay)
+    else:
+        raise ValueError(f"Unknown LLM backend: {config.backend}")
+
+    with _backends_lock:
+        backend = _backends.get(key)
+        if backend is None:
+            if config.backend == "gemini":
+                backend = GeminiBackend(config.api_key)
+            else:
+                backend = StubBackend(
+                    latency=config.stub_latency,
+                    jitter=config.stub_jitter,
+                    output_tokens=config.stub_output_tokens,
+                    rate_limit_every=config.stub_rate_limit_every,
+                    error_rate=config.stub_error_rate,
+                    chunk_delay=config.stub_chunk_delay,
+                )
+            _backends[key] = backend
+    return backend
+
+
+def _get_cassette_backend(config):
+    from cassette import CassetteBackend
+
+    key = ("cassette", os.path.abspath(config.cassette_path), config.cassette_mode, config.cassette_backend,
+           config.cassette_simulate_latency, config.cassette_latency_scale)
+    with _backends_lock:
+        backend = _backends.get(key)
+    if backend is not None:
+        return backend
+    # Resolve the recorded backend outside the lock; get_backend takes it again
+    inner = None
+    if config.cassette_mode == "record":
+        if config.cassette_backend == "cassette":
+            raise ValueError("A cassette cannot record from another cassette")
+        inner = get_backend(replace(config, backend=config.cassette_backend))
+    with _backends_lock:
+        backend = _backends.get(key)
+        if backend is None:
+            backend = CassetteBackend(
+                config.cassette_path,
+                mode=config.cassette_mode,
+                inner=inner,
+                simulate_latency=config.cassette_simulate_latency,
+                latency_scale=config.cassette_latency_scale,
+            )
+            _backends[key] = backend
+            timing_dependent = _timing_dependent_settings(config)
+            if timing_dependent:
+                logger.warning(
+                    f"Cassette {config.cassette_mode} with {', '.join(timing_dependent)}: which decryption "
+                    f"requests are sent depends on timing, so a replay may miss recorded requests"
+                )
+    return backend
+
+
+def _timing_dependent_settings(config):
+    # Settings whose requests differ between runs of the same conversation
+    settings = []
+    if config.decryption_batch_window > 0:
+        settings.append("decryption_batch_window")
+    if config.phrase_codec_enabled:
+        settings.append("phrase_codec_enabled")
+    if config.server_decryption_queue_size > 0:
+        settings.append("server_decryption_queue_size")
+    return settings
@@ -0,0 +1,341 @@
+"""
+Load test for AgentServer.
+
+Starts an AgentServer in-process on a free local port with the stub backend,
+then drives N simulated agent clients (speaking the AgentClient protocol)
+and M translator-style observers against it. Reports throughput, turn
+latency percentiles, time to first chunk when streaming, broadcast lag to
+observers, server memory and history growth, and errors.
+
+    python load_test.py --clients 100 --observers 5 --turns 10 --latency 0.5
+    python load_test.py --clients 50 --json baseline.json
+    python load_test.py --clients 50 --cassette run.bin --record --cassette-backend gemini
+    python load_test.py --clients 50 --cassette run.bin --simulate-latency
+"""
+import argparse
+import asyncio
+import dataclasses
+import json
+import sys
+import time
+import tracemalloc
+import uuid
+from websockets.client import connect
+from websockets.server import serve
+from config import GeminiConfig
+from latency_stats import summarize
+from llm_backend import get_backend
+from terminal_colors import TerminalColors
+from websocket_server import AgentServer
+from wire_protocol import SUBPROTOCOLS, decode_frame, get_codec, offered_subprotocols
+
+
+class LoadStats:
+    def __init__(self):
+        self.turn_latencies = []
+        self.first_chunk_latencies = []
+        self.completed_turns = 0
+        self.error_replies = 0
+        self.errors = []
+        # message id -> time the owning client received the final frame
+        self.delivered_at = {}
+        self.observer_received = []  # (message id, receive time)
+        self.bytes_received = 0
+
+
+def _connect(uri, config):
+    return connect(
+        uri,
+        subprotocols=offered_subprotocols(config.wire_format),
+        compression="deflate" if config.wire_transport_compression else None,
+        max_size=config.wire_max_frame_size,
+    )
+
+
+async def run_client(uri, config, turns, stats, think_time, session_id):
+    try:
+        async with _connect(uri, config) as websocket:
+            codec = get_codec(websocket.subprotocol, config.wire_deflate_min_size)
+            for turn in range(turns):
+                sent_at = time.perf_counter()
+                await websocket.send(codec.encode({
+                    "role": "client-agent",
+                    "content": f"⟦LO-2⟧ X-REQ turn {turn}|{session_id[:6]} [CONF]?",
+                    "session": session_id,
+                }))
+                first_chunk_at = None
+                while True:
+                    message = await websocket.recv()
+                    stats.bytes_received += len(message)
+                    data = decode_frame(message, config.wire_max_frame_size)
+                    if data.get("session") != session_id:
+                        continue
+                    if data.get("type") == "delta":
+                        first_chunk_at = first_chunk_at or time.perf_counter()
+                        continue
+                    break
+                received_at = time.perf_counter()
+                stats.turn_latencies.append(received_at - sent_at)
+                if first_chunk_at is not None:
+                    stats.first_chunk_latencies.append(first_chunk_at - sent_at)
+                stats.delivered_at[data.get("id")] = received_at
+                stats.completed_turns += 1
+                if data.get("content", "").startswith("Error:"):
+                    stats.error_replies += 1
+                if think_time:
+                    await asyncio.sleep(think_time)
+    except Exception as e:
+        stats.errors.append(f"client: {e}")
+
+
+async def run_observer(uri, config, stats, ready):
+    try:
+        async with _connect(uri, config) as websocket:
+            ready.set()
+            async for message in websocket:
+                stats.bytes_received += len(message)
+                data = decode_frame(message, config.wire_max_frame_size)
+                if data.get("type", "message") == "message":
+                    stats.observer_received.append((data.get("id"), time.perf_counter()))
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        ready.set()
+        stats.errors.append(f"observer: {e}")
+
+
+async def run_load_test(config, clients, observers, turns, think_time=0.0):
+    """
+    Run one load test and return the report.
+
+    Args:
+        config (GeminiConfig): Server configuration (normally the stub backend).
+        clients (int): Number of concurrent agent conversations.
+        observers (int): Number of translator-style observers.
+        turns (int): Turns per conversation.
+        think_time (float): Seconds each client waits between turns.
+
+    Returns:
+        dict: The load test report.
+    """
+    stats = LoadStats()
+    tracemalloc.start()
+    agent_server = AgentServer(config)
+    agent_server.start()
+    server = await serve(
+        agent_server.handler, "localhost", 0,
+        subprotocols=SUBPROTOCOLS,
+        compression="deflate" if config.wire_transport_compression else None,
+        max_size=config.wire_max_frame_size,
+    )
+    uri = f"ws://localhost:{server.sockets[0].getsockname()[1]}"
+    memory_before = tracemalloc.get_traced_memory()[0]
+
+    observer_tasks = []
+    for _ in range(observers):
+        ready = asyncio.Event()
+        observer_tasks.append(asyncio.create_task(run_observer(uri, config, stats, ready)))
+        await ready.wait()
+
+    peak_history_turns = 0
+    peak_history_tokens = 0
+
+    async def sample_history():
+        nonlocal peak_history_turns, peak_history_tokens
+        while True:
+            histories = [state.history for state in agent_server.sessions.values()]
+            peak_history_turns = max(peak_history_turns, sum(len(h) for h in histories))
+            peak_history_tokens = max(peak_history_tokens, sum(h.token_count for h in histories))
+            await asyncio.sleep(0.1)
+
+    sampler = asyncio.create_task(sample_history())
+    started = time.perf_counter()
+    # Stable session ids keep the prompts identical between runs, so a
+    # recorded cassette replays without misses
+    await asyncio.gather(*[
+        run_client(uri, config, turns, stats, think_time, uuid.uuid5(uuid.NAMESPACE_OID, f"load-test-{index}").hex)
+        for index in range(clients)
+    ])
+    elapsed = time.perf_counter() - started
+    memory_peak = tracemalloc.get_traced_memory()[1]
+
+    if config.backend == "cassette" and agent_server.decryption_pipeline:
+        # Finish the background decryptions so a recording covers every one
+        await agent_server.decryption_pipeline.queue.join()
+    # Let observers drain the last frames
+    await asyncio.sleep(0.2)
+    sampler.cancel()
+    for task in observer_tasks:
+        task.cancel()
+    await asyncio.gather(sampler, *observer_tasks, return_exceptions=True)
+    server_metrics = agent_server.metrics_snapshot()
+    cassette = None
+    if config.backend == "cassette":
+        cassette = dict(
+            get_backend(config).stats(),
+            backend=config.cassette_backend,
+            simulate_latency=config.cassette_simulate_latency,
+        )
+    server.close()
+    await server.wait_closed()
+    await agent_server.shutdown()
+    memory_after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    # Lag is measured from the first peer that received each frame, so it
+    # reflects how far the fan-out spreads rather than the generation time
+    first_seen = dict(stats.delivered_at)
+    for message_id, received_at in stats.observer_received:
+        first_seen[message_id] = min(received_at, first_seen.get(message_id, received_at))
+    broadcast_lags = [
+        received_at - first_seen[message_id]
+        for message_id, received_at in stats.observer_received
+    ]
+    return {
+        "clients": clients,
+        "observers": observers,
+        "turns": turns,
+        "backend": config.backend,
+        "stub_latency": config.stub_latency,
+        "cassette": cassette,
+        "stream_responses": config.stream_responses,
+        "max_concurrent_generations": config.server_max_concurrent_generations,
+        "wire_format": config.wire_format,
+        "transport_compression": config.wire_transport_compression,
+        "elapsed_seconds": elapsed,
+        "completed_turns": stats.completed_turns,
+        "throughput_turns_per_second": stats.completed_turns / elapsed if elapsed else 0.0,
+        "turn_latency": summarize(stats.turn_latencies),
+        "first_chunk_latency": summarize(stats.first_chunk_latencies),
+        "broadcast_lag": summarize(broadcast_lags),
+        "observer_frames": len(stats.observer_received),
+        "bytes_received": stats.bytes_received,
+        "memory_bytes": {
+            "before": memory_before,
+            "peak": memory_peak,
+            "after": memory_after,
+            "growth": memory_after - memory_before,
+        },
+        "peak_history_messages": peak_history_turns,
+        "peak_history_tokens": peak_history_tokens,
+        "error_replies": stats.error_replies,
+        "errors": stats.errors,
+        "server_metrics": server_metrics,
+    }
+
+
+def _describe_backend(report):
+    cassette = report["cassette"]
+    if cassette is None:
+        return f"{report['backend']}, latency {report['stub_latency']}s"
+    if cassette["mode"] == "record":
+        if cassette["backend"] == "stub":
+            return f"cassette recording stub, latency {report['stub_latency']}s"
+        return f"cassette recording {cassette['backend']}"
+    return f"cassette replay, {'recorded latency' if cassette['simulate_latency'] else 'no latency'}"
+
+
+def print_report(report):
+    print(TerminalColors.colorize(
+        f"Load test: {report['clients']} clients, {report['observers']} observers, "
+        f"{report['turns']} turns ({_describe_backend(report)})",
+        TerminalColors.HEADER,
+    ))
+    print(f"Completed turns:   {report['completed_turns']} in {report['elapsed_seconds']:.2f}s "
+          f"({report['throughput_turns_per_second']:.1f} turns/s)")
+    for name in ("turn_latency", "first_chunk_latency", "broadcast_lag"):
+        stats = report[name]
+        if stats["count"]:
+            print(f"{name.replace('_', ' ').capitalize():<19}p50 {stats['p50'] * 1000:.1f}ms  "
+                  f"p95 {stats['p95'] * 1000:.1f}ms  p99 {stats['p99'] * 1000:.1f}ms  "
+                  f"max {stats['max'] * 1000:.1f}ms")
+    print(f"Frame bytes:       {report['bytes_received']} ({report['wire_format']}"
+          f"{', permessage-deflate' if report['transport_compression'] else ''})")
+    memory = report["memory_bytes"]
+    print(f"Memory:            peak {memory['peak'] / 1e6:.1f}MB, growth {memory['growth'] / 1e6:.2f}MB")
+    print(f"Server history:    peak {report['peak_history_messages']} messages, "
+          f"{report['peak_history_tokens']} tokens")
+    cassette = report["cassette"]
+    if cassette is not None:
+        if cassette["mode"] == "record":
+            print(f"Cassette:          {cassette['recorded']} replies recorded")
+        else:
+            color = TerminalColors.RED if cassette["misses"] else TerminalColors.GREEN
+            print(TerminalColors.colorize(
+                f"Cassette:          {cassette['hits']} hits, {cassette['loose_hits']} loose hits, "
+                f"{cassette['misses']} misses", color))
+    errors = len(report["errors"]) + report["error_replies"]
+    color = TerminalColors.RED if errors else TerminalColors.GREEN
+    print(TerminalColors.colorize(f"Errors:            {errors}", color))
+    for error in report["errors"][:10]:
+        print(TerminalColors.colorize(f"  {error}", TerminalColors.RED))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Drive simulated agent clients against AgentServer.")
+    parser.add_argument("--clients", type=int, default=20, help="Concurrent agent conversations")
+    parser.add_argument("--observers", type=int, default=2, help="Translator-style observers")
+    parser.add_argument("--turns", type=int, default=5, help="Turns per conversation")
+    parser.add_argument("--latency", type=float, default=0.2, help="Stub backend seconds per request")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Extra random stub seconds per request")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Probability of an injected 429")
+    parser.add_argument("--think-time", type=float, default=0.0, help="Client seconds between turns")
+    parser.add_argument("--max-concurrent", type=int, help="Server LLM calls in flight")
+    parser.add_argument("--stream", action="store_true", help="Stream replies as delta frames")
+    parser.add_argument("--wire-format", default="bin+deflate", choices=["bin+deflate", "bin", "json"],
+                        help="Frame encoding the clients prefer")
+    parser.add_argument("--no-transport-compression", action="store_true",
+                        help="Disable permessage-deflate on the connections")
+    parser.add_argument("--cassette", help="Replay LLM replies from this cassette file instead of the stub")
+    parser.add_argument("--record", action="store_true",
+                        help="Record the replies of --cassette-backend to --cassette instead of replaying")
+    parser.add_argument("--cassette-backend", default="stub", help="Backend recorded from (default: stub)")
+    parser.add_argument("--simulate-latency", action="store_true",
+                        help="Replay with the recorded response times")
+    parser.add_argument("--json", dest="json_path", help="Write the report to this file")
+    args = parser.parse_args(argv)
+
+    config = dataclasses.replace(
+        GeminiConfig.get_default_config(),
+        backend="stub",
+        stub_latency=args.latency,
+        stub_jitter=args.jitter,
+        stub_error_rate=args.error_rate,
+        stream_responses=args.stream,
+        wire_format=args.wire_format,
+        wire_transport_compression=not args.no_transport_compression,
+        decryption_cache_path=None,
+        # Measure the server, not the rendering of every message
+        output_mode="none",
+        # The stub has no quota; measure the server, not the rate limiter
+        requests_per_minute=10 ** 9,
+        tokens_per_minute=10 ** 9,
+        rate_limit_backoff=0.1,
+    )
+    if args.max_concurrent:
+        config.server_max_concurrent_generations = args.max_concurrent
+    if args.cassette:
+        config.backend = "cassette"
+        config.cassette_path = args.cassette
+        config.cassette_mode = "record" if args.record else "replay"
+        config.cassette_backend = args.cassette_backend
+        config.cassette_simulate_latency = args.simulate_latency
+        # Batches, what the phrase codec has learned and which messages
+        # overflow the decryption queue depend on timing; decrypt every
+        # message on its own so the requests are the same when recording
+        # and replaying
+        config.decryption_batch_window = 0
+        config.phrase_codec_enabled = False
+        config.server_decryption_queue_size = 0  # Unbounded
+
+    report = asyncio.run(run_load_test(config, args.clients, args.observers, args.turns, args.think_time))
+
+    print_report(report)
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as report_file:
+            json.dump(report, report_file, indent=2)
+    return 1 if report["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,16 +1,28 @@
+import functools
 import logging
-import time
-import random
 import asyncio
-import google.generativeai as genai
+import re
+import time
 from config import GeminiConfig
+from llm_backend import estimate_tokens, get_backend, usage_tokens
+from rate_limiter import get_rate_limiter
+from decryption_cache import DecryptionCache, get_shared_cache
+from metrics import CACHE_HITS, CACHE_MISSES, CODEC_HITS, DECRYPTION_SECONDS
+from resilience import get_resilience
+from phrase_codec import get_shared_codec
+from single_flight import SINGLE_FLIGHT
+from prompt_cache import get_prompt_cache
 
 class LolangDecryptor:
     """
     A module for decrypting LOLANG messages into human-readable text.
-    Uses the Gemini API to translate the encrypted messages.
+    Uses the configured LLM backend (Gemini by default) to translate the
+    encrypted messages.
     """
 
+    # Bump whenever DECRYPTION_PROMPT changes so cached results are not reused
+    PROMPT_VERSION = "1"
+
     DECRYPTION_PROMPT = """
     You are a LOLANG language translator. LOLANG is an encrypted language used by AI agents
     to communicate efficiently. Your task is to decrypt LOLANG messages into human-readable text.
@@ -33,46 +45,263 @@ class LolangDecryptor:
     Only return the decrypted message, nothing else.
     """
 
-    def __init__(self, config=None):
+    BATCH_DECRYPTION_PROMPT = """
+    Please decrypt each of the numbered LOLANG messages below into clear, human-readable text.
+    Answer with one entry per message, in the same order, using the same [[n]] markers:
+    [[1]] <decrypted message 1>
+    [[2]] <decrypted message 2>
+    Only return the numbered decrypted messages, nothing else.
+    """
+
+    _BATCH_MARKER = re.compile(r"\[\[(\d+)\]\]")
+
+    def __init__(self, config=None, backend=None, cache=None, codec=None):
         """
         Initialize the LOLANG decryptor with the given configuration.
 
         Args:
             config (GeminiConfig, optional): Configuration for the Gemini API.
                 If None, the default configuration will be used.
+            backend (LLMBackend, optional): Backend to send requests through.
+                If None, the backend selected by the configuration is used.
+            cache (DecryptionCache, optional): Cache for decrypted messages.
+                If None, the shared cache from the configuration is used.
+            codec (PhraseCodec, optional): Local codec tried before the cache
+                and the LLM. If None, the shared codec from the configuration
+                is used.
         """
         self.config = config or GeminiConfig.get_default_config()
         self.logger = logging.getLogger(__name__)
-        self._model = None
+        self.backend = backend or get_backend(self.config)
+        self.cache = cache if cache is not None else get_shared_cache(self.config)
+        self.codec = codec if codec is not None else get_shared_codec(
+            self.config, f"{self.backend.name}/{self.config.model_name}/{self.PROMPT_VERSION}"
+        )
+        self.rate_limiter = get_rate_limiter(self.config)
+        self.resilience = get_resilience(self.config, self.backend, "decryption")
+        self.prompt_cache = get_prompt_cache(self.config, self.backend)
+        self.generation_config = {
+            "temperature": 0.1,  # Lower temperature for more deterministic results
+            "max_output_tokens": 1000,
+        }
+        self._batcher = None
+
+    def _start_chat(self, cached_context=None):
+        """
+        Start a fresh chat session on the backend for decryption.
+
+        Args:
+            cached_context (optional): Cached static prefix to start from.
+
+        Returns:
+            The backend chat object.
+        """
+        try:
+            return self.backend.start_chat(
+                self.config.model_name, self.generation_config, cached_context=cached_context
+            )
+        except Exception as e:
+            self.logger.error(f"Failed to initialize {self.backend.name} model for decryption: {e}")
+            raise
+
+    def _open_chat(self, prompt):
+        # Single and batched prompts both start with the decryption rules
+        if self.prompt_cache is None:
+            return self._start_chat(), prompt
+        prefixes = (self.DECRYPTION_PROMPT, self.DECRYPTION_PROMPT.rsplit("Please decrypt", 1)[0])
+        cached_context, content = self.prompt_cache.split(prompt, prefixes)
+        return self._start_chat(cached_context), content
+
+    def _cache_key(self, lolang_message):
+        return DecryptionCache.make_key(
+            lolang_message, self.backend.name, self.config.model_name, self.PROMPT_VERSION
+        )
+
+    def _cache_get(self, lolang_message):
+        if self.cache is None:
+            return None
+        cached = self.cache.get(self._cache_key(lolang_message))
+        (CACHE_MISSES if cached is None else CACHE_HITS).inc()
+        return cached
+
+    async def _acache_get(self, lolang_message):
+        # Memory hits are answered on the loop; SQLite reads go to a thread
+        if self.cache is None:
+            return None
+        key = self._cache_key(lolang_message)
+        cached = self.cache.get_memory(key)
+        if cached is None:
+            if self.cache.persistent:
+                cached = await asyncio.to_thread(self.cache.get, key)
+            else:
+                cached = self.cache.get(key)
+        (CACHE_MISSES if cached is None else CACHE_HITS).inc()
+        return cached
+
+    def _cache_put(self, lolang_message, decrypted_message):
+        if self.cache is not None:
+            self.cache.put(self._cache_key(lolang_message), decrypted_message)
+
+    def _codec_lookup(self, lolang_message):
+        # The local codec answers in microseconds; the cache is next
+        if self.codec is not None:
+            decrypted = self.codec.lookup(lolang_message)
+            if decrypted is not None:
+                CODEC_HITS.inc()
+                return decrypted
+        return None
+
+    def _learn_cached(self, lolang_message, cached):
+        if cached is not None and self.codec is not None:
+            # Entries persisted by earlier runs teach the codec as well
+            self.codec.learn(lolang_message, cached)
+        return cached
+
+    def _lookup(self, lolang_message):
+        decrypted = self._codec_lookup(lolang_message)
+        if decrypted is not None:
+            return decrypted
+        return self._learn_cached(lolang_message, self._cache_get(lolang_message))
+
+    async def _alookup(self, lolang_message):
+        decrypted = self._codec_lookup(lolang_message)
+        if decrypted is not None:
+            return decrypted
+        return self._learn_cached(lolang_message, await self._acache_get(lolang_message))
+
+    def _remember(self, lolang_message, decrypted_message):
+        self._cache_put(lolang_message, decrypted_message)
+        if self.codec is not None:
+            self.codec.learn(lolang_message, decrypted_message)
+
+    async def _aremember(self, lolang_message, decrypted_message):
+        if self.cache is not None and self.cache.persistent:
+            await asyncio.to_thread(self._cache_put, lolang_message, decrypted_message)
+        else:
+            self._cache_put(lolang_message, decrypted_message)
+        if self.codec is not None:
+            self.codec.learn(lolang_message, decrypted_message)
+
+    def _build_prompt(self, lolang_message):
+        return f"{self.DECRYPTION_PROMPT}\n\nLOLANG message: {lolang_message}"
+
+    def _build_batch_prompt(self, lolang_messages):
+        numbered = "\n".join(
+            f"[[{index}]] {' '.join(message.split())}"
+            for index, message in enumerate(lolang_messages, start=1)
+        )
+        # Reuse the rules and example from the single-message prompt
+        rules = self.DECRYPTION_PROMPT.rsplit("Please decrypt", 1)[0]
+        return f"{rules}{self.BATCH_DECRYPTION_PROMPT}\n\nLOLANG messages:\n{numbered}"
+
+    def _parse_batch(self, text, count):
+        """
+        Split a batched reply back into individual decryptions.
+
+        Args:
+            text (str): The model reply to a batch prompt.
+            count (int): How many messages were in the batch.
+
+        Returns:
+            list or None: The decryptions in request order, or None if the
+            reply does not contain exactly one non-empty entry per message.
+        """
+        parts = self._BATCH_MARKER.split(text)
+        entries = {}
+        for index in range(1, len(parts) - 1, 2):
+            number = int(parts[index])
+            body = parts[index + 1].strip()
+            if number in entries or not body:
+                return None
+            entries[number] = body
+        if sorted(entries) != list(range(1, count + 1)):
+            return None
+        return [entries[number] for number in range(1, count + 1)]
+
+    def _send(self, prompt):
+        """
+        Perform a single, blocking request without retries.
+
+        Every request uses a one-off chat, so a decryption depends only on
+        its own message and can be cached and shared with other callers.
+
+        Args:
+            prompt (str): The full decryption prompt.
+
+        Returns:
+            The backend response.
+        """
+        # Create chat context
+        chat, content = self._open_chat(prompt)
+
+        # Send decryption prompt with the LOLANG message
+        return chat.send_message(content)
+
+    def _record_success(self, estimated_tokens, response):
+        actual_tokens = usage_tokens(response)
+        if actual_tokens is not None:
+            self.rate_limiter.record_usage(estimated_tokens, actual_tokens)
+        self.rate_limiter.report_success()
+
+    async def _complete(self, prompt):
+        """
+        Send a prompt, retrying rate limits and transient errors.
+
+        Args:
+            prompt (str): The full prompt to send.
+
+        Returns:
+            str: The stripped reply text.
 
-        # Initialize Gemini
-        genai.configure(api_key=self.config.api_key)
+        Raises:
+            Exception: The last error once retries are exhausted.
+        """
+        started = time.perf_counter()
+        try:
+            return await self._complete_with_retries(prompt)
+        finally:
+            DECRYPTION_SECONDS.observe(time.perf_counter() - started)
+
+    async def _complete_with_retries(self, prompt):
+        estimated_tokens = estimate_tokens(prompt)
+        send = functools.partial(self._send, prompt)
+        response = await self.resilience.call(send, estimated_tokens, hedge_send=send)
+        self._record_success(estimated_tokens, response)
+        return response.text.strip()
 
-    @property
-    def model(self):
+    def _complete_sync(self, prompt):
         """
-        Get or initialize the Gemini model for decryption.
+        Synchronous version of _complete.
+
+        Args:
+            prompt (str): The full prompt to send.
 
         Returns:
-            The Gemini model instance.
-        """
-        if self._model is None:
-            try:
-                self._model = genai.GenerativeModel(
-                    model_name=self.config.model_name,
-                    generation_config={
-                        "temperature": 0.1,  # Lower temperature for more deterministic results
-                        "max_output_tokens": 1000,
-                    }
-                )
-            except Exception as e:
-                self.logger.error(f"Failed to initialize Gemini model for decryption: {e}")
-                raise
-        return self._model
+            str: The stripped reply text.
+
+        Raises:
+            Exception: The last error once retries are exhausted.
+        """
+        started = time.perf_counter()
+        try:
+            return self._complete_sync_with_retries(prompt)
+        finally:
+            DECRYPTION_SECONDS.observe(time.perf_counter() - started)
+
+    def _complete_sync_with_retries(self, prompt):
+        estimated_tokens = estimate_tokens(prompt)
+        response = self.resilience.call_sync(functools.partial(self._send, prompt), estimated_tokens)
+        self._record_success(estimated_tokens, response)
+        return response.text.strip()
 
     async def decrypt(self, lolang_message):
         """
         Decrypt a LOLANG message into human-readable text with silent retry mechanism.
+        Results are served from the local phrase codec or the decryption
+        cache when available. Concurrent calls for the same message, from
+        any decryptor in the process, share one request, and different
+        messages are grouped into one batched request when the
+        micro-batching window is enabled.
 
         Args:
             lolang_message (str): The LOLANG message to decrypt.
@@ -80,31 +309,104 @@ class LolangDecryptor:
         Returns:
             str: The decrypted, human-readable message.
         """
-        max_retries = 10
-        base_delay = 5
-
-        for attempt in range(max_retries):
-            try:
-                # Create chat context
-                chat = self.model.start_chat(history=[])
-
-                # Send decryption prompt with the LOLANG message
-                response = chat.send_message(
-                    f"{self.DECRYPTION_PROMPT}\n\nLOLANG message: {lolang_message}"
-                )
-
-                decrypted_message = response.text.strip()
-                return decrypted_message
-            except Exception as e:
-                if "429" in str(e) and attempt < max_retries - 1:
-                    # Calculate exponential backoff with jitter
-                    delay = (base_delay * (2 ** attempt)) + random.uniform(0, 1)
-                    # Silently retry without logging
-                    await asyncio.sleep(delay)
-                else:
-                    # Only log if it's not a 429 error or we've reached max retries
-                    self.logger.error(f"Decryption failed: {e}")
-                    return f"[Decryption failed: {str(e)}]"
+        cached = await self._alookup(lolang_message)
+        if cached is not None:
+            return cached
+
+        if self.config.decryption_single_flight:
+            return await SINGLE_FLIGHT.do(
+                ("decrypt", self._cache_key(lolang_message)),
+                lambda: self._decrypt_miss(lolang_message),
+            )
+        return await self._decrypt_miss(lolang_message)
+
+    async def _decrypt_miss(self, lolang_message):
+        if self.config.decryption_batch_window > 0:
+            return await self._get_batcher().submit(lolang_message)
+        return await self._decrypt_uncached(lolang_message)
+
+    async def _decrypt_uncached(self, lolang_message):
+        try:
+            decrypted_message = await self._complete(self._build_prompt(lolang_message))
+        except Exception as e:
+            self.logger.error(f"Decryption failed: {e}")
+            return f"[Decryption failed: {str(e)}]"
+        await self._aremember(lolang_message, decrypted_message)
+        return decrypted_message
+
+    async def decrypt_many(self, lolang_messages):
+        """
+        Decrypt several LOLANG messages, packing cache misses into batched requests.
+
+        Args:
+            lolang_messages (list): The LOLANG messages to decrypt.
+
+        Returns:
+            list: The decrypted messages, in the same order as the input.
+        """
+        results = [None] * len(lolang_messages)
+        pending = {}
+        for index, message in enumerate(lolang_messages):
+            cached = await self._alookup(message)
+            if cached is not None:
+                results[index] = cached
+            else:
+                pending.setdefault(message, []).append(index)
+
+        if pending:
+            unique = list(pending)
+            decrypted = await self._decrypt_many_uncached(unique)
+            for message, decrypted_message in zip(unique, decrypted):
+                for index in pending[message]:
+                    results[index] = decrypted_message
+        return results
+
+    async def _decrypt_many_uncached(self, lolang_messages):
+        size = max(1, self.config.decryption_batch_max)
+        chunks = [lolang_messages[i:i + size] for i in range(0, len(lolang_messages), size)]
+        decrypted = await asyncio.gather(*[self._decrypt_batch(chunk) for chunk in chunks])
+        return [message for chunk in decrypted for message in chunk]
+
+    async def _decrypt_batch(self, lolang_messages):
+        """
+        Decrypt one batch in a single request, falling back to one request
+        per message if the reply cannot be parsed. If the request itself
+        fails, every message gets the failure: retrying them one by one
+        would only multiply the calls to a rate-limited or failing backend.
+
+        Args:
+            lolang_messages (list): Unique, uncached LOLANG messages.
+
+        Returns:
+            list: The decrypted messages in request order.
+        """
+        if len(lolang_messages) == 1:
+            return [await self._decrypt_uncached(lolang_messages[0])]
+
+        try:
+            reply = await self._complete(self._build_batch_prompt(lolang_messages))
+        except Exception as e:
+            self.logger.error(f"Batched decryption failed: {e}")
+            return [f"[Decryption failed: {str(e)}]"] * len(lolang_messages)
+
+        decrypted = self._parse_batch(reply, len(lolang_messages))
+        if decrypted is None:
+            self.logger.warning("Unparseable batched reply, decrypting the messages one by one")
+            return list(await asyncio.gather(
+                *[self._decrypt_uncached(message) for message in lolang_messages]
+            ))
+
+        for message, decrypted_message in zip(lolang_messages, decrypted):
+            await self._aremember(message, decrypted_message)
+        return decrypted
+
+    def _get_batcher(self):
+        loop = asyncio.get_running_loop()
+        if self._batcher is None or self._batcher.loop is not loop:
+            self._batcher = DecryptionBatcher(
+                self, self.config.decryption_batch_window, self.config.decryption_batch_max
+            )
+        return self._batcher
 
     def decrypt_sync(self, lolang_message):
         """
@@ -116,33 +418,87 @@ class LolangDecryptor:
         Returns:
             str: The decrypted, human-readable message.
         """
-        max_retries = 10
-        base_delay = 5
+        cached = self._lookup(lolang_message)
+        if cached is not None:
+            return cached
 
-        for attempt in range(max_retries):
-            try:
-                # Create chat context
-                chat = self.model.start_chat(history=[])
+        if self.config.decryption_single_flight:
+            return SINGLE_FLIGHT.do_sync(
+                ("decrypt", self._cache_key(lolang_message)),
+                lambda: self._decrypt_uncached_sync(lolang_message),
+            )
+        return self._decrypt_uncached_sync(lolang_message)
 
-                # Send decryption prompt with the LOLANG message
-                response = chat.send_message(
-                    f"{self.DECRYPTION_PROMPT}\n\nLOLANG message: {lolang_message}"
-                )
+    def _decrypt_uncached_sync(self, lolang_message):
+        try:
+            decrypted_message = self._complete_sync(self._build_prompt(lolang_message))
+        except Exception as e:
+            self.logger.error(f"Decryption failed: {e}")
+            return f"[Decryption failed: {str(e)}]"
+        self._remember(lolang_message, decrypted_message)
+        return decrypted_message
 
-                decrypted_message = response.text.strip()
-                return decrypted_message
-            except Exception as e:
-                if "429" in str(e) and attempt < max_retries - 1:
-                    # Calculate exponential backoff with jitter
-                    delay = (base_delay * (2 ** attempt)) + random.uniform(0, 1)
-                    # Silently retry without logging
-                    time.sleep(delay)
-                else:
-                    # Only log if it's not a 429 error or we've reached max retries
-                    self.logger.error(f"Decryption failed: {e}")
-                    return f"[Decryption failed: {str(e)}]"
 
+class DecryptionBatcher:
+    """
+    Collects decrypt() calls arriving within a short window and resolves
+    them with one batched request, so a burst of messages costs one call.
+    """
 
+    def __init__(self, decryptor, window, max_batch):
+        """
+        Initialize the batcher on the running event loop.
+
+        Args:
+            decryptor (LolangDecryptor): The decryptor that performs the requests.
+            window (float): Seconds to wait for more messages after the first.
+            max_batch (int): Flush immediately once this many messages are queued.
+        """
+        self.decryptor = decryptor
+        self.window = window
+        self.max_batch = max(1, max_batch)
+        self.loop = asyncio.get_running_loop()
+        self._pending = []
+        self._timer = None
+        self._tasks = set()
+
+    async def submit(self, lolang_message):
+        """
+        Queue a message for the next batch and wait for its decryption.
 
+        Args:
+            lolang_message (str): The LOLANG message to decrypt.
+
+        Returns:
+            str: The decrypted message.
+        """
+        future = self.loop.create_future()
+        self._pending.append((lolang_message, future))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = self.loop.call_later(self.window, self._flush)
+        return await future
 
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = self.loop.create_task(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
 
+    async def _run(self, batch):
+        unique = list(dict.fromkeys(message for message, _ in batch))
+        try:
+            decrypted = dict(zip(unique, await self.decryptor._decrypt_many_uncached(unique)))
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for message, future in batch:
+            if not future.done():
+                future.set_result(decrypted[message])
@@ -1,17 +1,44 @@
 import logging
 from terminal_colors import TerminalColors
+from config import GeminiConfig
+from output_sink import get_output_sink
 
 class MessageVisualizer:
     """
     A module for visualizing LOLANG messages and their decrypted versions.
     Provides formatted output for better readability.
+
+    The visualize_* methods return formatted text; the show_* methods
+    write to the output sink, which renders them on a terminal or records
+    them as JSONL without blocking the caller.
     """
     
-    def __init__(self):
+    def __init__(self, sink=None):
         """
         Initialize the message visualizer.
+
+        Args:
+            sink (OutputSink, optional): Where show_* output goes. If None,
+                the shared sink of the default configuration is used.
         """
         self.logger = logging.getLogger(__name__)
+        self.sink = sink if sink is not None else get_output_sink(GeminiConfig.get_default_config())
+    
+    def role_color(self, role):
+        """
+        Pick the display color for a message sender.
+        
+        Args:
+            role (str): The role of the message sender.
+                
+        Returns:
+            str: The terminal color code.
+        """
+        if "Server" in role:
+            return TerminalColors.BLUE
+        elif "Client" in role:
+            return TerminalColors.GREEN
+        return TerminalColors.YELLOW
     
     def visualize_message(self, role, encrypted_message, decrypted_message=None):
         """
@@ -26,13 +53,7 @@ class MessageVisualizer:
         Returns:
             str: The formatted message for display.
         """
-        # Determine color based on role
-        if "Server" in role:
-            color = TerminalColors.BLUE
-        elif "Client" in role:
-            color = TerminalColors.GREEN
-        else:
-            color = TerminalColors.YELLOW
+        color = self.role_color(role)
         
         # Format the encrypted message
         formatted_encrypted = TerminalColors.colorize(
@@ -76,6 +97,31 @@ class MessageVisualizer:
         """
         return self.visualize_message("Server-Agent", encrypted_message, decrypted_message)
     
+    def visualize_stream_start(self, role):
+        """
+        Visualize the prefix of a message that will arrive in chunks.
+        
+        Args:
+            role (str): The role of the message sender.
+                
+        Returns:
+            str: The formatted prefix, to be printed without a newline.
+        """
+        return TerminalColors.colorize(f"{role}: ", self.role_color(role))
+    
+    def visualize_delta(self, role, chunk):
+        """
+        Visualize one chunk of a streamed message.
+        
+        Args:
+            role (str): The role of the message sender.
+            chunk (str): The partial message text.
+                
+        Returns:
+            str: The formatted chunk, to be printed without a newline.
+        """
+        return TerminalColors.colorize(chunk, self.role_color(role))
+    
     def visualize_system_message(self, message):
         """
         Visualize a system message.
@@ -99,3 +145,164 @@ class MessageVisualizer:
             str: The formatted error message for display.
         """
         return TerminalColors.colorize(f"Error: {message}", TerminalColors.RED)
+    
+    def show_message(self, role, encrypted_message, decrypted_message=None):
+        """
+        Output a message, with its decryption if given.
+        
+        Args:
+            role (str): The role of the message sender.
+            encrypted_message (str): The original LOLANG encrypted message.
+            decrypted_message (str, optional): The decrypted human-readable message.
+        """
+        record = {"type": "message", "role": role, "content": encrypted_message}
+        if decrypted_message:
+            record["decrypted"] = decrypted_message
+        self.sink.write(record, lambda: self.visualize_message(role, encrypted_message, decrypted_message))
+    
+    def show_stream_start(self, role, prefix=None, color=None):
+        """
+        Output the start of a message that will arrive in chunks.
+        
+        Args:
+            role (str): The role of the message sender.
+            prefix (str, optional): Text shown before the chunks; "<role>: " if None.
+            color (str, optional): Color of the prefix; the role's color if None.
+        """
+        if prefix is None:
+            render = lambda: self.visualize_stream_start(role)
+        else:
+            render = lambda: TerminalColors.colorize(prefix, color or self.role_color(role))
+        self.sink.write(None, render, end="")
+    
+    def show_delta(self, role, chunk, color=None):
+        """
+        Output one chunk of a streamed message.
+        
+        Args:
+            role (str): The role of the message sender.
+            chunk (str): The partial message text.
+            color (str, optional): Color of the chunk; the role's color if None.
+        """
+        if color is None:
+            render = lambda: self.visualize_delta(role, chunk)
+        else:
+            render = lambda: TerminalColors.colorize(chunk, color)
+        self.sink.write({"type": "delta", "role": role, "content": chunk}, render, end="")
+    
+    def show_stream_end(self, role, content):
+        """
+        Finish a streamed message.
+        
+        Args:
+            role (str): The role of the message sender.
+            content (str): The complete message, recorded for headless output.
+        """
+        self.sink.write({"type": "message", "role": role, "content": content, "streamed": True}, "")
+    
+    def show_translation(self, role, encrypted_message, decrypted_message, colors, streamed=False):
+        """
+        Output a message as the translator shows it: the encrypted text,
+        unless it was already streamed, then its translation.
+        
+        Args:
+            role (str): The display name of the sender.
+            encrypted_message (str): The original LOLANG encrypted message.
+            decrypted_message (str): The decrypted human-readable message.
+            colors (tuple): (encrypted color, translated color).
+            streamed (bool): The encrypted text was already shown chunk by chunk.
+        """
+        encrypted_color, translated_color = colors
+        
+        def render():
+            translated = TerminalColors.colorize(f"[TRANSLATED] {role}: {decrypted_message}", translated_color)
+            if streamed:
+                return translated
+            encrypted = TerminalColors.colorize(f"[ENCRYPTED] {role}: {encrypted_message}", encrypted_color)
+            return f"{encrypted}\n{translated}"
+        
+        self.sink.write(
+            {"type": "translation", "role": role, "content": encrypted_message, "decrypted": decrypted_message},
+            render,
+        )
+    
+    def show_skipped(self, role, encrypted_message, lag, color, streamed=False):
+        """
+        Output a message the translator did not decrypt because it was behind.
+        
+        Args:
+            role (str): The display name of the sender.
+            encrypted_message (str): The original LOLANG encrypted message.
+            lag (float): Seconds the message had been waiting.
+            color (str): Color of the encrypted text.
+            streamed (bool): The encrypted text was already shown chunk by chunk.
+        """
+        def render():
+            skipped = TerminalColors.colorize(f"[SKIPPED] {role}: {lag:.1f}s behind", TerminalColors.RED)
+            if streamed:
+                return skipped
+            return f"{TerminalColors.colorize(f'[ENCRYPTED] {role}: {encrypted_message}', color)}\n{skipped}"
+        
+        self.sink.write(
+            {"type": "skipped", "role": role, "content": encrypted_message, "lag": round(lag, 3)},
+            render,
+        )
+    
+    def show_lag(self, lag, queued, decrypting):
+        """
+        Output how far behind the conversation the translator is.
+        
+        Args:
+            lag (float): Seconds the last printed message had been waiting.
+            queued (int): Messages waiting to be printed.
+            decrypting (int): Decryptions in flight.
+        """
+        self.sink.write(
+            {"type": "lag", "lag": round(lag, 3), "queued": queued, "decrypting": decrypting},
+            lambda: TerminalColors.colorize(
+                f"[LAG] {lag:.1f}s, {queued} queued, {decrypting} decrypting", TerminalColors.YELLOW
+            ),
+        )
+    
+    def show_separator(self):
+        """
+        Output a separator line (terminal only).
+        """
+        self.sink.write(None, "-" * 80)
+    
+    def show_system_message(self, message):
+        """
+        Output a system message.
+        
+        Args:
+            message (str): The system message to display.
+        """
+        self.sink.write({"type": "system", "content": message}, lambda: self.visualize_system_message(message))
+    
+    def show_status(self, message, color=TerminalColors.YELLOW):
+        """
+        Output a connection or lifecycle notice.
+        
+        Args:
+            message (str): The notice.
+            color (str, optional): Its terminal color; plain text if None.
+        """
+        self.sink.write(
+            {"type": "status", "content": message},
+            lambda: TerminalColors.colorize(message, color) if color else message,
+        )
+    
+    def show_error_message(self, message):
+        """
+        Output an error message.
+        
+        Args:
+            message (str): The error message to display.
+        """
+        self.sink.write({"type": "error", "content": message}, lambda: self.visualize_error_message(message))
+    
+    def flush(self, timeout=5.0):
+        """
+        Wait until the sink has written everything shown so far.
+        """
+        self.sink.flush(timeout)
@@ -0,0 +1,261 @@
+import asyncio
+import bisect
+import logging
+import threading
+
+
+class Counter:
+    """
+    A monotonically increasing count.
+    """
+
+    kind = "counter"
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def samples(self):
+        return [(self.name, {}, self.value)]
+
+    def snapshot(self):
+        return self.value
+
+
+class Gauge:
+    """
+    A value that can go up and down, or be computed on demand.
+    """
+
+    kind = "gauge"
+
+    def __init__(self, name, help_text, function=None):
+        self.name = name
+        self.help = help_text
+        self.value = 0
+        self.function = function
+
+    def set(self, value):
+        self.value = value
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def dec(self, amount=1):
+        self.value -= amount
+
+    def get(self):
+        if self.function is not None:
+            try:
+                return self.function()
+            except Exception:
+                return 0
+        return self.value
+
+    def samples(self):
+        return [(self.name, {}, self.get())]
+
+    def snapshot(self):
+        return self.get()
+
+
+class Histogram:
+    """
+    Latency histogram with fixed cumulative buckets, in seconds.
+    """
+
+    kind = "histogram"
+
+    DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+    def __init__(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        with self._lock:
+            self.counts[bisect.bisect_left(self.buckets, value)] += 1
+            self.sum += value
+            self.count += 1
+
+    def samples(self):
+        with self._lock:
+            counts, total, count = list(self.counts), self.sum, self.count
+        samples = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets, counts):
+            cumulative += bucket_count
+            samples.append((f"{self.name}_bucket", {"le": repr(bound)}, cumulative))
+        samples.append((f"{self.name}_bucket", {"le": "+Inf"}, count))
+        samples.append((f"{self.name}_sum", {}, total))
+        samples.append((f"{self.name}_count", {}, count))
+        return samples
+
+    def snapshot(self):
+        # Cumulative like the exposition: each bound counts every value <= it
+        with self._lock:
+            counts, total, count = list(self.counts), self.sum, self.count
+        buckets = {}
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets, counts):
+            cumulative += bucket_count
+            buckets[bound] = cumulative
+        buckets[float("inf")] = count
+        return {
+            "count": count,
+            "sum": total,
+            "mean": total / count if count else 0.0,
+            "buckets": buckets,
+        }
+
+
+class MetricsRegistry:
+    """
+    Holds every metric of the process and renders them as Prometheus text
+    or as a plain dict snapshot.
+    """
+
+    def __init__(self, prefix="lolang_"):
+        self.prefix = prefix
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name, help_text, **kwargs):
+        full_name = self.prefix + name
+        with self._lock:
+            metric = self._metrics.get(full_name)
+            if metric is None:
+                metric = cls(full_name, help_text, **kwargs)
+                self._metrics[full_name] = metric
+            return metric
+
+    def counter(self, name, help_text=""):
+        return self._get_or_create(Counter, name, help_text)
+
+    def gauge(self, name, help_text="", function=None):
+        gauge = self._get_or_create(Gauge, name, help_text)
+        if function is not None:
+            gauge.function = function
+        return gauge
+
+    def histogram(self, name, help_text="", buckets=Histogram.DEFAULT_BUCKETS):
+        return self._get_or_create(Histogram, name, help_text, buckets=buckets)
+
+    def render_prometheus(self):
+        """
+        Render every metric in the Prometheus text exposition format.
+
+        Returns:
+            str: The exposition text.
+        """
+        lines = []
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            if metric.help:
+                lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                if labels:
+                    label_text = ",".join(f'{key}="{val}"' for key, val in labels.items())
+                    lines.append(f"{name}{{{label_text}}} {value}")
+                else:
+                    lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self):
+        """
+        Return the current value of every metric.
+
+        Returns:
+            dict: Metric name (without prefix) to value; histograms map to
+            a dict with count, sum, mean and cumulative bucket counts.
+        """
+        with self._lock:
+            metrics = list(self._metrics.items())
+        return {name[len(self.prefix):]: metric.snapshot() for name, metric in metrics}
+
+
+REGISTRY = MetricsRegistry()
+
+# Shared instruments used across the modules
+GENERATION_SECONDS = REGISTRY.histogram("generation_seconds", "Time to generate an agent reply, including retries")
+DECRYPTION_SECONDS = REGISTRY.histogram("decryption_seconds", "Time to decrypt a message or batch, including retries")
+BROADCAST_SECONDS = REGISTRY.histogram("broadcast_seconds", "Time from publishing a frame to its send completing, per subscriber")
+GENERATION_QUEUE_SECONDS = REGISTRY.histogram(
+    "generation_queue_seconds", "Time a message waited in its session inbox and for a generation slot"
+)
+DECRYPTION_QUEUE_SECONDS = REGISTRY.histogram(
+    "decryption_queue_seconds", "Time a message waited for a background decryption worker"
+)
+LLM_REQUESTS = REGISTRY.counter("llm_requests_total", "Requests sent to the LLM backend")
+LLM_RETRIES = REGISTRY.counter("llm_retries_total", "Requests retried after an error")
+LLM_RATE_LIMITED = REGISTRY.counter("llm_rate_limited_total", "Requests rejected with HTTP 429")
+LLM_FAILURES = REGISTRY.counter("llm_failures_total", "Requests that failed after all retries")
+CACHE_HITS = REGISTRY.counter("decryption_cache_hits_total", "Decryptions served from the cache")
+CACHE_MISSES = REGISTRY.counter("decryption_cache_misses_total", "Decryptions not found in the cache")
+CODEC_HITS = REGISTRY.counter("phrase_codec_hits_total", "Decryptions served by the local phrase codec")
+
+
+class MetricsServer:
+    """
+    Minimal HTTP endpoint serving the registry in Prometheus text format
+    on ``/metrics``.
+    """
+
+    def __init__(self, registry=REGISTRY, host="127.0.0.1", port=9108):
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self.logger = logging.getLogger(__name__)
+        self._server = None
+
+    async def start(self):
+        """
+        Start listening on the running event loop.
+        """
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def _handle(self, reader, writer):
+        try:
+            request_line = await reader.readline()
+            # Drain the request headers
+            while (await reader.readline()).strip():
+                pass
+            parts = request_line.decode("latin-1").split()
+            if len(parts) >= 2 and parts[1].split("?")[0] == "/metrics":
+                status, body = "200 OK", self.registry.render_prometheus().encode("utf-8")
+            else:
+                status, body = "404 Not Found", b"Not found\n"
+            writer.write(
+                f"HTTP/1.1 {status}\r\n"
+                f"Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                f"Connection: close\r\n\r\n".encode("latin-1") + body
+            )
+            await writer.drain()
+        except Exception as e:
+            self.logger.debug(f"Metrics request failed: {e}")
+        finally:
+            writer.close()
+
+    async def stop(self):
+        """
+        Stop the endpoint.
+        """
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
@@ -0,0 +1,421 @@
+"""
+Multi-process AgentServer.
+
+A supervisor starts ``server_workers`` worker processes. Each worker runs
+its own AgentServer and event loop, and every worker listens on the same
+port with SO_REUSEPORT, so the kernel spreads connections across them.
+
+Each session is owned by one worker, chosen by a stable hash of the
+session id. A worker that receives a message for a session it does not
+own forwards it to the owner. Every broadcast frame is relayed to the
+other workers, so an observer sees the whole conversation whichever
+worker it is connected to. Both go through a hub in the supervisor, over
+local TCP with length-prefixed JSON messages. Every connection is written
+from a bounded queue, so a slow peer never blocks the sender's event loop
+and cannot make its buffers grow without limit.
+"""
+import asyncio
+import dataclasses
+import json
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import struct
+import sys
+import time
+import zlib
+from websockets.server import serve
+from config import GeminiConfig
+from wire_protocol import SUBPROTOCOLS
+
+logger = logging.getLogger(__name__)
+
+_LENGTH = struct.Struct("!I")
+
+
+def session_owner(session_id, workers):
+    """
+    Return the index of the worker that owns a session.
+
+    Args:
+        session_id (str): The session id.
+        workers (int): Number of workers.
+
+    Returns:
+        int: The owning worker, stable across processes and restarts.
+    """
+    return zlib.crc32(session_id.encode("utf-8")) % workers
+
+
+async def _read_message(reader):
+    (length,) = _LENGTH.unpack(await reader.readexactly(_LENGTH.size))
+    return json.loads(await reader.readexactly(length))
+
+
+def _write_message(writer, message):
+    data = json.dumps(message, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    writer.write(_LENGTH.pack(len(data)) + data)
+
+
+class _Peer:
+    """
+    One end of a hub connection. Messages are queued without waiting and
+    written by a task that drains the socket after each one; when the
+    queue is full, new messages are dropped.
+    """
+
+    def __init__(self, writer, queue_size, name):
+        self.writer = writer
+        self.name = name
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.dropped = 0
+        self.task = asyncio.create_task(self._write())
+
+    def send(self, message):
+        """
+        Queue a message for the peer.
+
+        Returns:
+            bool: False if the queue was full and the message was dropped.
+        """
+        try:
+            self.queue.put_nowait(message)
+            return True
+        except asyncio.QueueFull:
+            self.dropped += 1
+            logger.warning(f"Queue to {self.name} full, dropping a {message['type']} message")
+            return False
+
+    async def _write(self):
+        try:
+            while True:
+                message = await self.queue.get()
+                _write_message(self.writer, message)
+                await self.writer.drain()
+        except ConnectionError:
+            # The reading side notices as well and cleans up
+            pass
+
+    def close(self):
+        self.task.cancel()
+        self.writer.close()
+
+
+class ClusterHub:
+    """
+    Runs in the supervisor and relays messages between workers.
+    """
+
+    def __init__(self, workers, queue_size=1024):
+        """
+        Initialize the hub.
+
+        Args:
+            workers (int): Number of workers.
+            queue_size (int): Messages queued per worker connection.
+        """
+        self.workers = workers
+        self.queue_size = queue_size
+        self.peers = {}  # worker index -> _Peer
+        self._server = None
+        self.port = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def _handle(self, reader, writer):
+        peer = None
+        try:
+            hello = await _read_message(reader)
+            index = hello["worker"]
+            peer = self.peers[index] = _Peer(writer, self.queue_size, f"worker {index}")
+            while True:
+                message = await _read_message(reader)
+                kind = message["type"]
+                if kind == "broadcast":
+                    for other, other_peer in list(self.peers.items()):
+                        if other != index:
+                            other_peer.send(message)
+                elif kind in ("forward", "close"):
+                    owner = self.peers.get(session_owner(message["session"], self.workers))
+                    if owner is None:
+                        logger.warning(f"Owner of session {message['session']} is not connected, dropping message")
+                        continue
+                    owner.send(message)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            if peer is not None:
+                if self.peers.get(index) is peer:
+                    del self.peers[index]
+                peer.close()
+            else:
+                writer.close()
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        for peer in list(self.peers.values()):
+            peer.close()
+
+
+class ClusterLink:
+    """
+    Connects one worker's AgentServer to the hub.
+
+    AgentServer calls owns(), forward(), close_remote() and publish(); the
+    link delivers relayed broadcasts, forwarded messages and session
+    closes back to the server.
+    """
+
+    def __init__(self, server, index, workers, hub_port, queue_size=1024):
+        """
+        Initialize the link.
+
+        Args:
+            server (AgentServer): The worker's server.
+            index (int): This worker's index.
+            workers (int): Number of workers.
+            hub_port (int): Port of the supervisor's hub on 127.0.0.1.
+            queue_size (int): Messages queued for the hub.
+        """
+        self.server = server
+        self.index = index
+        self.workers = workers
+        self.hub_port = hub_port
+        self.queue_size = queue_size
+        self.relayed = 0
+        self.forwarded = 0
+        self._peer = None
+        self._task = None
+
+    async def connect(self):
+        reader, writer = await asyncio.open_connection("127.0.0.1", self.hub_port)
+        self._peer = _Peer(writer, self.queue_size, "the cluster hub")
+        self._peer.send({"type": "hello", "worker": self.index})
+        self._task = asyncio.create_task(self._receive(reader))
+
+    def owns(self, session_id):
+        return session_owner(session_id, self.workers) == self.index
+
+    def sequence(self, local_sequence):
+        """
+        Turn a worker's own broadcast sequence number into one that is
+        unique in the cluster.
+
+        Numbers from one worker keep increasing, and ``seq % workers`` is
+        the index of the worker that sent the frame.
+        """
+        return local_sequence * self.workers + self.index
+
+    def _send(self, message):
+        if self._peer is not None and not self._peer.writer.is_closing():
+            self._peer.send(message)
+
+    def forward(self, session_id, data):
+        self.forwarded += 1
+        self._send({"type": "forward", "session": session_id, "data": data})
+
+    def close_remote(self, session_id):
+        self._send({"type": "close", "session": session_id})
+
+    def publish(self, frame):
+        self._send({"type": "broadcast", "frame": frame})
+
+    async def _receive(self, reader):
+        try:
+            while True:
+                message = await _read_message(reader)
+                kind = message["type"]
+                if kind == "broadcast":
+                    self.relayed += 1
+                    self.server.broadcaster.publish(message["frame"])
+                elif kind == "forward":
+                    self.server.deliver(message["session"], message["data"])
+                elif kind == "close":
+                    state = self.server.sessions.get(message["session"])
+                    # Local connections may still be using the session
+                    if state is not None and not state.websockets:
+                        self.server.close_session(message["session"])
+        except (asyncio.IncompleteReadError, ConnectionError):
+            logger.warning("Lost connection to the cluster hub")
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+        if self._peer is not None:
+            self._peer.close()
+
+
+def worker_config(config, index, workers):
+    """
+    Derive a worker's configuration from the cluster configuration.
+
+    The rate limit budget is split between the workers, each worker gets
+    its own conversation store directory (sessions always land on the same
+    worker, so their history is found again after a restart) and metrics
+    ports are numbered from the configured one.
+    """
+    changes = {
+        "requests_per_minute": max(1, config.requests_per_minute // workers),
+        "tokens_per_minute": max(1, config.tokens_per_minute // workers),
+    }
+    if config.conversation_store_path:
+        changes["conversation_store_path"] = os.path.join(config.conversation_store_path, f"worker-{index}")
+    if config.metrics_port is not None:
+        changes["metrics_port"] = config.metrics_port + index
+    return dataclasses.replace(config, **changes)
+
+
+async def run_worker(config, index, workers, host, port, hub_port):
+    """
+    Run one worker: an AgentServer sharing the listening port with the others.
+    """
+    from metrics import MetricsServer
+    from websocket_server import AgentServer
+
+    agent_server = AgentServer(config)
+    if sys.platform != "win32":
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, agent_server.stop)
+
+    agent_server.start()
+    link = ClusterLink(agent_server, index, workers, hub_port, config.cluster_queue_size)
+    await link.connect()
+    agent_server.cluster = link
+
+    server = await serve(
+        agent_server.handler, host, port,
+        subprotocols=SUBPROTOCOLS,
+        compression="deflate" if config.wire_transport_compression else None,
+        max_size=config.wire_max_frame_size,
+        reuse_port=True,
+    )
+    metrics_server = None
+    if config.metrics_port is not None:
+        metrics_server = MetricsServer(host=config.metrics_host, port=config.metrics_port)
+        await metrics_server.start()
+
+    try:
+        while agent_server.running:
+            await asyncio.sleep(1)
+    finally:
+        server.close()
+        await server.wait_closed()
+        await link.close()
+        await agent_server.shutdown()
+        if metrics_server:
+            await metrics_server.stop()
+
+
+def _worker_entry(config, index, workers, host, port, hub_port):
+    logging.basicConfig(level=logging.WARNING)
+    try:
+        asyncio.run(run_worker(config, index, workers, host, port, hub_port))
+    except KeyboardInterrupt:
+        pass
+
+
+class Supervisor:
+    """
+    Starts the hub and the worker processes and restarts workers that exit
+    unexpectedly.
+    """
+
+    def __init__(self, config, host="localhost", port=8765, workers=None):
+        """
+        Initialize the supervisor.
+
+        Args:
+            config (GeminiConfig): Configuration for the cluster.
+            host (str): Address to listen on.
+            port (int): Port shared by every worker.
+            workers (int, optional): Number of workers; defaults to
+                ``config.server_workers``.
+        """
+        if not hasattr(socket, "SO_REUSEPORT"):
+            raise RuntimeError("Multi-process mode needs SO_REUSEPORT, which this platform lacks")
+        self.config = config
+        self.host = host
+        self.port = port
+        self.workers = workers or config.server_workers
+        self.hub = ClusterHub(self.workers, config.cluster_queue_size)
+        self.processes = {}
+        self.running = True
+        self._context = multiprocessing.get_context("spawn")
+
+    def _spawn(self, index):
+        process = self._context.Process(
+            target=_worker_entry,
+            args=(worker_config(self.config, index, self.workers), index, self.workers,
+                  self.host, self.port, self.hub.port),
+            name=f"agent-worker-{index}",
+            daemon=True,
+        )
+        process.start()
+        self.processes[index] = process
+
+    async def run(self):
+        await self.hub.start()
+        for index in range(self.workers):
+            self._spawn(index)
+        logger.info(f"Server started at ws://{self.host}:{self.port} with {self.workers} workers")
+        logger.info("Press Ctrl+C to stop the server")
+
+        if sys.platform != "win32":
+            loop = asyncio.get_running_loop()
+            for sig in (signal.SIGINT, signal.SIGTERM):
+                loop.add_signal_handler(sig, self.stop)
+        try:
+            while self.running:
+                await asyncio.sleep(1)
+                for index, process in list(self.processes.items()):
+                    if self.running and not process.is_alive():
+                        logger.error(f"Worker {index} exited with code {process.exitcode}, restarting")
+                        self._spawn(index)
+        finally:
+            await self.shutdown()
+
+    def stop(self):
+        self.running = False
+        logger.info("Server stopping...")
+
+    async def shutdown(self, timeout=10.0):
+        for process in self.processes.values():
+            if process.is_alive():
+                process.terminate()  # SIGTERM: the worker stops gracefully
+        deadline = time.monotonic() + timeout
+        for process in self.processes.values():
+            await asyncio.to_thread(process.join, max(0.0, deadline - time.monotonic()))
+            if process.is_alive():
+                process.kill()
+        await self.hub.stop()
+        logger.info("Server closed")
+
+
+def run_supervisor(config=None, host="localhost", port=8765, workers=None):
+    """
+    Run the multi-process server until interrupted.
+
+    Args:
+        config (GeminiConfig, optional): Configuration; the default if None.
+        host (str): Address to listen on.
+        port (int): Port shared by every worker.
+        workers (int, optional): Number of workers; ``config.server_workers``
+            if None.
+    """
+    supervisor = Supervisor(config or GeminiConfig.get_default_config(), host, port, workers)
+    asyncio.run(supervisor.run())
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    try:
+        run_supervisor()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,425 @@
+"""
+Runs many agent-to-agent dialogues concurrently.
+
+Every dialogue is a pair of agents taking turns on a shared history. All
+dialogues go through the same two AIAgent instances and therefore through
+the process-wide rate limiter, so hundreds of them share one request and
+token budget. Each turn sends the dialogue's history (recent turns plus a
+rolling summary); with ``chat_sessions_enabled`` a dialogue keeps its own
+chat session instead. At most
+``orchestrator_max_concurrent`` dialogues run at once; the others wait for
+a free slot. A dialogue ends after its turn limit or when a stop condition
+fires: an error reply, an empty reply, a stop phrase, an agent repeating
+its previous reply, its time budget or a custom check.
+
+Every turn is streamed to a JSONL transcript as it happens (written by a
+background thread, so a slow disk never stalls the dialogues), and a report
+with throughput, reply latency and token totals is produced at the end.
+
+    python orchestrator.py --dialogues 200 --turns 10 --latency 0.5
+    python orchestrator.py --backend gemini --dialogues 3 --transcript dialogues.jsonl
+"""
+import argparse
+import asyncio
+import dataclasses
+import json
+import logging
+import queue
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Optional
+from ai_agent import AIAgent
+from config import GeminiConfig
+from conversation_store import get_shared_store
+from history_manager import ConversationHistory
+from latency_stats import summarize
+from llm_backend import estimate_tokens
+from terminal_colors import TerminalColors
+
+DEFAULT_OPENING = "Hello, are you an AI agent? Let's discuss artificial intelligence."
+
+
+@dataclass
+class DialogueSpec:
+    """
+    One dialogue to run.
+    """
+
+    dialogue_id: str
+    opening: str = DEFAULT_OPENING
+    max_turns: Optional[int] = None  # Agent replies; orchestrator_max_turns if None
+    max_seconds: Optional[float] = None  # Wall-clock budget; None = no limit
+    stop_phrases: tuple = ()  # End the dialogue when a reply contains one of these
+
+
+@dataclass
+class DialogueResult:
+    """
+    Outcome of one dialogue.
+    """
+
+    dialogue_id: str
+    turns: int = 0
+    stop_reason: str = ""
+    elapsed: float = 0.0
+    reply_tokens: int = 0  # Estimated from the reply text
+    latencies: list = field(default_factory=list)
+
+
+class TranscriptWriter:
+    """
+    Appends transcript records to a JSONL file, one line per record.
+
+    Records are queued and written by a background thread, so the event
+    loop never waits for the disk. The file is line buffered, so every turn
+    is on disk shortly after it is written and a running transcript can be
+    followed with ``tail -f``.
+    """
+
+    _CLOSE = object()
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "a", encoding="utf-8", buffering=1)
+        self._queue = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._run, name="transcript-writer", daemon=True)
+        self._thread.start()
+        self.records = 0
+
+    def write(self, record):
+        """
+        Queue a record; returns without waiting for the file.
+        """
+        self._queue.put(record)
+
+    def _run(self):
+        while True:
+            record = self._queue.get()
+            if record is self._CLOSE:
+                break
+            line = json.dumps(record, ensure_ascii=False, separators=(",", ":"))
+            self._file.write(line + "\n")
+            self.records += 1
+        self._file.close()
+
+    def close(self):
+        """
+        Write the queued records and close the file. Blocks until done.
+        """
+        self._queue.put(self._CLOSE)
+        self._thread.join()
+
+
+class DialogueOrchestrator:
+    """
+    Schedules dialogues between two agents under the shared rate budget.
+    """
+
+    def __init__(self, config=None, agents=None, max_concurrent=None, transcript_path=None,
+                 stop_condition=None, on_turn=None):
+        """
+        Initialize the orchestrator.
+
+        Args:
+            config (GeminiConfig, optional): Configuration; the default if None.
+            agents (tuple, optional): The (first, second) AIAgent pair; two
+                agents are created from the configuration if None.
+            max_concurrent (int, optional): Dialogues running at once;
+                ``config.orchestrator_max_concurrent`` if None.
+            transcript_path (str, optional): JSONL transcript file;
+                ``config.orchestrator_transcript_path`` if None.
+            stop_condition (callable, optional): Called as
+                ``stop_condition(spec, history, reply)`` after every turn;
+                a non-empty return value ends the dialogue and is recorded
+                as its stop reason.
+            on_turn (callable, optional): Called as
+                ``on_turn(dialogue_id, agent, reply)`` after every turn.
+        """
+        self.config = config or GeminiConfig.get_default_config()
+        if agents is None:
+            agents = (
+                AIAgent("Agent-1", TerminalColors.BLUE, self.config),
+                AIAgent("Agent-2", TerminalColors.GREEN, self.config),
+            )
+        self.agents = agents
+        self.max_concurrent = max(1, max_concurrent or self.config.orchestrator_max_concurrent)
+        self.transcript_path = transcript_path or self.config.orchestrator_transcript_path
+        self.stop_condition = stop_condition
+        self.on_turn = on_turn
+        self.store = get_shared_store(self.config)
+        self.logger = logging.getLogger(__name__)
+        self.active = 0
+        self._transcript = None
+
+        if self.config.chat_sessions_enabled and self.max_concurrent > self.config.chat_session_max:
+            self.logger.warning(
+                f"{self.max_concurrent} concurrent dialogues exceed chat_session_max "
+                f"({self.config.chat_session_max}); sessions will be evicted and restarted"
+            )
+
+    def _record(self, record):
+        if self._transcript is not None:
+            self._transcript.write(record)
+
+    @staticmethod
+    def _normalize(text):
+        return " ".join(text.split())
+
+    def _stop_reason(self, spec, history, reply, previous_reply):
+        """
+        Return why a dialogue should end after a reply, or None to go on.
+        """
+        if reply.startswith("Error:"):
+            return "error"
+        if not reply:
+            return "empty_reply"
+        if any(phrase in reply for phrase in spec.stop_phrases):
+            return "stop_phrase"
+        if reply == previous_reply:
+            # The agent is going in circles; more turns won't change that
+            return "repetition"
+        if self.stop_condition is not None:
+            return self.stop_condition(spec, history, reply) or None
+        return None
+
+    async def run_dialogue(self, spec):
+        """
+        Run one dialogue to completion.
+
+        Args:
+            spec (DialogueSpec): The dialogue to run.
+
+        Returns:
+            DialogueResult: Turns taken, stop reason and reply latencies.
+        """
+        result = DialogueResult(spec.dialogue_id)
+        max_turns = spec.max_turns if spec.max_turns is not None else self.config.orchestrator_max_turns
+        started = time.perf_counter()
+        deadline = started + spec.max_seconds if spec.max_seconds is not None else None
+
+        history = ConversationHistory.from_config(self.config, self.store, spec.dialogue_id,
+                                                 summarizer=self.agents[0].summarize)
+        # A dialogue found in the conversation store carries on where it stopped
+        if history.total_turns == 0:
+            await history.aappend("user", spec.opening)
+            self._record({"type": "turn", "dialogue": spec.dialogue_id, "turn": 0, "speaker": "user",
+                          "content": spec.opening, "time": time.time()})
+
+        previous_replies = {}
+        try:
+            while True:
+                if result.turns >= max_turns:
+                    result.stop_reason = "max_turns"
+                    break
+                if deadline is not None and time.perf_counter() >= deadline:
+                    result.stop_reason = "timeout"
+                    break
+
+                index = result.turns % len(self.agents)
+                agent = self.agents[index]
+                speaker = f"agent-{index + 1}"
+                sent_at = time.perf_counter()
+                reply = self._normalize(await agent.achat(history, session_id=spec.dialogue_id))
+                latency = time.perf_counter() - sent_at
+
+                result.turns += 1
+                result.latencies.append(latency)
+                result.reply_tokens += estimate_tokens(reply)
+                self._record({"type": "turn", "dialogue": spec.dialogue_id, "turn": result.turns,
+                              "speaker": speaker, "content": reply, "latency": round(latency, 4),
+                              "time": time.time()})
+                if self.on_turn is not None:
+                    self.on_turn(spec.dialogue_id, agent, reply)
+
+                stop_reason = self._stop_reason(spec, history, reply, previous_replies.get(index))
+                if stop_reason not in ("error", "empty_reply"):
+                    await history.aappend(speaker, reply)
+                if stop_reason:
+                    result.stop_reason = stop_reason
+                    break
+                previous_replies[index] = reply
+        finally:
+            # Free the pool slots for the dialogues still waiting
+            for agent in self.agents:
+                agent.close_session(spec.dialogue_id)
+            result.elapsed = time.perf_counter() - started
+            self._record({"type": "end", "dialogue": spec.dialogue_id, "turns": result.turns,
+                          "stop_reason": result.stop_reason or "cancelled",
+                          "elapsed": round(result.elapsed, 4), "time": time.time()})
+        return result
+
+    async def _run_guarded(self, spec, slots):
+        async with slots:
+            self.active += 1
+            try:
+                return await self.run_dialogue(spec)
+            except Exception as e:
+                self.logger.error(f"Dialogue {spec.dialogue_id} failed: {e}")
+                return DialogueResult(spec.dialogue_id, stop_reason="exception")
+            finally:
+                self.active -= 1
+
+    def _usage(self):
+        totals = Counter()
+        for agent in self.agents:
+            totals.update(agent.usage)
+        return totals
+
+    async def run(self, specs):
+        """
+        Run dialogues concurrently and report on them.
+
+        Args:
+            specs (list): DialogueSpec objects; dialogue ids must be unique.
+
+        Returns:
+            dict: Aggregate report (see print_report), with the per-dialogue
+            results under "dialogue_results".
+        """
+        specs = list(specs)
+        if len({spec.dialogue_id for spec in specs}) != len(specs):
+            raise ValueError("Dialogue ids must be unique")
+        slots = asyncio.Semaphore(self.max_concurrent)
+        usage_before = self._usage()
+        if self.transcript_path:
+            self._transcript = TranscriptWriter(self.transcript_path)
+        started = time.perf_counter()
+        try:
+            results = await asyncio.gather(*(self._run_guarded(spec, slots) for spec in specs))
+        finally:
+            if self._transcript is not None:
+                await asyncio.to_thread(self._transcript.close)
+                self._transcript = None
+        elapsed = time.perf_counter() - started
+
+        usage = self._usage()
+        usage.subtract(usage_before)
+        turns = sum(result.turns for result in results)
+        billed = usage["prompt_tokens"] + usage["output_tokens"]
+        return {
+            "dialogues": len(results),
+            "max_concurrent": self.max_concurrent,
+            "backend": self.config.backend,
+            "turns": turns,
+            "elapsed_seconds": elapsed,
+            "throughput_turns_per_second": turns / elapsed if elapsed else 0.0,
+            "reply_latency": summarize([latency for result in results for latency in result.latencies]),
+            "dialogue_seconds": summarize([result.elapsed for result in results]),
+            "requests": usage["requests"],
+            "tokens": {
+                "prompt": usage["prompt_tokens"],
+                "output": usage["output_tokens"],
+                "cached": usage["cached_tokens"],
+                "total": billed,
+                "per_turn": billed / turns if turns else 0.0,
+                "per_second": billed / elapsed if elapsed else 0.0,
+                "estimated_reply": sum(result.reply_tokens for result in results),
+            },
+            "stop_reasons": dict(Counter(result.stop_reason for result in results)),
+            "transcript": self.transcript_path,
+            "dialogue_results": [dataclasses.asdict(result) for result in results],
+        }
+
+
+def run_dialogues(orchestrator, specs):
+    """
+    Run dialogues on a new event loop and return the report.
+
+    The loop gets a worker thread per concurrent dialogue; the default
+    executor would otherwise cap the model calls in flight at a few dozen.
+
+    Args:
+        orchestrator (DialogueOrchestrator): The orchestrator to use.
+        specs (list): DialogueSpec objects.
+
+    Returns:
+        dict: The report returned by DialogueOrchestrator.run.
+    """
+    executor = ThreadPoolExecutor(max_workers=orchestrator.max_concurrent, thread_name_prefix="dialogue")
+
+    async def main():
+        asyncio.get_running_loop().set_default_executor(executor)
+        return await orchestrator.run(specs)
+
+    try:
+        return asyncio.run(main())
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def print_report(report):
+    print(TerminalColors.colorize(
+        f"Orchestrator: {report['dialogues']} dialogues, {report['max_concurrent']} at once "
+        f"({report['backend']})",
+        TerminalColors.HEADER,
+    ))
+    print(f"Turns:             {report['turns']} in {report['elapsed_seconds']:.2f}s "
+          f"({report['throughput_turns_per_second']:.1f} turns/s)")
+    latency = report["reply_latency"]
+    if latency["count"]:
+        print(f"Reply latency:     p50 {latency['p50'] * 1000:.1f}ms  p95 {latency['p95'] * 1000:.1f}ms  "
+              f"p99 {latency['p99'] * 1000:.1f}ms  max {latency['max'] * 1000:.1f}ms")
+    tokens = report["tokens"]
+    print(f"Tokens:            {tokens['total']} billed ({tokens['prompt']} prompt, {tokens['output']} output, "
+          f"{tokens['cached']} cached) in {report['requests']} requests")
+    print(f"                   {tokens['per_turn']:.1f} per turn, {tokens['per_second']:.1f} per second")
+    reasons = ", ".join(f"{reason} {count}" for reason, count in sorted(report["stop_reasons"].items()))
+    failed = report["stop_reasons"].get("error", 0) + report["stop_reasons"].get("exception", 0)
+    color = TerminalColors.RED if failed else TerminalColors.GREEN
+    print(TerminalColors.colorize(f"Stop reasons:      {reasons}", color))
+    if report["transcript"]:
+        print(f"Transcript:        {report['transcript']}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run many LOLANG agent dialogues concurrently.")
+    parser.add_argument("--dialogues", type=int, default=100, help="Number of dialogues")
+    parser.add_argument("--turns", type=int, default=10, help="Agent replies per dialogue")
+    parser.add_argument("--concurrency", type=int, help="Dialogues running at once")
+    parser.add_argument("--max-seconds", type=float, help="Wall-clock budget per dialogue")
+    parser.add_argument("--stop-phrase", action="append", default=[], help="End a dialogue on this text")
+    parser.add_argument("--opening", default=DEFAULT_OPENING, help="First message of every dialogue")
+    parser.add_argument("--backend", default="stub", choices=["stub", "gemini"], help="LLM backend")
+    parser.add_argument("--latency", type=float, default=0.2, help="Stub backend seconds per request")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Extra random stub seconds per request")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Probability of an injected 429")
+    parser.add_argument("--transcript", help="Stream every turn to this JSONL file")
+    parser.add_argument("--json", dest="json_path", help="Write the report to this file")
+    args = parser.parse_args(argv)
+
+    config = dataclasses.replace(
+        GeminiConfig.get_default_config(),
+        backend=args.backend,
+        stub_latency=args.latency,
+        stub_jitter=args.jitter,
+        stub_error_rate=args.error_rate,
+        orchestrator_max_turns=args.turns,
+    )
+    if args.backend == "stub":
+        # The stub has no quota; measure the orchestrator, not the rate limiter
+        config.requests_per_minute = 10 ** 9
+        config.tokens_per_minute = 10 ** 9
+        config.rate_limit_backoff = 0.1
+
+    orchestrator = DialogueOrchestrator(config, max_concurrent=args.concurrency, transcript_path=args.transcript)
+    specs = [
+        DialogueSpec(f"dialogue-{number}", args.opening, max_seconds=args.max_seconds,
+                     stop_phrases=tuple(args.stop_phrase))
+        for number in range(1, args.dialogues + 1)
+    ]
+    report = run_dialogues(orchestrator, specs)
+
+    print_report(report)
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as report_file:
+            json.dump(report, report_file, indent=2)
+    return 1 if report["stop_reasons"].get("exception") else 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    sys.exit(main())
@@ -0,0 +1,278 @@
+"""
+Destinations for the console output of the server and clients.
+
+MessageVisualizer hands every line to a sink as a structured record plus
+a renderer for its colored terminal form. Writing never blocks the caller:
+
+- TerminalSink queues the line's renderer; a writer thread renders and
+  colors the queued lines and sends them to stdout in batches, so neither
+  formatting nor a slow terminal or pipe delays the event loop;
+- JsonlSink queues the records, and the same writer thread encodes them
+  as one JSON object per line (to stdout or a file), without rendering
+  anything;
+- NullSink drops everything.
+
+With ``output_mode = "auto"`` the terminal sink is used when stdout is a
+TTY; otherwise records are written as JSONL and nothing is rendered.
+"""
+import abc
+import atexit
+import json
+import logging
+import sys
+import threading
+import time
+from collections import deque
+
+
+class OutputSink:
+    """
+    Receives output records. The base class discards them.
+    """
+
+    def write(self, record, render=None, end="\n"):
+        """
+        Output one record.
+
+        Args:
+            record (dict or None): Structured form of the line; None for
+                terminal-only decoration such as separators.
+            render (callable or str, optional): Returns the terminal text;
+                only called by sinks that render.
+            end (str): Appended to the rendered text.
+        """
+
+    def flush(self, timeout=None):
+        """
+        Wait until everything written so far has been output.
+        """
+
+    def close(self):
+        """
+        Output what is still buffered and release the sink.
+        """
+
+
+class NullSink(OutputSink):
+    """
+    Discards all output.
+    """
+
+
+class BufferedSink(OutputSink, abc.ABC):
+    """
+    Base for sinks that write text to a stream from a background thread.
+
+    Lines are queued in memory, unformatted, and formatted and written in
+    batches by the thread: whatever has accumulated while the previous
+    write was in progress goes out in one call. When more than
+    ``max_buffered`` lines are waiting, the oldest are dropped and a notice
+    says how many. Subclasses define how a queued item and the notice are
+    turned into text.
+    """
+
+    def __init__(self, stream=None, max_buffered=10000):
+        """
+        Initialize the sink.
+
+        Args:
+            stream (file, optional): Text stream to write to; the current
+                ``sys.stdout`` if None.
+            max_buffered (int): Lines kept while the stream is slow.
+        """
+        self.stream = stream
+        self.max_buffered = max(1, max_buffered)
+        self.logger = logging.getLogger(__name__)
+        self._buffer = deque()
+        self._condition = threading.Condition()
+        self._thread = None
+        self._writing = False
+        self._closed = False
+        self._pending_drops = 0
+        self.dropped = 0
+        self.batches = 0
+
+    def _put(self, item):
+        with self._condition:
+            if self._closed:
+                return
+            if len(self._buffer) >= self.max_buffered:
+                self._buffer.popleft()
+                self._pending_drops += 1
+                self.dropped += 1
+            self._buffer.append(item)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="output-sink", daemon=True)
+                self._thread.start()
+            self._condition.notify()
+
+    @abc.abstractmethod
+    def _format(self, item):
+        """
+        Return the text for a queued item; called on the writer thread.
+        """
+
+    @abc.abstractmethod
+    def _drop_notice(self, count):
+        """
+        Return the text that reports ``count`` dropped lines.
+        """
+
+    def _render(self, batch, drops):
+        parts = [self._drop_notice(drops)] if drops else []
+        for item in batch:
+            try:
+                parts.append(self._format(item))
+            except Exception as e:
+                # One bad line must not stop the writer thread
+                self.logger.error(f"Could not format output: {e}")
+        return "".join(parts)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._buffer and not self._closed:
+                    self._condition.wait()
+                if not self._buffer:
+                    return
+                batch = list(self._buffer)
+                self._buffer.clear()
+                drops, self._pending_drops = self._pending_drops, 0
+                self._writing = True
+            try:
+                text = self._render(batch, drops)
+                stream = self.stream or sys.stdout
+                stream.write(text)
+                stream.flush()
+                self.batches += 1
+            except (OSError, ValueError) as e:
+                # A closed pipe or file; there is nowhere left to write to
+                self.logger.debug(f"Output dropped: {e}")
+            finally:
+                with self._condition:
+                    self._writing = False
+                    self._condition.notify_all()
+
+    def flush(self, timeout=None):
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        with self._condition:
+            while self._buffer or self._writing:
+                remaining = deadline - time.monotonic() if deadline is not None else None
+                if remaining is not None and remaining <= 0:
+                    return
+                self._condition.wait(remaining)
+
+    def close(self, timeout=5.0):
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+            thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+
+
+class TerminalSink(BufferedSink):
+    """
+    Renders records as colored text for a terminal.
+    """
+
+    def write(self, record, render=None, end="\n"):
+        if render is None:
+            return
+        self._put((render, end))
+
+    def _format(self, item):
+        render, end = item
+        return (render() if callable(render) else render) + end
+
+    def _drop_notice(self, count):
+        return f"\n[{count} lines dropped: output too slow]\n"
+
+
+class JsonlSink(BufferedSink):
+    """
+    Writes records as JSON lines, for log collectors and other headless use.
+
+    Streamed chunks are skipped by default: the complete message follows
+    as its own record.
+    """
+
+    def __init__(self, stream=None, max_buffered=10000, include_deltas=False, path=None):
+        """
+        Initialize the sink.
+
+        Args:
+            stream (file, optional): Text stream to write to; the current
+                ``sys.stdout`` if None.
+            max_buffered (int): Records kept while the stream is slow.
+            include_deltas (bool): Also write streamed chunks.
+            path (str, optional): File to append to instead of a stream.
+        """
+        self._file = open(path, "a", encoding="utf-8") if path else None
+        super().__init__(self._file or stream, max_buffered)
+        self.include_deltas = include_deltas
+
+    def write(self, record, render=None, end="\n"):
+        if record is None or (record.get("type") == "delta" and not self.include_deltas):
+            return
+        self._put(dict(record, ts=round(time.time(), 6)))
+
+    def _format(self, record):
+        return json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n"
+
+    def close(self, timeout=5.0):
+        super().close(timeout)
+        if self._file is not None:
+            self._file.close()
+
+    def _drop_notice(self, count):
+        return json.dumps({"type": "dropped", "count": count, "ts": round(time.time(), 6)}) + "\n"
+
+
+def create_output_sink(mode="auto", path=None, max_buffered=10000):
+    """
+    Create a sink.
+
+    Args:
+        mode (str): "terminal", "jsonl", "none", or "auto" for the terminal
+            sink on a TTY and JSONL otherwise.
+        path (str, optional): File for JSONL output; stdout if None.
+        max_buffered (int): Lines kept while the output is slow.
+
+    Returns:
+        OutputSink: The sink.
+    """
+    if mode == "auto":
+        isatty = getattr(sys.stdout, "isatty", None)
+        mode = "terminal" if isatty is not None and isatty() else "jsonl"
+    if mode == "terminal":
+        return TerminalSink(max_buffered=max_buffered)
+    if mode == "jsonl":
+        return JsonlSink(max_buffered=max_buffered, path=path)
+    if mode == "none":
+        return NullSink()
+    raise ValueError(f"Unknown output mode: {mode}")
+
+
+_shared_sinks = {}
+_shared_lock = threading.Lock()
+
+
+def get_output_sink(config):
+    """
+    Return the process-wide output sink for a configuration.
+
+    Args:
+        config (GeminiConfig): The configuration holding the output settings.
+
+    Returns:
+        OutputSink: The shared sink; buffered output is written at exit.
+    """
+    key = (config.output_mode, config.output_path, config.output_buffer_lines)
+    with _shared_lock:
+        sink = _shared_sinks.get(key)
+        if sink is None:
+            sink = create_output_sink(*key)
+            atexit.register(sink.close)
+            _shared_sinks[key] = sink
+    return sink
@@ -0,0 +1,254 @@
+import atexit
+import json
+import logging
+import os
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+from decryption_cache import DecryptionCache
+
+
+class PhraseCodec:
+    """
+    Local, deterministic LOLANG decoder learned from observed decryptions.
+
+    Every (LOLANG, decrypted) pair returned by the LLM is recorded in a
+    template table where numbers, which LOLANG never encrypts, are
+    replaced by slots. "⟦LO-2⟧ X-REQ Room|𝟏𝟏𝑷𝑴⟩" and the same message at
+    𝟗𝑷𝑴 share a template, so once a template has been seen often enough
+    with one consistent English template, new messages with other numbers
+    are decoded locally by filling in the slots. Numbers that do not
+    appear in the decryption (such as the "2" of "LO-2") stay fixed and
+    must match exactly.
+
+    Messages seen verbatim are left to the DecryptionCache, which already
+    holds them with its TTL; the codec only stores templates. A lookup
+    that misses returns None and the caller falls back to the cache and
+    then the LLM.
+    """
+
+    _NUMBER = re.compile(r"\d+")
+    _SLOT = "\x00{}\x00"
+    _SLOT_PATTERN = re.compile("\x00(\\d+)\x00")
+    FORMAT_VERSION = 2
+
+    def __init__(self, min_support=2, max_entries=50_000, path=None, version=""):
+        """
+        Initialize an empty codec.
+
+        Args:
+            min_support (int): Agreeing observations needed before a template
+                is used to decode messages it has not seen verbatim.
+            max_entries (int): Capacity of the template table; the oldest
+                templates are dropped first.
+            path (str, optional): JSON file the tables are loaded from and
+                saved to.
+            version (str): Identifies the model and prompt the tables were
+                learned with; saved tables with another version are ignored.
+        """
+        self.min_support = max(1, min_support)
+        self.max_entries = max_entries
+        self.path = path
+        self.version = version
+        self.logger = logging.getLogger(__name__)
+        # Template key -> {(English template, fixed numbers): set of the
+        # slot values it was seen with, up to min_support of them}
+        self._templates = OrderedDict()
+        self._lock = threading.Lock()
+        self.template_hits = 0
+        self.misses = 0
+
+    @classmethod
+    def _template(cls, lolang_message):
+        """
+        Replace the numbers of a normalized LOLANG message with slots.
+
+        Returns:
+            tuple: (template key, list of the numbers as plain ASCII digits).
+        """
+        values = []
+
+        def slot(match):
+            # Stylized digits such as 𝟏𝟏 read as 11 in the decryption
+            values.append(unicodedata.normalize("NFKC", match.group()))
+            return cls._SLOT.format(len(values) - 1)
+
+        return cls._NUMBER.sub(slot, lolang_message), values
+
+    @classmethod
+    def _english_template(cls, decrypted, values):
+        """
+        Turn a decryption into a template with slots where the LOLANG
+        numbers appear.
+
+        Returns:
+            tuple or None: (English template, fixed numbers as a tuple of
+            (slot index, value) pairs), or None if a number cannot be placed
+            with certainty because it appears more than once.
+        """
+        template = decrypted.replace("\x00", "")
+        found = re.findall(r"\d+", template)
+        slots = {}
+        fixed = []
+        for index, value in enumerate(values):
+            occurrences = found.count(value)
+            if occurrences == 0:
+                fixed.append((index, value))
+            elif occurrences > 1 or value in slots:
+                return None
+            else:
+                slots[value] = cls._SLOT.format(index)
+        if not slots:
+            return None
+        english = re.sub(r"\d+", lambda match: slots.get(match.group(), match.group()), template)
+        return english, tuple(fixed)
+
+    def _put(self, key, observed):
+        self._templates[key] = observed
+        self._templates.move_to_end(key)
+        while len(self._templates) > self.max_entries:
+            self._templates.popitem(last=False)
+
+    def learn(self, lolang_message, decrypted):
+        """
+        Record a decryption produced by the LLM.
+
+        Args:
+            lolang_message (str): The LOLANG message.
+            decrypted (str): Its decryption.
+        """
+        normalized = DecryptionCache.normalize(lolang_message)
+        if not normalized or not decrypted:
+            return
+        key, values = self._template(normalized)
+        english = self._english_template(decrypted, values) if values else None
+        if english is None:
+            return
+        with self._lock:
+            observed = self._templates.get(key) or {}
+            seen = observed.setdefault(english, set())
+            # Support counts distinct messages, not repeats of the same one
+            if len(seen) < self.min_support:
+                seen.add(tuple(values))
+            self._put(key, observed)
+
+    def lookup(self, lolang_message):
+        """
+        Decode a message locally.
+
+        Args:
+            lolang_message (str): The LOLANG message.
+
+        Returns:
+            str or None: The decryption, or None if the codec is not confident.
+        """
+        key, values = self._template(DecryptionCache.normalize(lolang_message))
+        english = None
+        with self._lock:
+            observed = self._templates.get(key) if values else None
+            if observed:
+                matches = [
+                    (english, len(seen)) for (english, fixed), seen in observed.items()
+                    if all(values[index] == value for index, value in fixed)
+                ]
+                # Only trust templates that were seen often and never contradicted
+                if len(matches) == 1 and matches[0][1] >= self.min_support:
+                    english = matches[0][0]
+            if english is None:
+                self.misses += 1
+                return None
+            self.template_hits += 1
+        return self._SLOT_PATTERN.sub(lambda match: values[int(match.group(1))], english)
+
+    def stats(self):
+        """
+        Return usage statistics.
+
+        Returns:
+            dict: Hit and miss counts and the number of templates.
+        """
+        with self._lock:
+            return {
+                "template_hits": self.template_hits,
+                "misses": self.misses,
+                "templates": len(self._templates),
+            }
+
+    def load(self):
+        """
+        Load the tables saved at the codec's path, if any.
+        """
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, encoding="utf-8") as table_file:
+                data = json.load(table_file)
+        except (OSError, ValueError) as e:
+            self.logger.warning(f"Could not load phrase tables from {self.path}: {e}")
+            return
+        if data.get("format") != self.FORMAT_VERSION or data.get("version") != self.version:
+            return
+        with self._lock:
+            for key, observed in data.get("templates", []):
+                self._put(key, {
+                    (english, tuple(tuple(pair) for pair in fixed)): {tuple(values) for values in seen}
+                    for english, fixed, seen in observed
+                })
+
+    def save(self):
+        """
+        Save the tables to the codec's path, if one is set.
+        """
+        if not self.path:
+            return
+        with self._lock:
+            data = {
+                "format": self.FORMAT_VERSION,
+                "version": self.version,
+                "templates": [
+                    (key, [(english, fixed, sorted(seen)) for (english, fixed), seen in observed.items()])
+                    for key, observed in self._templates.items()
+                ],
+            }
+        temporary = f"{self.path}.tmp"
+        try:
+            with open(temporary, "w", encoding="utf-8") as table_file:
+                json.dump(data, table_file, ensure_ascii=False)
+            os.replace(temporary, self.path)
+        except OSError as e:
+            self.logger.warning(f"Could not save phrase tables to {self.path}: {e}")
+
+
+_shared_codecs = {}
+_shared_lock = threading.Lock()
+
+
+def get_shared_codec(config, version=""):
+    """
+    Return the process-wide phrase codec for a configuration.
+
+    Args:
+        config (GeminiConfig): The configuration holding the codec settings.
+        version (str): Model and prompt version the tables belong to.
+
+    Returns:
+        PhraseCodec or None: The shared codec, or None if it is disabled.
+    """
+    if not config.phrase_codec_enabled:
+        return None
+    key = (config.phrase_codec_path, version)
+    with _shared_lock:
+        codec = _shared_codecs.get(key)
+        if codec is None:
+            codec = PhraseCodec(
+                min_support=config.phrase_codec_min_support,
+                max_entries=config.phrase_codec_max_entries,
+                path=config.phrase_codec_path,
+                version=version,
+            )
+            codec.load()
+            if codec.path:
+                atexit.register(codec.save)
+            _shared_codecs[key] = codec
+    return codec
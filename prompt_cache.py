@@ -0,0 +1,162 @@
+import logging
+import threading
+import time
+from llm_backend import estimate_tokens
+from metrics import REGISTRY
+
+PREFIX_HITS = REGISTRY.counter("prompt_cache_hits_total", "Requests that reused a cached static prompt prefix")
+PREFIX_MISSES = REGISTRY.counter("prompt_cache_misses_total", "Requests that sent their static prompt prefix in full")
+PREFIX_SAVED_TOKENS = REGISTRY.counter("prompt_cache_saved_tokens_total", "Prefix tokens not sent again thanks to the cache")
+
+
+class _CachedPrefix:
+    def __init__(self):
+        self.handle = None
+        self.tokens = 0
+        self.cacheable = True
+        self.expires = 0.0
+        self.retry_at = 0.0
+        self.registering = False
+
+
+class PromptCache:
+    """
+    Registers static prompt prefixes with the backend once and reuses the
+    resulting cached-context handle for every request that starts with
+    them.
+
+    A prompt is split into its static prefix (the LOLANG rules, the
+    decryption instructions) and the dynamic remainder. When the backend
+    holds a cached context for the prefix, a chat is started on that
+    context and only the remainder is sent; otherwise the full prompt is
+    sent as before. Registration runs in a background thread, so a request
+    never waits for it, and is repeated shortly before the context expires.
+    Prefixes shorter than the backend's ``min_cached_tokens`` are never
+    registered.
+    """
+
+    # Re-register this many seconds before a cached context expires
+    REFRESH_MARGIN = 60.0
+
+    def __init__(self, backend, model_name, ttl=3600.0):
+        """
+        Initialize the cache.
+
+        Args:
+            backend (LLMBackend): The backend that stores the contexts.
+            model_name (str): The model the contexts are created for.
+            ttl (float): Seconds a cached context lives on the backend.
+        """
+        self.backend = backend
+        self.model_name = model_name
+        self.ttl = ttl
+        self.logger = logging.getLogger(__name__)
+        self._prefixes = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.saved_tokens = 0
+
+    def _handle(self, prefix):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._prefixes.get(prefix)
+            if entry is None:
+                entry = self._prefixes[prefix] = _CachedPrefix()
+                entry.tokens = estimate_tokens(prefix)
+                # Below the backend's minimum a context can never be created
+                entry.cacheable = entry.tokens >= self.backend.min_cached_tokens
+            if not entry.cacheable:
+                return None, 0
+            fresh = entry.handle is not None and now < entry.expires - self.REFRESH_MARGIN
+            if not fresh and not entry.registering and now >= entry.retry_at:
+                entry.registering = True
+                threading.Thread(target=self._register, args=(prefix, entry), daemon=True).start()
+            if entry.handle is not None and now < entry.expires:
+                return entry.handle, entry.tokens
+        return None, 0
+
+    def _register(self, prefix, entry):
+        handle = None
+        try:
+            handle = self.backend.create_cached_context(self.model_name, prefix, self.ttl)
+        except Exception as e:
+            self.logger.warning(f"Could not cache prompt prefix on {self.backend.name}: {e}")
+        with self._lock:
+            entry.registering = False
+            if handle is None:
+                # Unsupported or failed; don't ask again for a while
+                entry.retry_at = time.monotonic() + self.ttl
+                return
+            entry.handle = handle
+            entry.expires = time.monotonic() + self.ttl
+
+    def split(self, prompt, prefixes):
+        """
+        Split a prompt into a cached context and the text still to be sent.
+
+        Args:
+            prompt (str): The full prompt.
+            prefixes (iterable): The static prefixes the prompt may start with.
+
+        Returns:
+            tuple: (cached context handle or None, text to send). Without a
+            handle the text is the full prompt.
+        """
+        for prefix in prefixes:
+            if prefix and prompt.startswith(prefix):
+                handle, tokens = self._handle(prefix)
+                if handle is None:
+                    break
+                # Agents on many threads share one cache
+                with self._lock:
+                    self.hits += 1
+                    self.saved_tokens += tokens
+                PREFIX_HITS.inc()
+                PREFIX_SAVED_TOKENS.inc(tokens)
+                return handle, prompt[len(prefix):].lstrip("\n")
+        with self._lock:
+            self.misses += 1
+        PREFIX_MISSES.inc()
+        return None, prompt
+
+    def stats(self):
+        """
+        Return usage statistics.
+
+        Returns:
+            dict: Hits, misses, saved prefix tokens and cached prefixes.
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "saved_tokens": self.saved_tokens,
+                "cached_prefixes": sum(1 for entry in self._prefixes.values() if entry.handle is not None),
+            }
+
+
+_shared_caches = {}
+_shared_lock = threading.Lock()
+
+
+def get_prompt_cache(config, backend):
+    """
+    Return the process-wide prompt cache for a backend and model.
+
+    Args:
+        config (GeminiConfig): The configuration holding the cache settings.
+        backend (LLMBackend): The backend requests are sent through.
+
+    Returns:
+        PromptCache or None: The shared cache, or None if it is disabled.
+    """
+    if not config.prompt_cache_enabled:
+        return None
+    key = (id(backend), config.model_name)
+    with _shared_lock:
+        cache = _shared_caches.get(key)
+        if cache is None or cache.backend is not backend:
+            cache = PromptCache(backend, config.model_name, config.prompt_cache_ttl)
+            _shared_caches[key] = cache
+    return cache
@@ -0,0 +1,188 @@
+import asyncio
+import threading
+import time
+
+
+class TokenBucket:
+    """
+    A token bucket that refills continuously at ``capacity`` per minute.
+
+    The level may go negative: callers reserve what they need up front and
+    are told how long to wait for the debt to be repaid. This keeps waiting
+    callers in FIFO order without any queue bookkeeping.
+    """
+
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount, now):
+        """
+        Take ``amount`` from the bucket.
+
+        Returns:
+            float: Seconds until the bucket is back above zero.
+        """
+        self._refill(now)
+        self.level -= min(amount, self.capacity)
+        if self.level >= 0:
+            return 0.0
+        return -self.level / self.rate
+
+    def refund(self, amount, now):
+        self._refill(now)
+        self.level = min(self.capacity, self.level + amount)
+
+
+class RateLimiter:
+    """
+    Process-wide request and token budget shared by every agent and decryptor.
+
+    Callers only wait when the per-minute budget is exhausted. When any
+    caller hits a 429, report_rate_limited() pauses all of them together,
+    with the pause doubling on consecutive 429s until a call succeeds.
+    """
+
+    def __init__(self, requests_per_minute, tokens_per_minute, backoff=5.0, max_backoff=300.0):
+        """
+        Initialize the rate limiter.
+
+        Args:
+            requests_per_minute (int): Request budget per minute.
+            tokens_per_minute (int): Token budget per minute.
+            backoff (float): Pause in seconds after the first 429.
+            max_backoff (float): Upper bound for the shared pause.
+        """
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self._lock = threading.Lock()
+        self._paused_until = 0.0
+        self._consecutive_429s = 0
+
+    def _reserve(self, tokens):
+        with self._lock:
+            now = time.monotonic()
+            wait = max(
+                self.requests.reserve(1, now),
+                self.tokens.reserve(tokens, now),
+                self._paused_until - now,
+            )
+        return max(0.0, wait)
+
+    def acquire(self, tokens=1):
+        """
+        Block until a request of ``tokens`` tokens fits in the budget.
+
+        Returns:
+            float: Seconds spent waiting.
+        """
+        wait = self._reserve(tokens)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    async def acquire_async(self, tokens=1):
+        """
+        Asynchronous version of acquire that waits with asyncio.sleep.
+
+        Returns:
+            float: Seconds spent waiting.
+        """
+        wait = self._reserve(tokens)
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+    def try_acquire(self, tokens=1):
+        """
+        Take budget for a request only if it is available right away.
+
+        Returns:
+            bool: True if the request may be sent now.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self.requests._refill(now)
+            self.tokens._refill(now)
+            if (now < self._paused_until or self.requests.level < 1
+                    or self.tokens.level < min(tokens, self.tokens.capacity)):
+                return False
+            self.requests.reserve(1, now)
+            self.tokens.reserve(tokens, now)
+            return True
+
+    def pause_remaining(self):
+        """
+        Return the seconds left in the shared pause after a 429, or 0.
+        """
+        with self._lock:
+            return max(0.0, self._paused_until - time.monotonic())
+
+    def record_usage(self, estimated_tokens, actual_tokens):
+        """
+        Correct an earlier reservation once the real token count is known.
+
+        Args:
+            estimated_tokens (int): Tokens passed to acquire.
+            actual_tokens (int): Tokens the backend reported.
+        """
+        with self._lock:
+            now = time.monotonic()
+            delta = actual_tokens - estimated_tokens
+            if delta > 0:
+                self.tokens.reserve(delta, now)
+            elif delta < 0:
+                self.tokens.refund(-delta, now)
+
+    def report_success(self):
+        """
+        Reset the shared backoff after a successful call.
+        """
+        with self._lock:
+            self._consecutive_429s = 0
+
+    def report_rate_limited(self, retry_after=None):
+        """
+        Pause every caller after a 429 from the backend.
+
+        Args:
+            retry_after (float, optional): Server-provided delay in seconds.
+                If None, an exponential backoff is used.
+        """
+        with self._lock:
+            if retry_after is None:
+                retry_after = min(self.max_backoff, self.backoff * (2 ** self._consecutive_429s))
+            self._consecutive_429s += 1
+            self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(config):
+    """
+    Return the process-wide rate limiter for a configuration.
+
+    Args:
+        config (GeminiConfig): The configuration holding the budgets.
+
+    Returns:
+        RateLimiter: The limiter shared by every caller with the same budgets.
+    """
+    key = (config.requests_per_minute, config.tokens_per_minute,
+           config.rate_limit_backoff, config.rate_limit_max_backoff)
+    with _limiters_lock:
+        limiter = _limiters.get(key)
+        if limiter is None:
+            limiter = RateLimiter(*key)
+            _limiters[key] = limiter
+    return limiter
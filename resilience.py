@@ -0,0 +1,569 @@
+"""
+Shared retry, circuit breaker and request hedging for LLM calls.
+
+AIAgent and LolangDecryptor send every request through a Resilience
+instance instead of their own retry loops:
+
+- errors are classified from their HTTP status or exception type
+  (rate limited, transient or fatal) rather than from their message;
+- rate-limited and transient errors are retried, but a call never spends
+  more than ``retry_deadline`` seconds retrying, and gives up at once if
+  the shared 429 pause would outlast the deadline;
+- a circuit breaker per backend opens after ``circuit_failure_threshold``
+  consecutive transient failures and rejects calls immediately until a
+  probe request succeeds after ``circuit_reset_timeout`` seconds;
+- with ``hedge_enabled``, a request that has not answered after the
+  ``hedge_percentile`` latency of recent requests is sent a second time
+  if the rate budget allows it right away, and the first reply wins.
+  Only requests that are safe to repeat (one-shot chats) are hedged;
+- a request whose caller stopped waiting for it (the deadline passed, the
+  caller was cancelled or a hedge won) keeps running in its thread until
+  the backend answers. Such requests are counted as abandoned, and while
+  ``retry_max_abandoned`` of them are still running new calls wait, so
+  the threads and backend connections in use never exceed the limits
+  the callers think they enforce.
+"""
+import asyncio
+import logging
+import random
+import threading
+import time
+from collections import deque
+from latency_stats import percentile
+from metrics import LLM_FAILURES, LLM_RATE_LIMITED, LLM_REQUESTS, LLM_RETRIES, REGISTRY
+from rate_limiter import get_rate_limiter
+
+CIRCUIT_REJECTIONS = REGISTRY.counter("llm_circuit_rejections_total", "Calls rejected while the circuit was open")
+HEDGED_REQUESTS = REGISTRY.counter("llm_hedged_requests_total", "Duplicate requests sent for slow calls")
+HEDGE_WINS = REGISTRY.counter("llm_hedge_wins_total", "Hedged calls answered by the duplicate first")
+ABANDONED_REQUESTS = REGISTRY.counter(
+    "llm_abandoned_requests_total", "Requests left running after their caller stopped waiting"
+)
+
+RATE_LIMITED = "rate_limited"
+TRANSIENT = "transient"
+FATAL = "fatal"
+
+_TRANSIENT_STATUS = {408, 500, 502, 503, 504}
+# google.api_core exception names, matched without importing the package
+_RATE_LIMITED_NAMES = {"ResourceExhausted", "TooManyRequests"}
+_TRANSIENT_NAMES = {"ServiceUnavailable", "DeadlineExceeded", "InternalServerError",
+                    "BadGateway", "GatewayTimeout", "Aborted"}
+
+
+class CircuitOpenError(Exception):
+    """
+    Raised instead of sending a request while the backend is considered down.
+    """
+
+
+def _status(error):
+    for attribute in ("code", "status_code"):
+        value = getattr(error, attribute, None)
+        if isinstance(value, int):
+            return value
+    status = getattr(getattr(error, "response", None), "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+def classify_error(error):
+    """
+    Classify an error raised by a backend call.
+
+    Args:
+        error (Exception): The error.
+
+    Returns:
+        str: RATE_LIMITED, TRANSIENT (worth retrying) or FATAL.
+    """
+    if isinstance(error, CircuitOpenError):
+        return FATAL
+    status = _status(error)
+    names = {cls.__name__ for cls in type(error).__mro__}
+    if status == 429 or names & _RATE_LIMITED_NAMES:
+        return RATE_LIMITED
+    if status in _TRANSIENT_STATUS or names & _TRANSIENT_NAMES \
+            or isinstance(error, (TimeoutError, ConnectionError)):
+        return TRANSIENT
+    return FATAL
+
+
+class CircuitBreaker:
+    """
+    Fails calls fast while a backend keeps failing.
+
+    Closed: calls go through. After ``failure_threshold`` consecutive
+    failures the circuit opens and calls are rejected for
+    ``reset_timeout`` seconds. Then a single probe call is let through;
+    its success closes the circuit, its failure opens it again.
+    """
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30.0):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self.logger = logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+        self.rejected = 0
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if self._probing or time.monotonic() - self._opened_at >= self.reset_timeout:
+                return "half_open"
+            return "open"
+
+    def allow(self):
+        """
+        Raise CircuitOpenError unless a call may be sent now.
+        """
+        with self._lock:
+            if self._opened_at is None:
+                return
+            remaining = self._opened_at + self.reset_timeout - time.monotonic()
+            if remaining <= 0 and not self._probing:
+                self._probing = True
+                return
+            self.rejected += 1
+        CIRCUIT_REJECTIONS.inc()
+        raise CircuitOpenError(
+            f"Circuit open for the {self.name} backend after repeated failures; "
+            f"next attempt in {max(0.0, remaining):.1f}s"
+        )
+
+    def record_success(self):
+        with self._lock:
+            if self._opened_at is not None:
+                self.logger.info(f"Circuit for the {self.name} backend closed")
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._probing or (self._opened_at is None and self._failures >= self.failure_threshold):
+                self.logger.warning(f"Circuit for the {self.name} backend opened after {self._failures} failures")
+                self._opened_at = time.monotonic()
+            self._probing = False
+
+    def release(self):
+        """
+        End a probe call that neither succeeded nor failed for the backend
+        (rate limited or rejected as a bad request).
+        """
+        with self._lock:
+            self._probing = False
+
+
+class LatencyWindow:
+    """
+    Latencies of recent successful requests, for the hedging threshold.
+    """
+
+    def __init__(self, size=200):
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, q, min_samples):
+        """
+        Return the q-th percentile, or None with fewer than min_samples samples.
+        """
+        with self._lock:
+            if len(self._samples) < min_samples:
+                return None
+            samples = list(self._samples)
+        return percentile(samples, q)
+
+
+class _Call:
+    __slots__ = ("deadline", "attempts", "transient_failures", "attempt_started")
+
+    def __init__(self, deadline):
+        self.deadline = deadline
+        self.attempts = 0
+        self.transient_failures = 0
+        self.attempt_started = 0.0
+
+
+class _Request:
+    """
+    One request sent from a worker thread.
+    """
+
+    __slots__ = ("started", "finished", "abandoned", "skipped")
+
+    def __init__(self):
+        self.started = False
+        self.finished = False
+        self.abandoned = False
+        self.skipped = False
+
+
+class Resilience:
+    """
+    Sends requests with classified retries, a total deadline, a circuit
+    breaker and optional hedging.
+
+    call() and call_sync() cover the common case of one blocking request
+    function. Callers with their own request flow (streaming) use begin(),
+    acquire_async(), succeeded() and retry_delay() directly.
+    """
+
+    # Seconds between checks while too many abandoned requests are running
+    ABANDONED_POLL = 0.05
+
+    def __init__(self, rate_limiter, breaker, max_attempts=10, deadline=120.0, base_delay=0.5,
+                 max_delay=10.0, hedge=False, hedge_percentile=95.0, hedge_min_samples=20,
+                 max_abandoned=8):
+        """
+        Initialize the resilience layer.
+
+        Args:
+            rate_limiter (RateLimiter): The shared request and token budget.
+            breaker (CircuitBreaker): The breaker of the backend.
+            max_attempts (int): Attempts per call, including the first.
+            deadline (float): Seconds a call may spend from its first
+                attempt until it gives up.
+            base_delay (float): Backoff after the first transient error;
+                doubles with every further one.
+            max_delay (float): Upper bound for the transient backoff.
+            hedge (bool): Send a duplicate of slow requests that are safe
+                to repeat.
+            hedge_percentile (float): Latency percentile after which the
+                duplicate is sent.
+            hedge_min_samples (int): Successful requests observed before
+                hedging starts.
+            max_abandoned (int): Abandoned requests that may still be
+                running before new calls wait for them; 0 for no limit.
+        """
+        self.rate_limiter = rate_limiter
+        self.breaker = breaker
+        self.max_attempts = max(1, max_attempts)
+        self.deadline = deadline
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.max_abandoned = max(0, max_abandoned)
+        self.latencies = LatencyWindow()
+        self.logger = logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        self._abandoned = 0
+
+    @property
+    def abandoned(self):
+        """
+        Requests still running although their caller stopped waiting.
+        """
+        with self._lock:
+            return self._abandoned
+
+    def _over_abandoned_limit(self):
+        return self.max_abandoned and self.abandoned >= self.max_abandoned
+
+    def begin(self):
+        """
+        Start tracking a call; pass the result to the other methods.
+        """
+        return _Call(None)
+
+    def _before_attempt(self, call):
+        if call.deadline is None:
+            # The deadline covers retries, not the wait for budget before the first attempt
+            call.deadline = time.monotonic() + self.deadline
+        call.attempts += 1
+        call.attempt_started = time.perf_counter()
+        LLM_REQUESTS.inc()
+
+    async def acquire_async(self, call, estimated_tokens):
+        """
+        Wait for rate budget and admit the next attempt of a call.
+
+        The breaker is checked first, so a rejected call uses no budget.
+
+        Raises:
+            CircuitOpenError: The backend is considered down.
+        """
+        while self._over_abandoned_limit():
+            await asyncio.sleep(self.ABANDONED_POLL)
+        self.breaker.allow()
+        await self.rate_limiter.acquire_async(estimated_tokens)
+        self._before_attempt(call)
+
+    def acquire(self, call, estimated_tokens):
+        """
+        Blocking version of acquire_async.
+        """
+        while self._over_abandoned_limit():
+            time.sleep(self.ABANDONED_POLL)
+        self.breaker.allow()
+        self.rate_limiter.acquire(estimated_tokens)
+        self._before_attempt(call)
+
+    def remaining(self, call):
+        """
+        Return the seconds left before a call's deadline.
+        """
+        if call.deadline is None:
+            return self.deadline
+        return call.deadline - time.monotonic()
+
+    def succeeded(self, call):
+        """
+        Record a successful attempt.
+        """
+        self.breaker.record_success()
+        self.latencies.add(time.perf_counter() - call.attempt_started)
+
+    def retry_delay(self, call, error, retryable=True):
+        """
+        Record a failed attempt and decide whether to retry it.
+
+        Args:
+            call: The call returned by begin().
+            error (Exception): The error of the attempt.
+            retryable (bool): False if the request cannot be repeated
+                regardless of the error (a stream that already yielded).
+
+        Returns:
+            float or None: Seconds to wait before the next attempt, or None
+            to give up and raise the error.
+        """
+        if isinstance(error, CircuitOpenError):
+            return None
+        kind = classify_error(error)
+        if kind == TRANSIENT:
+            self.breaker.record_failure()
+            call.transient_failures += 1
+        else:
+            self.breaker.release()
+
+        delay = None
+        if retryable and call.attempts < self.max_attempts:
+            if kind == RATE_LIMITED:
+                LLM_RATE_LIMITED.inc()
+                # Slow every caller down; the next acquire waits it out
+                self.rate_limiter.report_rate_limited(getattr(error, "retry_after", None))
+                delay = 0.0
+                wait = self.rate_limiter.pause_remaining()
+            elif kind == TRANSIENT:
+                backoff = min(self.max_delay, self.base_delay * (2 ** (call.transient_failures - 1)))
+                delay = wait = backoff / 2 + random.uniform(0, backoff / 2)
+            if delay is not None and wait >= self.remaining(call):
+                self.logger.warning(f"Giving up after {call.attempts} attempts: retry deadline reached")
+                delay = None
+        if delay is None:
+            LLM_FAILURES.inc()
+        else:
+            LLM_RETRIES.inc()
+        return delay
+
+    def _run_request(self, send, request):
+        with self._lock:
+            if request.skipped:
+                # Its caller gave up before a thread was free; don't send it at all
+                return None
+            request.started = True
+        try:
+            return send()
+        finally:
+            with self._lock:
+                request.finished = True
+                if request.abandoned:
+                    self._abandoned -= 1
+
+    def _abandon(self, requests):
+        """
+        Account for the requests of an attempt that nobody waits for any more.
+        """
+        with self._lock:
+            for request in requests:
+                if not request.started:
+                    request.skipped = True
+                elif not request.finished and not request.abandoned:
+                    request.abandoned = True
+                    self._abandoned += 1
+                    ABANDONED_REQUESTS.inc()
+
+    def _submit(self, loop, executor, send, requests):
+        request = _Request()
+        requests.append(request)
+        future = loop.run_in_executor(executor, self._run_request, send, request)
+        # Retrieve the outcome of a request nobody awaits, so it is not logged
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        return future
+
+    async def _send_async(self, call, send, hedge_send, estimated_tokens, executor, requests):
+        loop = asyncio.get_running_loop()
+        primary = self._submit(loop, executor, send, requests)
+        threshold = None
+        if self.hedge and hedge_send is not None:
+            threshold = self.latencies.percentile(self.hedge_percentile, self.hedge_min_samples)
+        if threshold is None or threshold >= self.remaining(call):
+            return await primary
+
+        done, _ = await asyncio.wait({primary}, timeout=threshold)
+        if done or not self.rate_limiter.try_acquire(estimated_tokens):
+            return await primary
+        HEDGED_REQUESTS.inc()
+        LLM_REQUESTS.inc()
+        backup = self._submit(loop, executor, hedge_send, requests)
+        pending = {primary, backup}
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if task is backup:
+                        HEDGE_WINS.inc()
+                    # The slower request still finishes in its thread and is counted as abandoned
+                    return task.result()
+        raise primary.exception()
+
+    async def call(self, send, estimated_tokens, hedge_send=None, executor=None):
+        """
+        Send a request, retrying it as needed.
+
+        Args:
+            send (callable): Blocking function that performs one request
+                and returns the response; run in a worker thread.
+            estimated_tokens (int): Tokens to reserve from the rate budget.
+            hedge_send (callable, optional): Function sending an equivalent
+                request that is safe to run alongside ``send``; enables
+                hedging for this call.
+            executor (Executor, optional): Where the requests run; the
+                loop's default executor if None.
+
+        Returns:
+            The backend response.
+
+        Raises:
+            Exception: The last error once the call gives up.
+        """
+        call = self.begin()
+        while True:
+            requests = []
+            try:
+                await self.acquire_async(call, estimated_tokens)
+                response = await asyncio.wait_for(
+                    self._send_async(call, send, hedge_send, estimated_tokens, executor, requests),
+                    max(0.0, self.remaining(call)),
+                )
+            except Exception as e:
+                self._abandon(requests)
+                delay = self.retry_delay(call, e)
+                if delay is None:
+                    raise
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                continue
+            except BaseException:
+                # Cancelled: the requests in flight keep their threads busy
+                self._abandon(requests)
+                raise
+            self._abandon(requests)
+            self.succeeded(call)
+            return response
+
+    def call_sync(self, send, estimated_tokens):
+        """
+        Blocking version of call(), without hedging.
+
+        A request that is already running is not interrupted at the
+        deadline; only further retries are cut short.
+        """
+        call = self.begin()
+        while True:
+            try:
+                self.acquire(call, estimated_tokens)
+                response = send()
+            except Exception as e:
+                delay = self.retry_delay(call, e)
+                if delay is None:
+                    raise
+                if delay > 0:
+                    time.sleep(delay)
+                continue
+            self.succeeded(call)
+            return response
+
+
+_breakers = {}
+_resilience = {}
+_shared_lock = threading.Lock()
+
+
+def get_circuit_breaker(config, backend):
+    """
+    Return the process-wide circuit breaker for a backend.
+
+    Args:
+        config (GeminiConfig): The configuration holding the breaker settings.
+        backend (LLMBackend): The backend the breaker guards.
+
+    Returns:
+        CircuitBreaker: The breaker shared by every caller of the backend.
+    """
+    key = (id(backend), config.circuit_failure_threshold, config.circuit_reset_timeout)
+    with _shared_lock:
+        breaker = _breakers.get(key)
+        if breaker is None:
+            breaker = CircuitBreaker(backend.name, config.circuit_failure_threshold, config.circuit_reset_timeout)
+            _breakers[key] = breaker
+    return breaker
+
+
+def get_resilience(config, backend, operation):
+    """
+    Return the process-wide resilience layer for one kind of request.
+
+    Generation and decryption requests keep separate latency windows, so
+    each is hedged against its own percentile, but share the backend's
+    circuit breaker and the rate limiter.
+
+    Args:
+        config (GeminiConfig): The configuration holding the retry settings.
+        backend (LLMBackend): The backend requests are sent to.
+        operation (str): The kind of request, such as "generation".
+
+    Returns:
+        Resilience: The shared instance.
+    """
+    rate_limiter = get_rate_limiter(config)
+    breaker = get_circuit_breaker(config, backend)
+    key = (id(backend), operation, id(rate_limiter), config.retry_max_attempts, config.retry_deadline,
+           config.retry_base_delay, config.retry_max_delay, config.hedge_enabled,
+           config.hedge_percentile, config.hedge_min_samples, config.retry_max_abandoned)
+    with _shared_lock:
+        resilience = _resilience.get(key)
+        if resilience is None:
+            resilience = Resilience(
+                rate_limiter,
+                breaker,
+                max_attempts=config.retry_max_attempts,
+                deadline=config.retry_deadline,
+                base_delay=config.retry_base_delay,
+                max_delay=config.retry_max_delay,
+                hedge=config.hedge_enabled,
+                hedge_percentile=config.hedge_percentile,
+                hedge_min_samples=config.hedge_min_samples,
+                max_abandoned=config.retry_max_abandoned,
+            )
+            _resilience[key] = resilience
+    return resilience
+
+
+REGISTRY.gauge(
+    "llm_abandoned_requests", "Requests still running after their caller stopped waiting",
+    lambda: sum(resilience.abandoned for resilience in list(_resilience.values())),
+)
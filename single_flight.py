@@ -0,0 +1,145 @@
+import asyncio
+import threading
+from metrics import REGISTRY
+
+SHARED_CALLS = REGISTRY.counter("single_flight_shared_total", "Calls that joined an identical call already in flight")
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = []  # (loop, future) of async callers that joined
+
+
+def _resolve(future, call):
+    if future.done():
+        return
+    if isinstance(call.error, asyncio.CancelledError):
+        future.cancel()
+    elif call.error is not None:
+        future.set_exception(call.error)
+    else:
+        future.set_result(call.result)
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent identical calls into one in-flight call.
+
+    The first caller for a key starts the work; callers arriving while it
+    is still running wait for the same result instead of repeating the
+    request. Once the call finishes the key is forgotten, so later callers
+    start a fresh call (by then the result is usually cached).
+
+    do() and do_sync() share one table, so async callers on any event loop
+    and blocking callers in threads all join the same call. An async call
+    runs as its own task, so a caller that is cancelled does not cancel the
+    call for everyone else. do_sync() must not be called on the thread of
+    an event loop that may be running the call it would wait for.
+    """
+
+    def __init__(self):
+        self._calls = {}  # key -> _Call
+        self._lock = threading.Lock()
+        self.shared = 0
+
+    def _join(self, key, loop=None):
+        # Returns (call, leader, future); followers on a loop get a future
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = self._calls[key] = _Call()
+                return call, True, None
+            self.shared += 1
+            SHARED_CALLS.inc()
+            future = None
+            if loop is not None:
+                future = loop.create_future()
+                call.waiters.append((loop, future))
+            return call, False, future
+
+    def _finish(self, key, call, result=None, error=None):
+        with self._lock:
+            self._calls.pop(key, None)
+            call.result = result
+            call.error = error
+            call.done.set()
+            waiters, call.waiters = call.waiters, []
+        for loop, future in waiters:
+            try:
+                loop.call_soon_threadsafe(_resolve, future, call)
+            except RuntimeError:
+                # That caller's loop has been closed
+                pass
+
+    def _task_done(self, key, call, task):
+        if task.cancelled():
+            self._finish(key, call, error=asyncio.CancelledError())
+        elif task.exception() is not None:
+            self._finish(key, call, error=task.exception())
+        else:
+            self._finish(key, call, result=task.result())
+
+    async def do(self, key, factory):
+        """
+        Run factory() unless an identical call is already in flight.
+
+        Args:
+            key: Hashable identity of the call.
+            factory (callable): Returns the coroutine that does the work.
+
+        Returns:
+            The result of the shared call.
+        """
+        call, leader, future = self._join(key, asyncio.get_running_loop())
+        if not leader:
+            return await future
+        try:
+            task = asyncio.ensure_future(factory())
+        except BaseException as e:
+            self._finish(key, call, error=e)
+            raise
+        task.add_done_callback(lambda done: self._task_done(key, call, done))
+        return await asyncio.shield(task)
+
+    def do_sync(self, key, function):
+        """
+        Blocking counterpart of do() for calls made from threads.
+
+        Args:
+            key: Hashable identity of the call.
+            function (callable): Does the work and returns the result.
+
+        Returns:
+            The result of the shared call.
+        """
+        call, leader, _ = self._join(key)
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            result = function()
+        except BaseException as e:
+            self._finish(key, call, error=e)
+            raise
+        self._finish(key, call, result=result)
+        return result
+
+    def in_flight(self):
+        """
+        Return the number of calls currently in flight.
+
+        Returns:
+            int: Async and blocking calls still running.
+        """
+        with self._lock:
+            return len(self._calls)
+
+
+# Shared by every decryptor and agent in the process
+SINGLE_FLIGHT = SingleFlight()
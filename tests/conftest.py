@@ -0,0 +1,28 @@
+import dataclasses
+import os
+import sys
+import pytest
+
+# The modules live at the top of the repository, not in a package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import GeminiConfig  # noqa: E402
+
+
+@pytest.fixture
+def stub_config():
+    """
+    Build an offline configuration: stub backend, no files, no rendering
+    and a rate budget that never makes a test wait.
+    """
+    def build(**overrides):
+        config = GeminiConfig(
+            backend="stub",
+            decryption_cache_path=None,
+            output_mode="none",
+            requests_per_minute=10 ** 6,
+            tokens_per_minute=10 ** 9,
+            rate_limit_backoff=0.01,
+        )
+        return dataclasses.replace(config, **overrides)
+    return build
@@ -0,0 +1,61 @@
+import asyncio
+import time
+from ai_agent import AIAgent
+from llm_backend import StubBackend
+from terminal_colors import TerminalColors
+
+HISTORY = [{"role": "client-agent", "content": "Hello"}]
+
+
+def test_achat_matches_chat(stub_config):
+    agent = AIAgent("Agent", TerminalColors.GREEN, stub_config(), backend=StubBackend())
+    assert asyncio.run(agent.achat(HISTORY)) == agent.chat(HISTORY)
+
+
+def test_achat_does_not_block_the_loop(stub_config):
+    agent = AIAgent("Agent", TerminalColors.GREEN, stub_config(), backend=StubBackend(latency=0.2))
+    ticks = []
+
+    async def ticker():
+        while True:
+            ticks.append(time.perf_counter())
+            await asyncio.sleep(0.01)
+
+    async def main():
+        task = asyncio.create_task(ticker())
+        await agent.achat(HISTORY)
+        task.cancel()
+
+    asyncio.run(main())
+    # A blocking call would have let the ticker run only once
+    assert len(ticks) >= 10
+
+
+def test_concurrent_achats_overlap(stub_config):
+    agent = AIAgent("Agent", TerminalColors.GREEN, stub_config(), backend=StubBackend(latency=0.2))
+
+    async def main():
+        started = time.perf_counter()
+        replies = await asyncio.gather(*[
+            agent.achat([{"role": "client-agent", "content": f"Hello {index}"}]) for index in range(4)
+        ])
+        return replies, time.perf_counter() - started
+
+    replies, elapsed = asyncio.run(main())
+    assert all(not reply.startswith("Error") for reply in replies)
+    assert elapsed < 0.6
+
+
+def test_cancelled_achat_releases_its_session(stub_config):
+    agent = AIAgent("Agent", TerminalColors.GREEN, stub_config(chat_sessions_enabled=True),
+                    backend=StubBackend(latency=0.3))
+
+    async def main():
+        task = asyncio.create_task(agent.achat(HISTORY, session_id="dialogue"))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    asyncio.run(main())
+    session = agent.sessions.checkout("dialogue")
+    assert session is not None and session.chat is None
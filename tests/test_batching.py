@@ -0,0 +1,77 @@
+import asyncio
+from llm_backend import StubBackend
+from lolang_decryptor import LolangDecryptor
+from decryption_cache import DecryptionCache
+from phrase_codec import PhraseCodec
+
+
+class _FailingBackend(StubBackend):
+    def _respond(self, chat, content):
+        with self._lock:
+            self.calls += 1
+        raise ValueError("bad request")
+
+
+class _GarbledBackend(StubBackend):
+    def _reply_text(self, content):
+        if "LOLANG messages:" in content:
+            return "[[1]] only the first one"
+        return super()._reply_text(content)
+
+
+def _decryptor(config, backend):
+    # A private cache and codec so tests don't share results
+    return LolangDecryptor(config, backend=backend, cache=DecryptionCache(), codec=PhraseCodec())
+
+
+def _config(stub_config, **overrides):
+    return stub_config(decryption_single_flight=False, retry_max_attempts=1, **overrides)
+
+
+MESSAGES = ["⟦LO-2⟧ ACK", "⟦LO-2⟧ Q?", "⟦LO-2⟧ CTX+"]
+
+
+def test_decrypt_many_sends_one_request(stub_config):
+    backend = StubBackend()
+    decryptor = _decryptor(_config(stub_config), backend)
+    results = asyncio.run(decryptor.decrypt_many(MESSAGES + MESSAGES[:1]))
+    assert backend.calls == 1
+    assert results[0] == results[3] == backend._decrypted_text(MESSAGES[0])
+    assert results[1:3] == [backend._decrypted_text(message) for message in MESSAGES[1:]]
+    # Remembered per message afterwards
+    assert asyncio.run(decryptor.decrypt(MESSAGES[2])) == results[2]
+    assert backend.calls == 1
+
+
+def test_batches_are_split_at_the_maximum(stub_config):
+    backend = StubBackend()
+    decryptor = _decryptor(_config(stub_config, decryption_batch_max=2), backend)
+    asyncio.run(decryptor.decrypt_many(MESSAGES))
+    assert backend.calls == 2
+
+
+def test_unparseable_reply_falls_back_per_message(stub_config):
+    backend = _GarbledBackend()
+    decryptor = _decryptor(_config(stub_config), backend)
+    results = asyncio.run(decryptor.decrypt_many(MESSAGES))
+    assert backend.calls == 1 + len(MESSAGES)
+    assert results == [backend._decrypted_text(message) for message in MESSAGES]
+
+
+def test_failed_request_is_not_multiplied(stub_config):
+    backend = _FailingBackend()
+    decryptor = _decryptor(_config(stub_config), backend)
+    results = asyncio.run(decryptor.decrypt_many(MESSAGES))
+    assert backend.calls == 1
+    assert all(result.startswith("[Decryption failed") for result in results)
+
+
+def test_concurrent_decrypts_share_a_batch(stub_config):
+    backend = StubBackend()
+    decryptor = _decryptor(_config(stub_config, decryption_batch_window=0.05), backend)
+
+    async def main():
+        return await asyncio.gather(*[decryptor.decrypt(message) for message in MESSAGES])
+
+    assert asyncio.run(main()) == [backend._decrypted_text(message) for message in MESSAGES]
+    assert backend.calls == 1
@@ -0,0 +1,45 @@
+import threading
+from types import SimpleNamespace
+from benchmark_compression import DEFAULT_CORPUS, run_benchmark
+from llm_backend import GeminiBackend, StubBackend
+
+
+class _FakeModel:
+    def __init__(self, model_name, generation_config):
+        self.model_name = model_name
+
+    def count_tokens(self, text):
+        return SimpleNamespace(total_tokens=len(text.split()))
+
+
+class _UncountableStub(StubBackend):
+    def count_tokens(self, text, model_name):
+        raise ConnectionError("count_tokens unavailable")
+
+
+def test_gemini_counts_tokens_with_the_model():
+    backend = GeminiBackend.__new__(GeminiBackend)
+    backend._genai = SimpleNamespace(GenerativeModel=_FakeModel)
+    backend._models = {}
+    backend._lock = threading.Lock()
+
+    assert backend.exact_token_counts
+    assert backend.count_tokens("three short words", "gemini-pro") == 3
+
+
+def test_stub_counts_are_exact(stub_config, monkeypatch):
+    monkeypatch.setattr("benchmark_compression.get_backend", lambda config: StubBackend())
+    report = run_benchmark(DEFAULT_CORPUS[:3], stub_config())
+
+    assert report["token_counts"] == "exact"
+    assert not any(row["tokens_estimated"] for row in report["rows"])
+    assert report["compression_ratio"] < 1
+
+
+def test_failed_counts_fall_back_to_marked_estimates(stub_config, monkeypatch):
+    monkeypatch.setattr("benchmark_compression.get_backend", lambda config: _UncountableStub())
+    report = run_benchmark(DEFAULT_CORPUS[:3], stub_config())
+
+    assert report["token_counts"] == "estimated"
+    assert all(row["tokens_estimated"] for row in report["rows"])
+    assert report["english_tokens"] > 0
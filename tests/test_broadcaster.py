@@ -0,0 +1,87 @@
+import asyncio
+import json
+import pytest
+from broadcaster import Broadcaster, Subscriber
+
+
+class _Socket:
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.frames = []
+        self.closed_with = None
+
+    async def send(self, frame):
+        await asyncio.sleep(self.delay)
+        self.frames.append(frame)
+
+    async def close(self, code=1000, reason=""):
+        self.closed_with = (code, reason)
+
+
+def test_publish_reaches_every_subscriber():
+    async def main():
+        broadcaster = Broadcaster()
+        sockets = [_Socket() for _ in range(3)]
+        for socket in sockets:
+            broadcaster.subscribe(socket)
+        delivered = broadcaster.publish({"type": "message", "content": "hi"})
+        await asyncio.sleep(0.01)
+        return delivered, sockets
+
+    delivered, sockets = asyncio.run(main())
+    assert delivered == 3
+    assert all(json.loads(socket.frames[0])["content"] == "hi" for socket in sockets)
+
+
+def test_slow_subscriber_does_not_delay_others():
+    async def main():
+        broadcaster = Broadcaster(queue_size=2)
+        slow, fast = _Socket(delay=1.0), _Socket()
+        broadcaster.subscribe(slow)
+        broadcaster.subscribe(fast)
+        for index in range(5):
+            broadcaster.publish({"seq": index})
+            await asyncio.sleep(0)
+        await asyncio.sleep(0.01)
+        return broadcaster.subscribers[slow], fast
+
+    slow_subscriber, fast = asyncio.run(main())
+    assert [json.loads(frame)["seq"] for frame in fast.frames] == list(range(5))
+    # The slow peer keeps only the newest frames
+    assert slow_subscriber.dropped > 0
+    assert [json.loads(frame)["seq"] for _, frame in slow_subscriber.queue._queue][-1] == 4
+
+
+def test_disconnect_policy_closes_slow_consumer():
+    async def main():
+        broadcaster = Broadcaster(queue_size=1, policy=Subscriber.DISCONNECT)
+        slow = _Socket(delay=1.0)
+        subscriber = broadcaster.subscribe(slow)
+        results = [broadcaster.publish({"seq": index}) for index in range(3)]
+        await subscriber.close_task
+        return results, subscriber, slow
+
+    results, subscriber, slow = asyncio.run(main())
+    assert results[-1] == 0
+    assert subscriber.closed
+    assert slow.closed_with == (1013, "slow consumer")
+
+
+def test_unknown_policy_is_rejected():
+    async def main():
+        with pytest.raises(ValueError):
+            Subscriber(_Socket(), policy="block")
+
+    asyncio.run(main())
+
+
+def test_unsubscribe_stops_delivery():
+    async def main():
+        broadcaster = Broadcaster()
+        socket = _Socket()
+        broadcaster.subscribe(socket)
+        broadcaster.unsubscribe(socket)
+        return broadcaster.publish({"seq": 1}), socket
+
+    delivered, socket = asyncio.run(main())
+    assert delivered == 0 and socket.frames == []
@@ -0,0 +1,84 @@
+import pytest
+from cassette import CassetteBackend, CassetteMissError
+from llm_backend import StubBackend, estimate_tokens
+
+MODEL = "test-model"
+GENERATION = {"temperature": 0.1}
+
+
+def _record(path):
+    cassette = CassetteBackend(path, mode="record", inner=StubBackend())
+    chat = cassette.start_chat(MODEL, GENERATION)
+    replies = [chat.send_message("first").text, chat.send_message("second").text]
+    streamed = cassette.start_chat(MODEL, GENERATION).send_message("streamed", stream=True)
+    replies.append("".join(chunk.text for chunk in streamed))
+    cassette.close()
+    return replies
+
+
+def test_replay_exact_hits(tmp_path):
+    path = str(tmp_path / "run.bin")
+    replies = _record(path)
+
+    cassette = CassetteBackend(path)
+    chat = cassette.start_chat(MODEL, GENERATION)
+    assert chat.send_message("first").text == replies[0]
+    assert chat.send_message("second").text == replies[1]
+    streamed = cassette.start_chat(MODEL, GENERATION).send_message("streamed", stream=True)
+    assert "".join(chunk.text for chunk in streamed) == replies[2]
+    stats = cassette.stats()
+    assert (stats["requests"], stats["hits"], stats["loose_hits"], stats["misses"]) == (3, 3, 0, 0)
+    cassette.close()
+
+
+def test_replay_loose_hit_ignores_earlier_turns(tmp_path):
+    path = str(tmp_path / "run.bin")
+    replies = _record(path)
+
+    cassette = CassetteBackend(path)
+    # "second" without "first" before it only matches the loose key
+    chat = cassette.start_chat(MODEL, GENERATION)
+    assert chat.send_message("second").text == replies[1]
+    assert cassette.stats()["loose_hits"] == 1
+    cassette.close()
+
+
+def test_replay_miss(tmp_path):
+    path = str(tmp_path / "run.bin")
+    _record(path)
+
+    cassette = CassetteBackend(path)
+    with pytest.raises(CassetteMissError):
+        cassette.start_chat(MODEL, GENERATION).send_message("never recorded")
+    with pytest.raises(CassetteMissError):
+        cassette.start_chat(MODEL, {"temperature": 0.9}).send_message("first")
+    assert cassette.stats()["misses"] == 2
+    cassette.close()
+
+
+def test_truncated_record_is_ignored(tmp_path):
+    path = str(tmp_path / "run.bin")
+    replies = _record(path)
+    with open(path, "r+b") as cassette_file:
+        cassette_file.seek(0, 2)
+        cassette_file.truncate(cassette_file.tell() - 3)
+
+    cassette = CassetteBackend(path)
+    assert cassette.stats()["requests"] == 2
+    assert cassette.start_chat(MODEL, GENERATION).send_message("first").text == replies[0]
+    cassette.close()
+
+
+def test_token_counts_come_from_the_inner_backend(tmp_path):
+    path = str(tmp_path / "run.bin")
+    inner = StubBackend()
+    recording = CassetteBackend(path, mode="record", inner=inner)
+    assert recording.exact_token_counts == inner.exact_token_counts
+    assert recording.count_tokens("some text to count", MODEL) == inner.count_tokens("some text to count", MODEL)
+    recording.close()
+
+    # A replay has no backend to ask, so it falls back to the estimate
+    replay = CassetteBackend(path)
+    assert not replay.exact_token_counts
+    assert replay.count_tokens("some text to count", MODEL) == estimate_tokens("some text to count")
+    replay.close()
@@ -0,0 +1,75 @@
+import time
+from ai_agent import AIAgent
+from chat_sessions import ChatSessionPool
+from llm_backend import StubBackend
+from terminal_colors import TerminalColors
+
+
+def test_checkout_is_exclusive():
+    pool = ChatSessionPool()
+    session = pool.checkout("a")
+    assert pool.checkout("a") is None
+
+    pool.release(session)
+    assert pool.checkout("a") is session
+
+
+def test_least_recently_used_idle_session_is_evicted():
+    pool = ChatSessionPool(max_sessions=2)
+    for key in ("a", "b"):
+        pool.release(pool.checkout(key))
+    pool.release(pool.checkout("a"))
+    pool.release(pool.checkout("c"))
+
+    assert len(pool) == 2
+    assert pool.checkout("a").turns == 0
+    assert "b" not in pool._sessions
+
+
+def test_busy_sessions_are_not_evicted():
+    pool = ChatSessionPool(max_sessions=1)
+    busy = pool.checkout("a")
+    pool.checkout("b")
+    # Over its size until a session is released
+    assert len(pool) == 2
+    assert pool.checkout("a") is None
+    pool.release(busy)
+
+
+def test_idle_session_expires_after_ttl():
+    pool = ChatSessionPool(ttl=0.01)
+    session = pool.checkout("a")
+    session.chat, session.seen, session.turns = object(), 4, 2
+    pool.release(session)
+    time.sleep(0.02)
+
+    session = pool.checkout("a")
+    assert session.chat is None and session.seen == 0 and session.turns == 0
+
+
+def test_session_sends_only_new_turns(stub_config):
+    backend = StubBackend()
+    agent = AIAgent("Agent", TerminalColors.GREEN, stub_config(chat_sessions_enabled=True), backend=backend)
+    history = [{"role": "client-agent", "content": "Hello"}]
+    reply = agent.chat(history, session_id="s")
+    session = agent.sessions.checkout("s")
+    assert session.seen == 1 and session.turns == 1
+    agent.sessions.release(session)
+
+    history += [{"role": "server-agent", "content": reply}, {"role": "client-agent", "content": "Again"}]
+    prompt, mark = agent._session_prompt(agent.sessions.checkout("s"), history)
+    # The agent's own reply is not sent back
+    assert prompt.startswith("New messages:\nclient-agent: Again")
+    assert "server-agent" not in prompt
+    assert mark == 3
+
+
+def test_failed_call_resets_the_session(stub_config):
+    backend = StubBackend(error_rate=1.0)
+    agent = AIAgent("Agent", TerminalColors.GREEN,
+                    stub_config(chat_sessions_enabled=True, retry_max_attempts=1), backend=backend)
+    reply = agent.chat([{"role": "client-agent", "content": "Hello"}], session_id="s")
+
+    assert reply.startswith("Error:")
+    session = agent.sessions.checkout("s")
+    assert session is not None and session.chat is None
@@ -0,0 +1,85 @@
+import asyncio
+import os
+from conversation_store import ConversationStore
+from history_manager import ConversationHistory
+
+
+def _segment(path):
+    return os.path.join(path, ConversationStore.SEGMENT_PATTERN.format(1))
+
+
+def test_replay_and_tail(tmp_path):
+    store = ConversationStore(str(tmp_path))
+    for index in range(5):
+        store.append("a", "client-agent", f"turn {index}")
+    store.append("b", "server-agent", "other session")
+
+    assert [record.content for record in store.replay("a")] == [f"turn {index}" for index in range(5)]
+    assert [record.seq for record in store.tail("a", 2)] == [4, 5]
+    assert store.last_seq("b") == 1
+    store.close()
+
+
+def test_reopen_rebuilds_index(tmp_path):
+    store = ConversationStore(str(tmp_path), segment_bytes=64)
+    for index in range(10):
+        store.append("a", "user", f"turn {index}")
+    store.close()
+
+    store = ConversationStore(str(tmp_path), segment_bytes=64)
+    assert store.stats()["segments"] > 1
+    assert [record.content for record in store.replay("a")] == [f"turn {index}" for index in range(10)]
+    assert store.append("a", "user", "after restart") == 11
+    store.close()
+
+
+def test_recovers_from_truncated_segment(tmp_path):
+    store = ConversationStore(str(tmp_path))
+    store.append("a", "user", "first")
+    store.append("a", "user", "second")
+    store.append("a", "user", "interrupted by a crash")
+    store.close()
+    path = _segment(str(tmp_path))
+    size = os.path.getsize(path)
+    with open(path, "r+b") as segment_file:
+        segment_file.truncate(size - 5)
+
+    store = ConversationStore(str(tmp_path))
+    assert [record.content for record in store.replay("a")] == ["first", "second"]
+    # The partial record is cut off, so new appends follow the last good one
+    assert store.append("a", "user", "third") == 3
+    store.close()
+
+    store = ConversationStore(str(tmp_path))
+    assert [record.content for record in store.replay("a")] == ["first", "second", "third"]
+    store.close()
+
+
+def test_corrupt_record_is_dropped(tmp_path):
+    store = ConversationStore(str(tmp_path))
+    store.append("a", "user", "good")
+    store.append("a", "user", "bad")
+    store.close()
+    path = _segment(str(tmp_path))
+    with open(path, "r+b") as segment_file:
+        segment_file.seek(-1, os.SEEK_END)
+        segment_file.write(b"?")
+
+    store = ConversationStore(str(tmp_path))
+    assert [record.content for record in store.replay("a")] == ["good"]
+    store.close()
+
+
+def test_history_replays_stored_turns(tmp_path):
+    store = ConversationStore(str(tmp_path))
+    history = ConversationHistory(keep_last=4, store=store, session_id="a")
+
+    async def main():
+        for index in range(6):
+            await history.aappend("user", f"turn {index}")
+
+    asyncio.run(main())
+    resumed = ConversationHistory(keep_last=4, store=store, session_id="a")
+    assert resumed.total_turns == 6
+    assert resumed.recent(4) == history.recent(4)
+    store.close()
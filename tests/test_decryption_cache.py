@@ -0,0 +1,92 @@
+import pytest
+import decryption_cache
+from decryption_cache import DecryptionCache
+from llm_backend import StubBackend
+from lolang_decryptor import LolangDecryptor
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(decryption_cache.time, "time", lambda: now[0])
+    return now
+
+
+def test_memory_lru_eviction():
+    cache = DecryptionCache(max_memory_entries=2)
+    cache.put("a", "A")
+    cache.put("b", "B")
+    assert cache.get("a") == "A"
+    cache.put("c", "C")
+
+    assert cache.get("b") is None
+    assert cache.get("a") == "A"
+    assert cache.get("c") == "C"
+    stats = cache.stats()
+    assert (stats["memory_hits"], stats["misses"], stats["memory_entries"]) == (3, 1, 2)
+
+
+def test_ttl_expiry(clock):
+    cache = DecryptionCache(ttl=10.0)
+    cache.put("a", "A")
+    clock[0] += 10.0
+    assert cache.get("a") == "A"
+    clock[0] += 0.1
+    assert cache.get("a") is None
+
+
+def test_disk_tier_survives_restart_and_expires(tmp_path, clock):
+    path = str(tmp_path / "cache.sqlite")
+    cache = DecryptionCache(path=path, ttl=10.0)
+    cache.put("a", "A")
+    cache.close()
+
+    cache = DecryptionCache(path=path, ttl=10.0)
+    assert cache.get_memory("a") is None
+    assert cache.get("a") == "A"
+    assert cache.stats()["disk_hits"] == 1
+    cache.close()
+
+    clock[0] += 11.0
+    cache = DecryptionCache(path=path, ttl=10.0)
+    assert cache.get("a") is None
+    cache.close()
+
+
+def test_disk_eviction_keeps_most_recent(tmp_path, monkeypatch):
+    monkeypatch.setattr(DecryptionCache, "EVICTION_INTERVAL", 1)
+    cache = DecryptionCache(path=str(tmp_path / "cache.sqlite"), max_memory_entries=1, max_disk_entries=2)
+    for key in ("a", "b", "c"):
+        cache.put(key, key.upper())
+    assert cache.get("a") is None
+    assert cache.get("b") == "B"
+    assert cache.get("c") == "C"
+    cache.close()
+
+
+def test_key_depends_on_backend_model_and_prompt():
+    key = DecryptionCache.make_key("⟦LO-2⟧  X-REQ", "gemini", "model", 1)
+    assert key == DecryptionCache.make_key("⟦LO-2⟧ X-REQ", "gemini", "model", 1)
+    assert key != DecryptionCache.make_key("⟦LO-2⟧ X-REQ", "stub", "model", 1)
+    assert key != DecryptionCache.make_key("⟦LO-2⟧ X-REQ", "gemini", "other", 1)
+    assert key != DecryptionCache.make_key("⟦LO-2⟧ X-REQ", "gemini", "model", 2)
+
+
+class _OtherBackend(StubBackend):
+    name = "other"
+
+
+def test_decryptor_lookup_is_keyed_by_backend(stub_config):
+    config = stub_config(phrase_codec_enabled=False, decryption_single_flight=False)
+    cache = DecryptionCache()
+    stub = StubBackend()
+    decrypted = LolangDecryptor(config, backend=stub, cache=cache).decrypt_sync("⟦LO-2⟧ ACK")
+    assert stub.calls == 1
+
+    same = StubBackend()
+    assert LolangDecryptor(config, backend=same, cache=cache).decrypt_sync("⟦LO-2⟧ ACK") == decrypted
+    assert same.calls == 0
+
+    other = _OtherBackend()
+    LolangDecryptor(config, backend=other, cache=cache).decrypt_sync("⟦LO-2⟧ ACK")
+    assert other.calls == 1
@@ -0,0 +1,69 @@
+import asyncio
+from decryption_pipeline import DecryptionPipeline
+from websocket_server import AgentServer
+
+
+class _Decryptor:
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.seen = []
+
+    async def decrypt(self, message):
+        await asyncio.sleep(self.delay)
+        self.seen.append(message)
+        return message.upper()
+
+
+def test_workers_decrypt_and_report():
+    async def main():
+        results = []
+        pipeline = DecryptionPipeline(_Decryptor(), queue_size=10, workers=2,
+                                      on_result=lambda message, decrypted: results.append(decrypted))
+        pipeline.start()
+        for message in ("a", "b", "c"):
+            assert pipeline.submit(message)
+        await pipeline.queue.join()
+        await pipeline.stop()
+        return pipeline, results
+
+    pipeline, results = asyncio.run(main())
+    assert sorted(results) == ["A", "B", "C"]
+    assert pipeline.processed == 3
+
+
+def test_full_queue_drops_instead_of_waiting():
+    async def main():
+        pipeline = DecryptionPipeline(_Decryptor(), queue_size=2, workers=1)
+        accepted = [pipeline.submit(str(index)) for index in range(4)]
+        return pipeline, accepted
+
+    pipeline, accepted = asyncio.run(main())
+    assert accepted == [True, True, False, False]
+    assert pipeline.dropped == 2
+
+
+def test_zero_queue_size_is_unbounded():
+    async def main():
+        pipeline = DecryptionPipeline(_Decryptor(), queue_size=0, workers=1)
+        return all(pipeline.submit(str(index)) for index in range(500))
+
+    assert asyncio.run(main())
+
+
+def test_server_decrypts_forwarded_messages_without_a_client(stub_config):
+    async def main():
+        server = AgentServer(stub_config(server_decryption_queue_size=0))
+        # A message forwarded by another worker, before anyone connected here
+        server.deliver("session-1", {"role": "client-agent", "content": "⟦LO-2⟧ ACK"})
+        for _ in range(100):
+            if server.decryption_pipeline.processed >= 2:
+                break
+            await asyncio.sleep(0.01)
+        processed = server.decryption_pipeline.processed
+        for state in list(server.sessions.values()):
+            state.task.cancel()
+        await server.shutdown()
+        return processed
+
+    # The client message and the reply
+    assert asyncio.run(main()) == 2
@@ -0,0 +1,127 @@
+import threading
+from ai_agent import AIAgent
+from history_manager import ConversationHistory
+from llm_backend import StubBackend
+from terminal_colors import TerminalColors
+
+
+def _history(summarizer=None, **overrides):
+    options = dict(token_budget=10 ** 6, keep_last=2, summary_token_budget=200,
+                   summarizer=summarizer, summarize_every=2)
+    options.update(overrides)
+    return ConversationHistory(**options)
+
+
+def test_keeps_recent_turns_verbatim():
+    history = _history()
+    for index in range(5):
+        history.append("agent", f"turn {index}")
+
+    assert history.recent(10) == [{"role": "agent", "content": "turn 3"},
+                                  {"role": "agent", "content": "turn 4"}]
+    assert history.total_turns == 5
+    # Without a summarizer, the folded turns stay as excerpts
+    assert list(history)[0] == {
+        "role": ConversationHistory.SUMMARY_ROLE,
+        "content": "Earlier conversation: agent: turn 0 | agent: turn 1 | agent: turn 2",
+    }
+
+
+def test_folded_turns_are_merged_into_the_summary():
+    calls = []
+
+    def summarizer(summary, turns, token_budget):
+        calls.append((summary, turns))
+        return f"{summary} +{len(turns)}".strip()
+
+    history = _history(summarizer)
+    for index in range(4):
+        history.append("agent", f"turn {index}")
+    assert history.wait_for_summary(5)
+    assert calls == [("", [("agent", "turn 0"), ("agent", "turn 1")])]
+    assert history.summary == "+2"
+
+    for index in range(4, 6):
+        history.append("agent", f"turn {index}")
+    assert history.wait_for_summary(5)
+    # The previous summary is passed in and only the new folds are added
+    assert calls[1] == ("+2", [("agent", "turn 2"), ("agent", "turn 3")])
+    assert history.summary == "+2 +2"
+    assert history.summaries == 2
+    assert len(history) == 3
+
+
+def test_appends_do_not_wait_for_the_summary():
+    release = threading.Event()
+
+    def summarizer(summary, turns, token_budget):
+        release.wait(5)
+        return "slow summary"
+
+    history = _history(summarizer)
+    for index in range(6):
+        history.append("agent", f"turn {index}")
+    # Turns folded while the summary runs are shown as excerpts meanwhile
+    assert history.summary == "agent: turn 0 | agent: turn 1 | agent: turn 2 | agent: turn 3"
+
+    release.set()
+    # The turns folded in the meantime are summarized by a follow-up run
+    assert history.wait_for_summary(5)
+    assert history.summaries == 2
+    assert history.summary == "slow summary"
+
+
+def test_failed_summary_keeps_the_excerpts():
+    def summarizer(summary, turns, token_budget):
+        raise RuntimeError("backend down")
+
+    history = _history(summarizer)
+    for index in range(4):
+        history.append("agent", f"turn {index}")
+    assert history.wait_for_summary(5)
+    assert history.summary == "agent: turn 0 | agent: turn 1"
+    assert history.summaries == 0
+
+
+def test_excerpts_are_capped_by_the_summary_budget():
+    history = _history(summary_token_budget=30, excerpt_chars_per_turn=40)
+    for index in range(20):
+        history.append("agent", f"turn {index} " + "x" * 100)
+
+    excerpts = history.summary.split(" | ")
+    assert 1 <= len(excerpts) < 18
+    assert excerpts[-1].startswith("agent: turn 17")
+    assert excerpts[-1].endswith("…")
+
+
+def test_token_budget_folds_long_turns():
+    history = _history(token_budget=50, keep_last=10)
+    history.append("agent", "a" * 160)
+    history.append("agent", "b" * 160)
+    assert len(history.recent(10)) == 1
+    assert history.token_count > 0
+
+
+def test_agent_summarize_with_stub_backend(stub_config):
+    agent = AIAgent("Agent", TerminalColors.GREEN, stub_config(), backend=StubBackend())
+    history = ConversationHistory.from_config(
+        stub_config(history_keep_last=2, history_summarize_every=2), summarizer=agent.summarize
+    )
+    for index in range(4):
+        history.append("agent", f"booking 10{index}")
+    assert history.wait_for_summary(5)
+    assert history.summary.startswith("Summary:")
+    assert "100" in history.summary and "101" in history.summary
+    assert agent.usage["requests"] == 1
+
+
+def test_summarize_every_zero_disables_the_summarizer(stub_config):
+    def summarizer(summary, turns, token_budget):
+        raise AssertionError("not expected")
+
+    history = ConversationHistory.from_config(
+        stub_config(history_keep_last=1, history_summarize_every=0), summarizer=summarizer
+    )
+    for index in range(5):
+        history.append("agent", f"turn {index}")
+    assert history.summarizer is None
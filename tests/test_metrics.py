@@ -0,0 +1,87 @@
+import asyncio
+from metrics import MetricsRegistry, MetricsServer
+from websocket_server import AgentServer
+
+
+def test_histogram_snapshot_matches_the_exposition():
+    registry = MetricsRegistry(prefix="test_")
+    histogram = registry.histogram("latency_seconds", "Latency", buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.5, 5.0):
+        histogram.observe(value)
+
+    buckets = registry.snapshot()["latency_seconds"]["buckets"]
+    assert buckets == {0.1: 1, 1.0: 3, float("inf"): 4}
+    text = registry.render_prometheus()
+    assert 'test_latency_seconds_bucket{le="0.1"} 1' in text
+    assert 'test_latency_seconds_bucket{le="1.0"} 3' in text
+    assert 'test_latency_seconds_bucket{le="+Inf"} 4' in text
+    assert "test_latency_seconds_count 4" in text
+
+
+def test_counters_and_gauges():
+    registry = MetricsRegistry(prefix="test_")
+    registry.counter("requests_total").inc(3)
+    registry.gauge("depth", function=lambda: 7)
+    registry.gauge("broken", function=lambda: 1 / 0)
+
+    assert registry.snapshot() == {"requests_total": 3, "depth": 7, "broken": 0}
+
+
+def test_server_gauges_cover_every_live_server(stub_config):
+    async def main():
+        first = AgentServer(stub_config(server_decryption_enabled=False))
+        second = AgentServer(stub_config(server_decryption_enabled=False))
+        # Servers left over from other tests may not have been collected yet
+        baseline = first.metrics_snapshot()["sessions"]
+        first.get_session("a")
+        second.get_session("b")
+        second.get_session("c")
+        both = first.metrics_snapshot()["sessions"]
+        await second.shutdown()
+        after = first.metrics_snapshot()["sessions"]
+        await first.shutdown()
+        return both - baseline, after - baseline
+
+    both, after = asyncio.run(main())
+    # A second server no longer replaces the first one's gauges
+    assert both == 3
+    assert after == 1
+
+
+def test_generation_and_decryption_queue_waits_are_separate(stub_config):
+    async def main():
+        server = AgentServer(stub_config(server_decryption_queue_size=0))
+        snapshot = server.metrics_snapshot()
+        generation = snapshot["generation_queue_seconds"]["count"]
+        decryption = snapshot["decryption_queue_seconds"]["count"]
+        server.deliver("a", {"role": "client-agent", "content": "Hello"})
+        for _ in range(200):
+            if server.sessions["a"].history.total_turns >= 2 and server.decryption_pipeline.processed >= 2:
+                break
+            await asyncio.sleep(0.01)
+        snapshot = server.metrics_snapshot()
+        await server.shutdown()
+        return (snapshot["generation_queue_seconds"]["count"] - generation,
+                snapshot["decryption_queue_seconds"]["count"] - decryption)
+
+    # One message generated; it and the reply were decrypted
+    assert asyncio.run(main()) == (1, 2)
+
+
+def test_metrics_endpoint_serves_prometheus_text():
+    async def main():
+        registry = MetricsRegistry(prefix="test_")
+        registry.counter("requests_total", "Requests").inc()
+        server = MetricsServer(registry, port=0)
+        await server.start()
+        reader, writer = await asyncio.open_connection(server.host, server.port)
+        writer.write(b"GET /metrics HTTP/1.1\r\nHost: localhost\r\n\r\n")
+        await writer.drain()
+        response = (await reader.read()).decode()
+        writer.close()
+        await server.stop()
+        return response
+
+    response = asyncio.run(main())
+    assert response.startswith("HTTP/1.1 200 OK")
+    assert "test_requests_total 1" in response
@@ -0,0 +1,115 @@
+import asyncio
+import json
+import logging
+from multiprocess_server import ClusterHub, ClusterLink, Supervisor, _Peer, session_owner, worker_config
+from websocket_server import AgentServer
+
+
+class _Socket:
+    def __init__(self):
+        self.frames = []
+
+    async def send(self, frame):
+        self.frames.append(json.loads(frame))
+
+
+class _StalledWriter:
+    def __init__(self):
+        self.writes = 0
+        self.release = asyncio.Event()
+
+    def write(self, data):
+        self.writes += 1
+
+    async def drain(self):
+        await self.release.wait()
+
+    def is_closing(self):
+        return False
+
+    def close(self):
+        pass
+
+
+def _session_owned_by(index, workers):
+    return next(f"session-{n}" for n in range(100) if session_owner(f"session-{n}", workers) == index)
+
+
+def test_worker_config_splits_the_budget(stub_config):
+    config = worker_config(stub_config(requests_per_minute=100, conversation_store_path="/data"), 1, 4)
+    assert config.requests_per_minute == 25
+    assert config.conversation_store_path.endswith("worker-1")
+
+
+def test_stalled_peer_queues_then_drops():
+    async def main():
+        writer = _StalledWriter()
+        peer = _Peer(writer, 2, "test")
+        results = [peer.send({"type": "broadcast"}) for _ in range(5)]
+        await asyncio.sleep(0.01)
+        peer.close()
+        return results, writer, peer
+
+    results, writer, peer = asyncio.run(main())
+    # Sending never waits; the writer then blocks in drain() on the first message
+    assert results == [True, True, False, False, False]
+    assert peer.dropped == 3
+    assert writer.writes == 1 and peer.queue.qsize() == 1
+
+
+def test_forwarded_sessions_reply_through_the_relay(stub_config):
+    workers = 2
+    remote_session = _session_owned_by(1, workers)
+
+    async def main():
+        hub = ClusterHub(workers)
+        await hub.start()
+        servers, links = [], []
+        for index in range(workers):
+            server = AgentServer(stub_config(server_decryption_enabled=False))
+            link = ClusterLink(server, index, workers, hub.port)
+            await link.connect()
+            server.cluster = link
+            servers.append(server)
+            links.append(link)
+        while len(hub.peers) < workers:
+            await asyncio.sleep(0.01)
+        observer = _Socket()
+        servers[0].broadcaster.subscribe(observer)
+
+        # Worker 0 received a message for a session worker 1 owns
+        assert not links[0].owns(remote_session)
+        links[0].forward(remote_session, {"role": "client-agent", "content": "Hello", "session": remote_session})
+        for _ in range(300):
+            if observer.frames:
+                break
+            await asyncio.sleep(0.01)
+        for link in links:
+            await link.close()
+        for server in servers:
+            await server.shutdown()
+        await hub.stop()
+        return servers, links, observer
+
+    servers, links, observer = asyncio.run(main())
+    assert remote_session in servers[1].sessions
+    assert remote_session not in servers[0].sessions
+    frame = observer.frames[0]
+    assert frame["session"] == remote_session and links[0].relayed == 1
+    # Numbered by worker 1, so it cannot collide with worker 0's frames
+    assert frame["seq"] % workers == 1
+
+
+def test_sequence_numbers_are_unique_per_worker():
+    links = [ClusterLink(None, index, 3, 0) for index in range(3)]
+    numbers = [link.sequence(local) for link in links for local in range(1, 50)]
+    assert len(set(numbers)) == len(numbers)
+    assert [links[2].sequence(local) for local in (1, 2, 3)] == sorted(links[2].sequence(local) for local in (1, 2, 3))
+
+
+def test_supervisor_reports_through_logging(stub_config, caplog, capsys):
+    supervisor = Supervisor(stub_config(), workers=2)
+    with caplog.at_level(logging.INFO, logger="multiprocess_server"):
+        supervisor.stop()
+    assert "Server stopping..." in caplog.text
+    assert capsys.readouterr().out == ""
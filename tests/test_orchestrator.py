@@ -0,0 +1,71 @@
+import json
+import threading
+import time
+import pytest
+from orchestrator import DialogueOrchestrator, DialogueSpec, TranscriptWriter, run_dialogues
+
+
+class _SlowFile:
+    def __init__(self):
+        self.lines = []
+        self.closed = False
+        self.release = threading.Event()
+
+    def write(self, text):
+        self.release.wait()
+        self.lines.append(text)
+
+    def close(self):
+        self.closed = True
+
+
+def test_transcript_writes_never_wait_for_the_file(tmp_path):
+    writer = TranscriptWriter(str(tmp_path / "transcript.jsonl"))
+    writer._file.close()
+    slow = writer._file = _SlowFile()
+
+    started = time.perf_counter()
+    for turn in range(50):
+        writer.write({"type": "turn", "turn": turn})
+    assert time.perf_counter() - started < 0.1
+
+    slow.release.set()
+    writer.close()
+    assert [json.loads(line)["turn"] for line in slow.lines] == list(range(50))
+    assert slow.closed and writer.records == 50
+
+
+def test_dialogues_run_to_their_turn_limit(stub_config, tmp_path):
+    path = str(tmp_path / "transcript.jsonl")
+    orchestrator = DialogueOrchestrator(stub_config(), max_concurrent=2, transcript_path=path)
+    specs = [DialogueSpec(f"dialogue-{number}", max_turns=3) for number in range(4)]
+
+    report = run_dialogues(orchestrator, specs)
+
+    assert report["turns"] == 12
+    assert report["stop_reasons"] == {"max_turns": 4}
+    with open(path, encoding="utf-8") as transcript:
+        records = [json.loads(line) for line in transcript]
+    # The opening, three replies and the end record for every dialogue
+    assert len(records) == 4 * 5
+    ends = [record for record in records if record["type"] == "end"]
+    assert sorted(record["dialogue"] for record in ends) == [spec.dialogue_id for spec in specs]
+
+
+def test_custom_stop_condition_ends_the_dialogue(stub_config):
+    replies = []
+
+    def stop_after_two(spec, history, reply):
+        replies.append(reply)
+        return "enough" if len(replies) == 2 else None
+
+    orchestrator = DialogueOrchestrator(stub_config(), stop_condition=stop_after_two)
+    report = run_dialogues(orchestrator, [DialogueSpec("dialogue", max_turns=10)])
+    result = report["dialogue_results"][0]
+    assert result["stop_reason"] == "enough" and result["turns"] == 2
+
+
+def test_dialogue_ids_must_be_unique(stub_config):
+    orchestrator = DialogueOrchestrator(stub_config())
+    with pytest.raises(ValueError):
+        run_dialogues(orchestrator, [DialogueSpec("same"), DialogueSpec("same")])
@@ -0,0 +1,83 @@
+import io
+import json
+import threading
+import time
+import pytest
+from output_sink import BufferedSink, JsonlSink, NullSink, TerminalSink, create_output_sink
+
+
+class _BlockingStream(io.StringIO):
+    def __init__(self):
+        super().__init__()
+        self.release = threading.Event()
+
+    def write(self, text):
+        self.release.wait()
+        return super().write(text)
+
+
+def test_buffered_sink_is_abstract():
+    with pytest.raises(TypeError):
+        BufferedSink()
+
+
+def test_terminal_sink_renders_on_the_writer_thread():
+    stream = io.StringIO()
+    sink = TerminalSink(stream)
+    threads = []
+
+    def render():
+        threads.append(threading.current_thread().name)
+        return "hello"
+
+    sink.write({"type": "system"}, render)
+    sink.write(None, "plain", end="")
+    sink.close()
+    assert stream.getvalue() == "hello\nplain"
+    assert threads == ["output-sink"]
+
+
+def test_slow_stream_drops_the_oldest_lines_with_a_notice():
+    stream = _BlockingStream()
+    sink = TerminalSink(stream, max_buffered=2)
+    sink.write(None, "first")
+    # The writer thread is now stuck writing "first"; later lines pile up
+    while not sink._writing:
+        time.sleep(0.001)
+    for number in range(5):
+        sink.write(None, f"line {number}")
+    stream.release.set()
+    sink.close()
+
+    assert sink.dropped == 3
+    assert stream.getvalue() == "first\n\n[3 lines dropped: output too slow]\nline 3\nline 4\n"
+
+
+def test_a_failing_renderer_does_not_stop_the_writer():
+    stream = io.StringIO()
+    sink = TerminalSink(stream)
+    sink.write(None, lambda: 1 / 0)
+    sink.write(None, "after")
+    sink.close()
+    assert stream.getvalue() == "after\n"
+
+
+def test_jsonl_sink_writes_records_and_skips_deltas(tmp_path):
+    path = str(tmp_path / "output.jsonl")
+    sink = JsonlSink(path=path)
+    sink.write({"type": "delta", "content": "par"}, "par")
+    sink.write({"type": "message", "role": "Agent", "content": "partial"}, lambda: 1 / 0)
+    sink.write(None, "separator")
+    sink.close()
+
+    with open(path, encoding="utf-8") as output:
+        records = [json.loads(line) for line in output]
+    assert len(records) == 1
+    assert records[0]["content"] == "partial" and "ts" in records[0]
+
+
+def test_create_output_sink_modes():
+    assert isinstance(create_output_sink("none"), NullSink)
+    assert isinstance(create_output_sink("terminal"), TerminalSink)
+    with pytest.raises(ValueError):
+        create_output_sink("fancy")
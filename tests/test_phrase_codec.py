@@ -0,0 +1,66 @@
+from lolang_decryptor import LolangDecryptor
+from llm_backend import StubBackend
+from decryption_cache import DecryptionCache
+from phrase_codec import PhraseCodec
+
+
+def _trained(min_support=2, **kwargs):
+    codec = PhraseCodec(min_support=min_support, **kwargs)
+    codec.learn("⟦LO-2⟧ X-REQ Room|𝟏𝟏𝑷𝑴⟩", "Book a room at 11pm")
+    codec.learn("⟦LO-2⟧ X-REQ Room|𝟗𝑷𝑴⟩", "Book a room at 9pm")
+    return codec
+
+
+def test_fills_numbers_into_a_learned_template():
+    codec = _trained()
+    assert codec.lookup("⟦LO-2⟧ X-REQ Room|𝟕𝑷𝑴⟩") == "Book a room at 7pm"
+    assert codec.stats()["template_hits"] == 1
+
+
+def test_needs_min_support_distinct_messages():
+    codec = PhraseCodec(min_support=2)
+    for _ in range(3):
+        codec.learn("⟦LO-2⟧ X-REQ Room|𝟏𝟏𝑷𝑴⟩", "Book a room at 11pm")
+    assert codec.lookup("⟦LO-2⟧ X-REQ Room|𝟕𝑷𝑴⟩") is None
+
+
+def test_fixed_numbers_must_match():
+    codec = _trained()
+    # The "2" of LO-2 never appears in the English, so it is not a slot
+    assert codec.lookup("⟦LO-3⟧ X-REQ Room|𝟕𝑷𝑴⟩") is None
+
+
+def test_contradicting_templates_are_not_trusted():
+    codec = _trained()
+    codec.learn("⟦LO-2⟧ X-REQ Room|𝟓𝑷𝑴⟩", "Cancel the room at 5pm")
+    codec.learn("⟦LO-2⟧ X-REQ Room|𝟔𝑷𝑴⟩", "Cancel the room at 6pm")
+    assert codec.lookup("⟦LO-2⟧ X-REQ Room|𝟕𝑷𝑴⟩") is None
+
+
+def test_ambiguous_numbers_are_not_learned():
+    codec = PhraseCodec(min_support=1)
+    codec.learn("Q? 𝟑 rooms", "3 rooms for 3 nights")
+    assert codec.lookup("Q? 𝟒 rooms") is None
+    assert codec.stats()["templates"] == 0
+
+
+def test_tables_survive_save_and_load(tmp_path):
+    path = str(tmp_path / "phrases.json")
+    codec = _trained(path=path, version="v1")
+    codec.save()
+
+    loaded = PhraseCodec(path=path, version="v1")
+    loaded.load()
+    assert loaded.lookup("⟦LO-2⟧ X-REQ Room|𝟕𝑷𝑴⟩") == "Book a room at 7pm"
+    # Tables learned with another model or prompt are ignored
+    other = PhraseCodec(path=path, version="v2")
+    other.load()
+    assert other.stats()["templates"] == 0
+
+
+def test_decryptor_serves_learned_templates_without_the_llm(stub_config):
+    backend = StubBackend()
+    decryptor = LolangDecryptor(stub_config(decryption_batch_window=0), backend=backend,
+                                cache=DecryptionCache(), codec=_trained())
+    assert decryptor.decrypt_sync("⟦LO-2⟧ X-REQ Room|𝟕𝑷𝑴⟩") == "Book a room at 7pm"
+    assert backend.calls == 0
@@ -0,0 +1,61 @@
+import threading
+import time
+from llm_backend import StubBackend
+from prompt_cache import PromptCache
+
+PREFIX = "RULES " * 200
+
+
+def _warm(cache):
+    # The first request starts the registration in the background
+    cache.split(PREFIX + "\nmessage", [PREFIX])
+    for _ in range(100):
+        if cache.stats()["cached_prefixes"]:
+            return
+        time.sleep(0.01)
+    raise AssertionError("prefix was not registered")
+
+
+def test_cached_prefix_is_not_sent_again():
+    backend = StubBackend()
+    cache = PromptCache(backend, "model")
+    handle, text = cache.split(PREFIX + "\nmessage", [PREFIX])
+    # Registration never delays the request
+    assert handle is None and text == PREFIX + "\nmessage"
+
+    _warm(cache)
+    handle, text = cache.split(PREFIX + "\nmessage", [PREFIX])
+    assert handle is not None and text == "message"
+    assert backend.cached_contexts == 1
+
+
+def test_short_prefixes_are_never_registered():
+    backend = StubBackend()
+    backend.min_cached_tokens = 10 ** 6
+    cache = PromptCache(backend, "model")
+    for _ in range(3):
+        assert cache.split(PREFIX + "\nmessage", [PREFIX])[0] is None
+    assert backend.cached_contexts == 0
+    assert cache.stats()["misses"] == 3
+
+
+def test_counters_are_exact_under_concurrency():
+    cache = PromptCache(StubBackend(), "model")
+    _warm(cache)
+    before = cache.stats()
+
+    def worker():
+        for _ in range(2000):
+            cache.split(PREFIX + "\nmessage", [PREFIX])
+            cache.split("other prompt", [PREFIX])
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    stats = cache.stats()
+    assert stats["hits"] - before["hits"] == 16000
+    assert stats["misses"] - before["misses"] == 16000
+    assert stats["saved_tokens"] - before["saved_tokens"] == 16000 * cache._prefixes[PREFIX].tokens
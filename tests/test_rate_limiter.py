@@ -0,0 +1,69 @@
+import pytest
+import rate_limiter
+from rate_limiter import RateLimiter, TokenBucket, get_rate_limiter
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(rate_limiter.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_bucket_waits_for_the_debt():
+    bucket = TokenBucket(60)
+    now = bucket.updated
+    assert bucket.reserve(60, now) == 0.0
+    # One per second refill; the next request waits a second
+    assert bucket.reserve(1, now) == pytest.approx(1.0)
+    bucket.refund(1, now)
+    assert bucket.reserve(1, now) == pytest.approx(1.0)
+
+
+def test_requests_budget(clock):
+    limiter = RateLimiter(requests_per_minute=2, tokens_per_minute=10 ** 6)
+    assert limiter._reserve(1) == 0.0
+    assert limiter._reserve(1) == 0.0
+    assert limiter._reserve(1) == pytest.approx(30.0)
+    clock[0] += 60.0
+    assert limiter._reserve(1) == 0.0
+
+
+def test_token_budget_and_usage_correction(clock):
+    limiter = RateLimiter(requests_per_minute=10 ** 6, tokens_per_minute=600)
+    assert limiter._reserve(300) == 0.0
+    # The call really used 600 tokens: the bucket is now empty
+    limiter.record_usage(300, 600)
+    assert limiter._reserve(60) == pytest.approx(6.0)
+
+
+def test_try_acquire_never_goes_into_debt(clock):
+    limiter = RateLimiter(requests_per_minute=1, tokens_per_minute=10 ** 6)
+    assert limiter.try_acquire()
+    assert not limiter.try_acquire()
+    assert limiter.requests.level == pytest.approx(0.0)
+
+
+def test_rate_limited_pauses_everyone_with_backoff(clock):
+    limiter = RateLimiter(requests_per_minute=10 ** 6, tokens_per_minute=10 ** 9, backoff=5.0, max_backoff=12.0)
+    limiter.report_rate_limited()
+    assert limiter.pause_remaining() == pytest.approx(5.0)
+    assert limiter._reserve(1) == pytest.approx(5.0)
+    assert not limiter.try_acquire()
+
+    clock[0] += 5.0
+    limiter.report_rate_limited()
+    assert limiter.pause_remaining() == pytest.approx(10.0)
+    clock[0] += 10.0
+    limiter.report_rate_limited()
+    assert limiter.pause_remaining() == pytest.approx(12.0)
+
+    clock[0] += 12.0
+    limiter.report_success()
+    limiter.report_rate_limited(retry_after=1.5)
+    assert limiter.pause_remaining() == pytest.approx(1.5)
+
+
+def test_shared_per_budget(stub_config):
+    assert get_rate_limiter(stub_config()) is get_rate_limiter(stub_config())
+    assert get_rate_limiter(stub_config()) is not get_rate_limiter(stub_config(requests_per_minute=7))
@@ -0,0 +1,187 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+import resilience
+from rate_limiter import RateLimiter
+from resilience import FATAL, RATE_LIMITED, TRANSIENT, CircuitBreaker, CircuitOpenError, Resilience, classify_error
+
+
+class _StatusError(Exception):
+    def __init__(self, code):
+        super().__init__(f"HTTP {code}")
+        self.code = code
+
+
+class _Response:
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+
+class _ResponseError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"HTTP {status_code}")
+        self.response = _Response(status_code)
+
+
+class ResourceExhausted(Exception):
+    pass
+
+
+class ServiceUnavailable(Exception):
+    pass
+
+
+@pytest.mark.parametrize("error, kind", [
+    (_StatusError(429), RATE_LIMITED),
+    (_ResponseError(429), RATE_LIMITED),
+    (ResourceExhausted("quota"), RATE_LIMITED),
+    (_StatusError(503), TRANSIENT),
+    (_ResponseError(500), TRANSIENT),
+    (ServiceUnavailable("down"), TRANSIENT),
+    (TimeoutError(), TRANSIENT),
+    (ConnectionResetError(), TRANSIENT),
+    (_StatusError(400), FATAL),
+    (ValueError("429 in the message is not a status"), FATAL),
+    (CircuitOpenError("open"), FATAL),
+])
+def test_classify_error(error, kind):
+    assert classify_error(error) == kind
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(resilience.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_circuit_opens_after_threshold(clock):
+    breaker = CircuitBreaker("test", failure_threshold=3, reset_timeout=10.0)
+    for _ in range(2):
+        breaker.allow()
+        breaker.record_failure()
+    assert breaker.state == "closed"
+
+    breaker.record_failure()
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        breaker.allow()
+    assert breaker.rejected == 1
+
+
+def test_success_resets_failure_count(clock):
+    breaker = CircuitBreaker("test", failure_threshold=2, reset_timeout=10.0)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == "closed"
+
+
+def test_half_open_probe_success_closes(clock):
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=10.0)
+    breaker.record_failure()
+    clock[0] += 10.0
+    assert breaker.state == "half_open"
+
+    breaker.allow()
+    # Only one probe at a time
+    with pytest.raises(CircuitOpenError):
+        breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed"
+    breaker.allow()
+
+
+def test_half_open_probe_failure_reopens(clock):
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=10.0)
+    breaker.record_failure()
+    clock[0] += 10.0
+    breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        breaker.allow()
+
+
+def test_released_probe_lets_another_through(clock):
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=10.0)
+    breaker.record_failure()
+    clock[0] += 10.0
+    breaker.allow()
+    breaker.release()
+    breaker.allow()
+
+
+
+@pytest.fixture
+def blocked():
+    """
+    A request that runs until released, on its own executor so that
+    asyncio.run does not wait for it.
+    """
+    release = threading.Event()
+    executor = ThreadPoolExecutor(max_workers=4)
+    yield release, executor
+    release.set()
+    executor.shutdown(wait=True)
+
+
+def _resilience(max_abandoned=8, deadline=120.0):
+    return Resilience(RateLimiter(10 ** 6, 10 ** 9), CircuitBreaker("test"),
+                      deadline=deadline, max_abandoned=max_abandoned)
+
+
+def _wait_for_no_abandoned(layer):
+    for _ in range(100):
+        if not layer.abandoned:
+            return
+        time.sleep(0.01)
+
+
+def test_timed_out_requests_are_counted_until_they_finish(blocked):
+    release, executor = blocked
+    layer = _resilience(deadline=0.05)
+
+    async def main():
+        with pytest.raises(asyncio.TimeoutError):
+            await layer.call(release.wait, 1, executor=executor)
+
+    asyncio.run(main())
+    assert layer.abandoned == 1
+    release.set()
+    _wait_for_no_abandoned(layer)
+    assert layer.abandoned == 0
+
+
+def test_cancelled_call_counts_its_request_as_abandoned(blocked):
+    release, executor = blocked
+    layer = _resilience()
+
+    async def main():
+        task = asyncio.create_task(layer.call(release.wait, 1, executor=executor))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    asyncio.run(main())
+    assert layer.abandoned == 1
+
+
+def test_new_calls_wait_while_too_many_requests_are_abandoned(blocked):
+    release, executor = blocked
+    layer = _resilience(max_abandoned=1, deadline=0.05)
+
+    async def main():
+        with pytest.raises(asyncio.TimeoutError):
+            await layer.call(release.wait, 1, executor=executor)
+        # The abandoned request finishes while the next call is waiting
+        threading.Timer(0.2, release.set).start()
+        started = time.perf_counter()
+        assert await layer.call(lambda: "reply", 1, executor=executor) == "reply"
+        return time.perf_counter() - started
+
+    assert asyncio.run(main()) >= 0.15
+    _wait_for_no_abandoned(layer)
+    assert layer.abandoned == 0
@@ -0,0 +1,115 @@
+import asyncio
+import threading
+import time
+import pytest
+from single_flight import SingleFlight
+
+
+def test_concurrent_async_calls_share_one_call():
+    flight = SingleFlight()
+    runs = []
+
+    async def work():
+        runs.append(1)
+        await asyncio.sleep(0.05)
+        return "result"
+
+    async def main():
+        return await asyncio.gather(*[flight.do("key", work) for _ in range(5)])
+
+    assert asyncio.run(main()) == ["result"] * 5
+    assert len(runs) == 1 and flight.shared == 4
+    assert flight.in_flight() == 0
+
+
+def test_errors_reach_every_caller():
+    flight = SingleFlight()
+
+    async def work():
+        await asyncio.sleep(0.05)
+        raise ValueError("failed")
+
+    async def main():
+        return await asyncio.gather(*[flight.do("key", work) for _ in range(3)], return_exceptions=True)
+
+    assert all(isinstance(result, ValueError) for result in asyncio.run(main()))
+
+
+def test_cancelled_caller_does_not_cancel_the_call():
+    flight = SingleFlight()
+
+    async def work():
+        await asyncio.sleep(0.05)
+        return "result"
+
+    async def main():
+        first = asyncio.create_task(flight.do("key", work))
+        second = asyncio.create_task(flight.do("key", work))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        return await second
+
+    assert asyncio.run(main()) == "result"
+
+
+def test_blocking_calls_share_one_call():
+    flight = SingleFlight()
+    runs = []
+    results = []
+
+    def work():
+        runs.append(1)
+        time.sleep(0.05)
+        return "result"
+
+    threads = [threading.Thread(target=lambda: results.append(flight.do_sync("key", work))) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == ["result"] * 4 and len(runs) == 1
+
+
+def test_async_and_blocking_callers_join_the_same_call():
+    flight = SingleFlight()
+    runs = []
+
+    async def work():
+        runs.append("async")
+        await asyncio.sleep(0.1)
+        return "result"
+
+    def blocking():
+        runs.append("sync")
+        return "other"
+
+    async def main():
+        leader = asyncio.create_task(flight.do("key", work))
+        await asyncio.sleep(0.01)
+        # A thread joining the async call, as decrypt_sync would
+        return await asyncio.gather(leader, asyncio.to_thread(flight.do_sync, "key", blocking))
+
+    assert asyncio.run(main()) == ["result", "result"]
+    assert runs == ["async"]
+
+
+def test_async_callers_join_a_blocking_call_from_another_loop():
+    flight = SingleFlight()
+    started = threading.Event()
+
+    def blocking():
+        started.set()
+        time.sleep(0.1)
+        raise ValueError("failed")
+
+    thread = threading.Thread(target=lambda: pytest.raises(ValueError, flight.do_sync, "key", blocking))
+    thread.start()
+    started.wait(5)
+
+    async def main():
+        return await flight.do("key", lambda: pytest.fail("not expected"))
+
+    with pytest.raises(ValueError):
+        asyncio.run(main())
+    thread.join()
+    assert flight.in_flight() == 0
@@ -0,0 +1,67 @@
+import asyncio
+import time
+from ai_agent import AIAgent
+from llm_backend import StubBackend
+from terminal_colors import TerminalColors
+from websocket_server import AgentServer
+
+HISTORY = [{"role": "client-agent", "content": "Hello"}]
+
+
+async def _collect(stream):
+    return [chunk async for chunk in stream]
+
+
+def test_stream_joins_to_the_full_reply(stub_config):
+    agent = AIAgent("Agent", TerminalColors.GREEN, stub_config(), backend=StubBackend(output_tokens=40))
+    chunks = asyncio.run(_collect(agent.astream(HISTORY)))
+
+    assert len(chunks) > 1
+    assert "".join(chunks) == agent.chat(HISTORY)
+
+
+def test_first_chunk_arrives_before_the_reply_is_done(stub_config):
+    backend = StubBackend(output_tokens=40, chunk_delay=0.05)
+    agent = AIAgent("Agent", TerminalColors.GREEN, stub_config(), backend=backend)
+
+    async def main():
+        started = time.perf_counter()
+        first = None
+        async for _ in agent.astream(HISTORY):
+            if first is None:
+                first = time.perf_counter() - started
+        return first, time.perf_counter() - started
+
+    first, total = asyncio.run(main())
+    assert first < total / 2
+
+
+def test_error_before_the_first_chunk_is_reported(stub_config):
+    agent = AIAgent("Agent", TerminalColors.GREEN, stub_config(retry_max_attempts=1),
+                    backend=StubBackend(error_rate=1.0))
+    chunks = asyncio.run(_collect(agent.astream(HISTORY)))
+    assert len(chunks) == 1 and chunks[0].startswith("Error:")
+
+
+def test_server_broadcasts_deltas_then_the_message(stub_config):
+    server = AgentServer(stub_config(server_decryption_enabled=False, stream_responses=True))
+    server.agent.backend = StubBackend(output_tokens=20)
+    frames = []
+
+    async def main():
+        async def broadcast(frame):
+            frames.append(frame)
+        server.broadcast = broadcast
+        server.deliver("a", {"role": "client-agent", "content": "Hello"})
+        for _ in range(500):
+            if frames and frames[-1]["type"] == "message":
+                break
+            await asyncio.sleep(0.01)
+        await server.shutdown()
+
+    asyncio.run(main())
+    deltas = [frame for frame in frames if frame["type"] == "delta"]
+    message = frames[-1]
+    assert deltas and message["type"] == "message"
+    assert all(frame["id"] == message["id"] and frame["session"] == "a" for frame in deltas)
+    assert "".join(frame["content"] for frame in deltas).strip() == message["content"]
@@ -0,0 +1,87 @@
+import asyncio
+import json
+import time
+import pytest
+from config import GeminiConfig
+import translator_client
+
+
+class _Socket:
+    open = False
+
+    def __init__(self, messages):
+        self.messages = messages
+
+    def __aiter__(self):
+        return self._frames()
+
+    async def _frames(self):
+        for index, content in enumerate(self.messages):
+            yield json.dumps({"type": "message", "id": str(index), "role": "server-agent", "content": content})
+            await asyncio.sleep(0.01)
+
+
+class _Decryptor:
+    def __init__(self, delays):
+        self.delays = delays
+        self.running = 0
+        self.peak = 0
+
+    async def decrypt(self, content):
+        self.running += 1
+        self.peak = max(self.peak, self.running)
+        await asyncio.sleep(self.delays.get(content, 0.1))
+        self.running -= 1
+        return f"decrypted {content}"
+
+
+@pytest.fixture
+def translator(stub_config, monkeypatch):
+    def build(messages, delays=None, **overrides):
+        config = stub_config(phrase_codec_enabled=False, **overrides)
+        monkeypatch.setattr(GeminiConfig, "get_default_config", classmethod(lambda cls: config))
+        client = translator_client.TranslatorClient()
+        client.decryptor = _Decryptor(delays or {})
+        client.websocket = _Socket(messages)
+        printed = []
+        client.print_translation = lambda entry, decrypted: printed.append((entry.content, decrypted))
+        return client, printed
+    return build
+
+
+def test_decrypts_concurrently_and_prints_in_arrival_order(translator):
+    messages = [f"msg {index}" for index in range(6)]
+    # The first message is the slowest, so later results finish first
+    client, printed = translator(messages, {"msg 0": 0.3}, translator_concurrency=3)
+
+    started = time.perf_counter()
+    asyncio.run(client.receive_messages())
+    elapsed = time.perf_counter() - started
+
+    assert printed == [(message, f"decrypted {message}") for message in messages]
+    assert client.decryptor.peak == 3
+    # One at a time would take 0.3 + 5 * 0.1 seconds
+    assert elapsed < 0.7
+
+
+def test_messages_older_than_max_lag_are_skipped(translator):
+    messages = [f"msg {index}" for index in range(4)]
+    client, printed = translator(messages, {"msg 0": 0.3}, translator_concurrency=1, translator_max_lag=0.1)
+
+    asyncio.run(client.receive_messages())
+
+    assert printed[0] == ("msg 0", "decrypted msg 0")
+    assert any(decrypted is None for _, decrypted in printed[1:])
+
+
+def test_failed_decryption_is_printed_in_place(translator):
+    client, printed = translator(["msg 0", "msg 1"])
+
+    async def decrypt(content):
+        if content == "msg 0":
+            raise RuntimeError("backend down")
+        return f"decrypted {content}"
+    client.decryptor.decrypt = decrypt
+
+    asyncio.run(client.receive_messages())
+    assert printed == [("msg 0", "[Decryption failed: backend down]"), ("msg 1", "decrypted msg 1")]
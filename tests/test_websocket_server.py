@@ -0,0 +1,98 @@
+import asyncio
+import threading
+import time
+from llm_backend import StubBackend
+from websocket_server import AgentServer
+
+
+class _ThreadRecordingBackend(StubBackend):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.threads = []
+
+    def _respond(self, chat, content):
+        self.threads.append(threading.current_thread().name)
+        return super()._respond(chat, content)
+
+
+def _server(stub_config, backend, **overrides):
+    server = AgentServer(stub_config(server_decryption_enabled=False, **overrides))
+    server.agent.backend = backend
+    return server
+
+
+async def _wait_for_turns(server, session_ids, turns, timeout=5.0):
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        if all(session_id in server.sessions and server.sessions[session_id].history.total_turns >= turns
+               for session_id in session_ids):
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError("sessions did not reply in time")
+
+
+def test_sessions_have_their_own_history_and_run_concurrently(stub_config):
+    backend = _ThreadRecordingBackend(latency=0.2)
+    server = _server(stub_config, backend)
+
+    async def main():
+        started = time.perf_counter()
+        for session_id in ("a", "b", "c"):
+            server.deliver(session_id, {"role": "client-agent", "content": f"hello from {session_id}"})
+        await _wait_for_turns(server, ("a", "b", "c"), 2)
+        elapsed = time.perf_counter() - started
+        await server.shutdown()
+        return elapsed
+
+    elapsed = asyncio.run(main())
+    # Three 0.2s calls in sequence would take 0.6s
+    assert elapsed < 0.5
+    assert [message["content"] for message in server.sessions["a"].history][0] == "hello from a"
+    assert server.sessions["b"].history.total_turns == 2
+
+
+def test_generation_runs_on_the_server_executor(stub_config):
+    backend = _ThreadRecordingBackend()
+    server = _server(stub_config, backend, server_max_concurrent_generations=2)
+
+    async def main():
+        server.deliver("a", {"role": "client-agent", "content": "hello"})
+        await _wait_for_turns(server, ("a",), 2)
+        await server.shutdown()
+
+    asyncio.run(main())
+    assert server.generation_executor._max_workers == 2
+    assert backend.threads and all(name.startswith("generation") for name in backend.threads)
+    # Shut down with the server
+    assert server.generation_executor._shutdown
+
+
+def test_generation_limit_is_shared_by_sessions(stub_config):
+    backend = _ThreadRecordingBackend(latency=0.1)
+    server = _server(stub_config, backend, server_max_concurrent_generations=1)
+
+    async def main():
+        started = time.perf_counter()
+        for session_id in ("a", "b"):
+            server.deliver(session_id, {"role": "client-agent", "content": "hello"})
+        await _wait_for_turns(server, ("a", "b"), 2)
+        elapsed = time.perf_counter() - started
+        await server.shutdown()
+        return elapsed
+
+    assert asyncio.run(main()) >= 0.2
+
+
+def test_messages_of_one_session_are_handled_in_order(stub_config):
+    server = _server(stub_config, StubBackend(latency=0.01))
+
+    async def main():
+        for index in range(3):
+            server.deliver("a", {"role": "client-agent", "content": f"message {index}"})
+        await _wait_for_turns(server, ("a",), 6)
+        await server.shutdown()
+
+    asyncio.run(main())
+    history = list(server.sessions["a"].history)
+    assert [message["content"] for message in history[0::2]] == [f"message {index}" for index in range(3)]
+    assert all(message["role"] == "server-agent" for message in history[1::2])
@@ -0,0 +1,65 @@
+import pytest
+from wire_protocol import (BINARY_SUBPROTOCOL, DEFLATE_SUBPROTOCOL, FLAG_DEFLATE, JSON_SUBPROTOCOL,
+                           SUBPROTOCOLS, ProtocolError, decode_frame, get_codec, offered_subprotocols)
+
+FRAMES = [
+    {"type": "message", "role": "client-agent", "content": "⟦LO-2⟧ SHECD: X-REQ Room|𝟏𝟏𝑷𝑴⟩ [CONF]?",
+     "seq": 1, "id": "m-1", "session": "s-1"},
+    {"type": "delta", "role": "server-agent", "content": "partial", "seq": 2, "id": "m-2"},
+    {"type": "message", "role": "observer-7", "content": "", "seq": 3},
+    {"type": "message", "role": "user", "content": "LOLANG " * 200, "seq": 2 ** 32 - 1, "session": "s-2"},
+]
+
+
+@pytest.mark.parametrize("subprotocol", SUBPROTOCOLS)
+@pytest.mark.parametrize("frame", FRAMES)
+def test_round_trip(subprotocol, frame):
+    codec = get_codec(subprotocol)
+    assert codec.name == subprotocol
+    encoded = codec.encode(frame)
+    assert codec.decode(encoded) == frame
+    assert decode_frame(encoded) == frame
+
+
+def test_deflate_only_compresses_large_bodies():
+    codec = get_codec(DEFLATE_SUBPROTOCOL, deflate_min_size=64)
+    small = codec.encode({"type": "message", "role": "user", "content": "hi", "seq": 1})
+    large = codec.encode(FRAMES[3])
+    assert not small[1] & FLAG_DEFLATE
+    assert large[1] & FLAG_DEFLATE
+    assert len(large) < len(get_codec(BINARY_SUBPROTOCOL).encode(FRAMES[3]))
+
+
+def test_unknown_subprotocol_falls_back_to_json():
+    assert get_codec(None).name == JSON_SUBPROTOCOL
+
+
+def test_offered_subprotocols_start_with_preference():
+    assert offered_subprotocols("bin") == [BINARY_SUBPROTOCOL, JSON_SUBPROTOCOL]
+    with pytest.raises(ValueError):
+        offered_subprotocols("xml")
+
+
+@pytest.mark.parametrize("message", [b"\x09\x00", b"\x01\x00\x00", "{not json"])
+def test_malformed_frames_raise_protocol_error(message):
+    with pytest.raises(ProtocolError):
+        decode_frame(message)
+
+
+@pytest.mark.parametrize("message", ["[1, 2]", '"text"', b"42", b'{"content": "\xff"}'])
+def test_non_object_and_undecodable_json_raise_protocol_error(message):
+    with pytest.raises(ProtocolError):
+        get_codec(JSON_SUBPROTOCOL).decode(message)
+
+
+def test_inflated_size_is_bounded():
+    frame = {"type": "message", "role": "user", "content": "A" * 100000, "seq": 1}
+    encoded = get_codec(DEFLATE_SUBPROTOCOL).encode(frame)
+    # A few hundred bytes on the wire
+    assert len(encoded) < 1000
+
+    with pytest.raises(ProtocolError):
+        decode_frame(encoded, max_size=10000)
+    with pytest.raises(ProtocolError):
+        get_codec(DEFLATE_SUBPROTOCOL, max_size=10000).decode(encoded)
+    assert decode_frame(encoded, max_size=200000) == frame
@@ -1,13 +1,15 @@
 import asyncio
-import json
 import logging
 import signal
 import sys
+import time
 from websockets.client import connect
 from terminal_colors import TerminalColors
 from config import GeminiConfig
 from lolang_decryptor import LolangDecryptor
 from message_visualizer import MessageVisualizer
+from output_sink import get_output_sink
+from wire_protocol import ProtocolError, decode_frame, offered_subprotocols
 
 # Set root logger to WARNING to suppress all INFO logs
 logging.basicConfig(level=logging.WARNING)
@@ -15,69 +17,171 @@ logging.basicConfig(level=logging.WARNING)
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.ERROR)
 
+class PendingTranslation:
+    """
+    A received message waiting for its decryption to be printed.
+    """
+
+    def __init__(self, role, content, streamed, task):
+        self.role = role
+        self.content = content
+        self.streamed = streamed
+        self.task = task
+        self.received_at = time.monotonic()
+
+
 class TranslatorClient:
     def __init__(self):
         self.config = GeminiConfig.get_default_config()
         self.decryptor = LolangDecryptor(self.config)
-        self.visualizer = MessageVisualizer()
+        self.visualizer = MessageVisualizer(get_output_sink(self.config))
         self.websocket = None
         self.running = True
         self.message_count = 0
+        self.skipped_count = 0
+        self.streaming_id = None  # Id of the message currently being streamed in
+        # Decryptions run concurrently; results are printed in arrival order
+        self.decrypt_slots = asyncio.Semaphore(self.config.translator_concurrency)
+        self.pending = asyncio.Queue(maxsize=self.config.translator_max_pending)
+        self.in_flight = 0
 
     async def connect(self, uri):
-        self.websocket = await connect(uri)
+        self.websocket = await connect(
+            uri,
+            subprotocols=offered_subprotocols(self.config.wire_format),
+            compression="deflate" if self.config.wire_transport_compression else None,
+            max_size=self.config.wire_max_frame_size,
+        )
         return self.websocket
 
+    @staticmethod
+    def role_colors(role):
+        # Encrypted and translated colors for a sender
+        if "server" in role.lower():
+            return TerminalColors.BLUE, TerminalColors.YELLOW
+        return TerminalColors.GREEN, TerminalColors.HEADER
+
     async def receive_messages(self):
         if not self.websocket:
             logger.error("Not connected to server")
             return
 
-        print(self.visualizer.visualize_system_message("Translator client connected. Translating all LOLANG messages in real-time."))
-        print(self.visualizer.visualize_system_message("Press Ctrl+C to stop the translator."))
-        print(self.visualizer.visualize_system_message("Waiting for messages..."))
-        print("-" * 80)  # Separator for better readability
+        self.visualizer.show_system_message("Translator client connected. Translating all LOLANG messages in real-time.")
+        self.visualizer.show_system_message("Press Ctrl+C to stop the translator.")
+        self.visualizer.show_system_message("Waiting for messages...")
+        self.visualizer.show_separator()
 
+        printer = asyncio.create_task(self.print_translations())
         try:
             async for message in self.websocket:
                 if not self.running:
                     break
 
-                data = json.loads(message)
+                try:
+                    data = decode_frame(message, self.config.wire_max_frame_size)
+                except ProtocolError as e:
+                    logger.warning(f"Dropping malformed frame: {e}")
+                    continue
                 content = data.get("content", "")
                 role = data.get("role", "server-agent")
-
-                # Determine the color based on the role
-                if "server" in role.lower():
-                    encrypted_color = TerminalColors.BLUE
-                    translated_color = TerminalColors.YELLOW
-                else:
-                    encrypted_color = TerminalColors.GREEN
-                    translated_color = TerminalColors.HEADER
+                encrypted_color, _ = self.role_colors(role)
 
                 # Format the role name for display
                 display_role = role.replace("-agent", "").title()
 
-                # Decrypt the message
-                decrypted_content = await self.decryptor.decrypt(content)
-
-                # Visualize both the encrypted and decrypted messages
-                print(TerminalColors.colorize(f"[ENCRYPTED] {display_role}: {content}", encrypted_color))
-                print(TerminalColors.colorize(f"[TRANSLATED] {display_role}: {decrypted_content}", translated_color))
-                print("-" * 80)  # Separator for better readability
-
-                # Increment message count
-                self.message_count += 1
+                # Show the encrypted text as it streams in, unless earlier
+                # translations are still waiting to be printed
+                if data.get("type") == "delta":
+                    if self.pending.empty() and data.get("id") != self.streaming_id:
+                        self.streaming_id = data.get("id")
+                        self.visualizer.show_stream_start(role, f"[ENCRYPTED] {display_role}: ", encrypted_color)
+                    if data.get("id") == self.streaming_id:
+                        self.visualizer.show_delta(role, content, encrypted_color)
+                    continue
+
+                streamed = self.streaming_id is not None and data.get("id") == self.streaming_id
+                if streamed:
+                    self.streaming_id = None
+                    self.visualizer.show_stream_end(role, content)
+
+                # Decrypt in the background and keep reading; waits only
+                # when too many messages are already pending
+                entry = PendingTranslation(role, content, streamed, None)
+                entry.task = asyncio.create_task(self.translate(entry))
+                await self.pending.put(entry)
+
+            # The server closed the connection; print what is still pending
+            if self.running:
+                await self.pending.join()
 
         except Exception as e:
-            print(TerminalColors.colorize(f"Error in receive_messages: {e}", TerminalColors.RED))
+            self.visualizer.show_error_message(f"Error in receive_messages: {e}")
         finally:
+            printer.cancel()
+            while not self.pending.empty():
+                self.pending.get_nowait().task.cancel()
             if self.websocket and self.websocket.open:
                 await self.websocket.close()
 
+    async def translate(self, entry):
+        """
+        Decrypt one message once a decryption slot is free.
+
+        Args:
+            entry (PendingTranslation): The message to decrypt.
+
+        Returns:
+            str or None: The decrypted message, or None if it was skipped
+            because the translator had fallen too far behind.
+        """
+        async with self.decrypt_slots:
+            max_lag = self.config.translator_max_lag
+            if max_lag is not None and time.monotonic() - entry.received_at > max_lag:
+                return None
+            self.in_flight += 1
+            try:
+                return await self.decryptor.decrypt(entry.content)
+            finally:
+                self.in_flight -= 1
+
+    async def print_translations(self):
+        # Awaiting each entry in turn re-sequences results into arrival order
+        while True:
+            entry = await self.pending.get()
+            try:
+                decrypted_content = await entry.task
+            except Exception as e:
+                decrypted_content = f"[Decryption failed: {e}]"
+            try:
+                self.print_translation(entry, decrypted_content)
+            finally:
+                self.pending.task_done()
+
+    def print_translation(self, entry, decrypted_content):
+        encrypted_color, translated_color = self.role_colors(entry.role)
+        display_role = entry.role.replace("-agent", "").title()
+        lag = time.monotonic() - entry.received_at
+
+        # Visualize both the encrypted and decrypted messages
+        if decrypted_content is None:
+            self.skipped_count += 1
+            self.visualizer.show_skipped(display_role, entry.content, lag, encrypted_color, entry.streamed)
+        else:
+            self.visualizer.show_translation(
+                display_role, entry.content, decrypted_content,
+                (encrypted_color, translated_color), entry.streamed,
+            )
+            # Increment message count
+            self.message_count += 1
+
+        # Show how far behind the conversation the translator is
+        if lag >= 1.0 or self.pending.qsize():
+            self.visualizer.show_lag(lag, self.pending.qsize(), self.in_flight)
+        self.visualizer.show_separator()
+
     def stop(self):
         self.running = False
-        print(TerminalColors.colorize("Translator client stopping...", TerminalColors.YELLOW))
+        self.visualizer.show_status("Translator client stopping...")
 
 # Handle Ctrl+C for Windows
 def signal_handler():
@@ -100,19 +204,20 @@ async def main():
 
     try:
         await translator.connect(uri)
-        print(TerminalColors.colorize("Translator connected to server", TerminalColors.HEADER))
+        translator.visualizer.show_status("Translator connected to server", TerminalColors.HEADER)
 
         # Start receiving and translating messages
         await translator.receive_messages()
 
     except KeyboardInterrupt:
-        print(TerminalColors.colorize("\nStopping translator client...", TerminalColors.YELLOW))
+        translator.visualizer.show_status("\nStopping translator client...")
     except Exception as e:
-        print(TerminalColors.colorize(f"Error in main: {e}", TerminalColors.RED))
+        translator.visualizer.show_error_message(f"Error in main: {e}")
     finally:
         if translator.websocket and translator.websocket.open:
             await translator.websocket.close()
-        print(TerminalColors.colorize("Connection closed", TerminalColors.YELLOW))
+        translator.visualizer.show_status("Connection closed")
+        translator.visualizer.flush()
 
 if __name__ == "__main__":
     try:
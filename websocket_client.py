@@ -1,14 +1,20 @@
+import argparse
 import asyncio
-import json
 import logging
+import os
 import signal
 import sys
+import uuid
 from websockets.client import connect
 from ai_agent import AIAgent
 from terminal_colors import TerminalColors
 from config import GeminiConfig
 from lolang_decryptor import LolangDecryptor
 from message_visualizer import MessageVisualizer
+from output_sink import get_output_sink
+from history_manager import ConversationHistory
+from conversation_store import get_shared_store
+from wire_protocol import ProtocolError, decode_frame, get_codec, offered_subprotocols
 
 # Set root logger to WARNING to suppress all INFO logs
 logging.basicConfig(level=logging.WARNING)
@@ -16,44 +22,105 @@ logging.basicConfig(level=logging.WARNING)
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.ERROR)
 
+# File in conversation_store_path that remembers the client's session id
+SESSION_FILE = "client-session"
+
+
+def resolve_session_id(config, session_id=None):
+    """
+    Pick the session id of the client's conversation.
+
+    An explicit id wins, then ``config.client_session_id``. Otherwise, with
+    a conversation store, the id saved in the store directory is reused
+    (and a new one saved on first run), so a restarted client reattaches
+    to its stored conversation. Without a store every run is a new
+    conversation.
+
+    Args:
+        config (GeminiConfig): The client configuration.
+        session_id (str, optional): An id given on the command line.
+
+    Returns:
+        str: The session id.
+    """
+    session_id = session_id or config.client_session_id
+    if session_id:
+        return session_id
+    if not config.conversation_store_path:
+        return uuid.uuid4().hex
+    path = os.path.join(config.conversation_store_path, SESSION_FILE)
+    try:
+        with open(path, encoding="utf-8") as session_file:
+            saved = session_file.read().strip()
+        if saved:
+            return saved
+    except FileNotFoundError:
+        pass
+    session_id = uuid.uuid4().hex
+    os.makedirs(config.conversation_store_path, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as session_file:
+        session_file.write(session_id + "\n")
+    return session_id
+
+
 class AgentClient:
-    def __init__(self):
+    def __init__(self, session_id=None):
         self.config = GeminiConfig.get_default_config()
         self.agent = AIAgent("Client-Agent", TerminalColors.GREEN, self.config)
         self.decryptor = LolangDecryptor(self.config)
-        self.visualizer = MessageVisualizer()
-        self.response_history = []
+        self.visualizer = MessageVisualizer(get_output_sink(self.config))
         self.websocket = None
+        self.codec = None
+        self.sequence = 0  # Sequence number of the last frame sent
+        # Identifies this conversation so the server keeps it separate; a
+        # restarted client with the same id picks up the stored history
+        self.session_id = resolve_session_id(self.config, session_id)
+        # Kept under its own key; the server stores its side under session_id
+        self.response_history = ConversationHistory.from_config(
+            self.config, get_shared_store(self.config), f"{self.agent.name}/{self.session_id}",
+            summarizer=self.agent.summarize,
+        )
         self.running = True
         self.conversation_count = 0
+        self.streaming_id = None  # Id of the message currently being streamed in
         self.max_conversations = 20  # Set the number of conversation turns
 
     async def connect(self, uri):
-        self.websocket = await connect(uri)
-        print(TerminalColors.colorize(f"Connected to {uri}", TerminalColors.YELLOW))
+        self.websocket = await connect(
+            uri,
+            subprotocols=offered_subprotocols(self.config.wire_format),
+            compression="deflate" if self.config.wire_transport_compression else None,
+            max_size=self.config.wire_max_frame_size,
+        )
+        # Older servers accept no subprotocol; fall back to JSON
+        self.codec = get_codec(self.websocket.subprotocol, self.config.wire_deflate_min_size)
+        self.visualizer.show_status(f"Connected to {uri} ({self.codec.name})")
         return self.websocket
 
     async def send_message(self, content):
         if not self.websocket:
-            print(TerminalColors.colorize("Not connected to server", TerminalColors.RED))
+            self.visualizer.show_status("Not connected to server", TerminalColors.RED)
             return
 
         # Add to history
-        self.response_history.append({"role": "client-agent", "content": content})
+        await self.response_history.aappend("client-agent", content)
 
         # For initial human message, display without decryption
-        if len(self.response_history) == 1:
-            print(self.visualizer.visualize_message("You", content))
+        if self.response_history.total_turns == 1:
+            self.visualizer.show_message("You", content)
 
         # Send to server
-        await self.websocket.send(json.dumps({
+        self.sequence += 1
+        await self.websocket.send(self.codec.encode({
             "role": "client-agent",
-            "content": content
+            "content": content,
+            "session": self.session_id,
+            "seq": self.sequence
         }))
 
     async def receive_messages(self):
         if not self.websocket:
-            print(TerminalColors.colorize("Not connected to server", TerminalColors.RED))
+            self.visualizer.show_status("Not connected to server", TerminalColors.RED)
             return
 
         try:
@@ -61,53 +128,93 @@ class AgentClient:
                 if not self.running:
                     break
 
-                data = json.loads(message)
+                try:
+                    data = decode_frame(message, self.config.wire_max_frame_size)
+                except ProtocolError as e:
+                    logger.warning(f"Dropping malformed frame: {e}")
+                    continue
+                # Skip replies that belong to other conversations on the server
+                if data.get("session", self.session_id) != self.session_id:
+                    continue
                 content = data.get("content", "")
                 role = data.get("role", "server-agent")
 
+                # Render partial chunks as they arrive; reply only to the final frame
+                if data.get("type") == "delta":
+                    if data.get("id") != self.streaming_id:
+                        self.streaming_id = data.get("id")
+                        self.visualizer.show_stream_start(role)
+                    self.visualizer.show_delta(role, content)
+                    continue
+
                 # Add to history
-                self.response_history.append({"role": role, "content": content})
+                await self.response_history.aappend(role, content)
 
                 # Visualize server message without decryption
-                print(self.visualizer.visualize_message(role, content))
+                if self.streaming_id is not None and data.get("id") == self.streaming_id:
+                    # Already rendered chunk by chunk; finish the line
+                    self.streaming_id = None
+                    self.visualizer.show_stream_end(role, content)
+                else:
+                    self.visualizer.show_message(role, content)
 
                 # Increment conversation count
                 self.conversation_count += 1
 
                 # Check if we've reached the maximum number of conversations
                 if self.conversation_count >= self.max_conversations:
-                    print(self.visualizer.visualize_system_message("Maximum conversation turns reached. Ending conversation."))
+                    self.visualizer.show_system_message("Maximum conversation turns reached. Ending conversation.")
                     self.running = False
                     break
 
-                # Generate response with a delay to prevent overwhelming
-                await asyncio.sleep(5)
-                response = self.agent.chat(self.response_history)
-                formatted_response = response.strip().replace('\n', ' ').replace('  ', ' ')
-
-                # Visualize client response without decryption
-                print(self.visualizer.visualize_client_message(formatted_response))
-
                 # Send response
-                await self.send_message(formatted_response)
+                await self.send_message(await self.generate_reply())
 
         except Exception as e:
-            print(TerminalColors.colorize(f"Error in receive_messages: {e}", TerminalColors.RED))
+            self.visualizer.show_error_message(f"Error in receive_messages: {e}")
         finally:
             if self.websocket and self.websocket.open:
                 await self.websocket.close()
 
+    async def generate_reply(self):
+        # The shared rate limiter paces the calls
+        if self.config.stream_responses:
+            response = await self.stream_response()
+        else:
+            response = await self.agent.achat(self.response_history, session_id=self.agent.name)
+        formatted_response = response.strip().replace('\n', ' ').replace('  ', ' ')
+
+        # Visualize client response without decryption
+        if not self.config.stream_responses:
+            self.visualizer.show_message("Client-Agent", formatted_response)
+        return formatted_response
+
+    async def stream_response(self):
+        # Render our own reply progressively while it is generated
+        self.visualizer.show_stream_start("Client-Agent")
+        chunks = []
+        async for chunk in self.agent.astream(self.response_history, session_id=self.agent.name):
+            chunks.append(chunk)
+            self.visualizer.show_delta("Client-Agent", chunk)
+        response = "".join(chunks)
+        self.visualizer.show_stream_end("Client-Agent", response)
+        return response
+
     def stop(self):
         self.running = False
-        print(TerminalColors.colorize("Client stopping...", TerminalColors.YELLOW))
+        self.visualizer.show_status("Client stopping...")
 
 # Handle Ctrl+C for Windows
 def signal_handler():
     print(TerminalColors.colorize("\nStopping client...", TerminalColors.YELLOW))
     sys.exit(0)
 
-async def main():
-    client = AgentClient()
+async def main(argv=None):
+    parser = argparse.ArgumentParser(description="LOLANG agent client.")
+    parser.add_argument("--session", help="Conversation id to join or resume (default: saved in the store, or new)")
+    args = parser.parse_args(argv)
+
+    client = AgentClient(args.session)
     uri = "ws://localhost:8765"
 
     # Handle graceful shutdown based on platform
@@ -123,22 +230,30 @@ async def main():
     try:
         await client.connect(uri)
 
-        # Send initial message
-        initial_message = "Hello, are you an AI agent? Let's discuss artificial intelligence using LOLANG."
-        # Note: The visualizer will be called in the send_message method
-        await client.send_message(initial_message)
+        if client.response_history.total_turns == 0:
+            # Send initial message
+            initial_message = "Hello, are you an AI agent? Let's discuss artificial intelligence using LOLANG."
+            # Note: The visualizer will be called in the send_message method
+            await client.send_message(initial_message)
+        else:
+            # Resumed from the conversation store; carry on from the last turn
+            client.visualizer.show_status(
+                f"Resuming conversation {client.session_id} ({client.response_history.total_turns} turns)"
+            )
+            await client.send_message(await client.generate_reply())
 
         # Start receiving messages
         await client.receive_messages()
 
     except KeyboardInterrupt:
-        print(TerminalColors.colorize("\nStopping client...", TerminalColors.YELLOW))
+        client.visualizer.show_status("\nStopping client...")
     except Exception as e:
-        print(TerminalColors.colorize(f"Error in main: {e}", TerminalColors.RED))
+        client.visualizer.show_error_message(f"Error in main: {e}")
     finally:
         if client.websocket and client.websocket.open:
             await client.websocket.close()
-        print(TerminalColors.colorize("Connection closed", TerminalColors.YELLOW))
+        client.visualizer.show_status("Connection closed")
+        client.visualizer.flush()
 
 if __name__ == "__main__":
     try:
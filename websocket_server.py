@@ -1,14 +1,24 @@
 import asyncio
-import json
 import logging
 import signal
 import sys
+import time
+import uuid
+import weakref
+from concurrent.futures import ThreadPoolExecutor
 from websockets.server import serve
 from ai_agent import AIAgent
 from terminal_colors import TerminalColors
 from config import GeminiConfig
 from lolang_decryptor import LolangDecryptor
+from decryption_pipeline import DecryptionPipeline
+from broadcaster import Broadcaster
 from message_visualizer import MessageVisualizer
+from output_sink import get_output_sink
+from history_manager import ConversationHistory
+from conversation_store import get_shared_store
+from metrics import GENERATION_QUEUE_SECONDS, REGISTRY, MetricsServer
+from wire_protocol import SUBPROTOCOLS, ProtocolError, decode_frame, get_codec
 
 # Set root logger to WARNING to suppress all INFO logs
 logging.basicConfig(level=logging.WARNING)
@@ -16,78 +26,308 @@ logging.basicConfig(level=logging.WARNING)
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.ERROR)
 
+# Servers running in this process; the gauges below add them up
+_servers = weakref.WeakSet()
+
+
+def _total(value):
+    return lambda: sum(value(server) for server in list(_servers))
+
+
+# Registered once per process and computed at scrape time, so they never go stale
+REGISTRY.gauge("connected_clients", "Open client connections", _total(lambda server: len(server.clients)))
+REGISTRY.gauge("sessions", "Active conversations", _total(lambda server: len(server.sessions)))
+REGISTRY.gauge(
+    "history_messages", "Messages kept in conversation histories",
+    _total(lambda server: sum(len(state.history) for state in server.sessions.values())),
+)
+REGISTRY.gauge(
+    "history_tokens", "Estimated tokens kept in conversation histories",
+    _total(lambda server: sum(state.history.token_count for state in server.sessions.values())),
+)
+REGISTRY.gauge(
+    "decryption_queue_depth", "Messages waiting for background decryption",
+    _total(lambda server: server.decryption_pipeline.queue.qsize() if server.decryption_pipeline else 0),
+)
+
+class ConversationState:
+    """
+    State for one conversation hosted by the server: its own history and
+    an inbox of pending messages processed in order by a dedicated task.
+    """
+
+    def __init__(self, session_id, history, inbox_size):
+        self.session_id = session_id
+        self.history = history
+        self.inbox = asyncio.Queue(maxsize=inbox_size)
+        self.websockets = set()
+        self.task = None
+
+
 class AgentServer:
-    def __init__(self):
-        self.config = GeminiConfig.get_default_config()
+    def __init__(self, config=None):
+        self.config = config or GeminiConfig.get_default_config()
         self.agent = AIAgent("Server-Agent", TerminalColors.BLUE, self.config)
         self.decryptor = LolangDecryptor(self.config)
-        self.visualizer = MessageVisualizer()
+        # Optional background decryption that warms the shared cache
+        self.decryption_pipeline = None
+        if self.config.server_decryption_enabled:
+            self.decryption_pipeline = DecryptionPipeline(
+                self.decryptor,
+                queue_size=self.config.server_decryption_queue_size,
+                workers=self.config.server_decryption_workers,
+            )
+        self.visualizer = MessageVisualizer(get_output_sink(self.config))
         self.clients = set()
-        self.response_history = []
+        self.broadcaster = Broadcaster(
+            queue_size=self.config.subscriber_queue_size,
+            policy=self.config.slow_consumer_policy,
+        )
+        # One conversation per session id, each with its own history; with a
+        # conversation store, histories survive restarts
+        self.store = get_shared_store(self.config)
+        self.sessions = {}
+        # In multi-process mode: relays broadcasts and routes sessions owned
+        # by other workers (see multiprocess_server.ClusterLink)
+        self.cluster = None
+        self.remote_sessions = {}  # session id -> local websockets using it
+        # Bounds concurrent LLM calls; waiters are served in FIFO order and
+        # each session has at most one waiter, so sessions take turns fairly
+        self.generation_slots = asyncio.Semaphore(self.config.server_max_concurrent_generations)
+        # Model calls get their own threads, so they never wait behind (or
+        # starve) other to_thread work such as store writes; a hedged call
+        # may use a second thread
+        generation_threads = self.config.server_max_concurrent_generations
+        if self.config.hedge_enabled:
+            generation_threads *= 2
+        self.generation_executor = ThreadPoolExecutor(
+            max_workers=generation_threads, thread_name_prefix="generation"
+        )
+        self.agent.executor = self.generation_executor
+        self.sequence = 0  # Sequence number of the last broadcast frame
         self.running = True
+        _servers.add(self)
+
+    def metrics_snapshot(self):
+        """
+        Return the current metrics of this server.
+
+        Returns:
+            dict: Every registered metric, plus broadcast and cache
+            statistics that are tracked outside the registry. Metrics in
+            the registry cover every server of the process.
+        """
+        snapshot = REGISTRY.snapshot()
+        subscribers = list(self.broadcaster.subscribers.values())
+        snapshot["broadcast"] = {
+            "subscribers": len(subscribers),
+            "frames_sent": sum(subscriber.sent for subscriber in subscribers),
+            "frames_dropped": sum(subscriber.dropped for subscriber in subscribers),
+            "bytes_sent": sum(subscriber.bytes_sent for subscriber in subscribers),
+        }
+        if self.decryption_pipeline:
+            snapshot["decryption_pipeline"] = {
+                "processed": self.decryption_pipeline.processed,
+                "dropped": self.decryption_pipeline.dropped,
+            }
+        if self.decryptor.cache is not None:
+            snapshot["decryption_cache"] = self.decryptor.cache.stats()
+        return snapshot
+
+    def start(self):
+        """
+        Start background work on the running event loop. Called once the
+        server is listening; sessions created before that (for example by
+        a message forwarded from another worker) start it as well.
+        """
+        if self.decryption_pipeline:
+            self.decryption_pipeline.start()
 
     async def register(self, websocket):
         self.clients.add(websocket)
-        print(TerminalColors.colorize(f"Client connected. Total clients: {len(self.clients)}", TerminalColors.YELLOW))
+        # Peers that negotiated no subprotocol get JSON frames
+        codec = get_codec(websocket.subprotocol, self.config.wire_deflate_min_size)
+        self.broadcaster.subscribe(websocket, codec)
+        self.visualizer.show_status(f"Client connected. Total clients: {len(self.clients)}")
 
     async def unregister(self, websocket):
         self.clients.remove(websocket)
-        print(TerminalColors.colorize(f"Client disconnected. Total clients: {len(self.clients)}", TerminalColors.YELLOW))
+        self.broadcaster.unsubscribe(websocket)
+        for session_id in [sid for sid, state in self.sessions.items() if websocket in state.websockets]:
+            state = self.sessions[session_id]
+            state.websockets.discard(websocket)
+            if not state.websockets:
+                self.close_session(session_id)
+        for session_id in [sid for sid, sockets in self.remote_sessions.items() if websocket in sockets]:
+            sockets = self.remote_sessions[session_id]
+            sockets.discard(websocket)
+            if not sockets:
+                del self.remote_sessions[session_id]
+                self.cluster.close_remote(session_id)
+        self.visualizer.show_status(f"Client disconnected. Total clients: {len(self.clients)}")
+
+    def get_session(self, session_id, websocket=None):
+        state = self.sessions.get(session_id)
+        if state is None:
+            self.start()
+            state = ConversationState(
+                session_id,
+                ConversationHistory.from_config(self.config, self.store, session_id,
+                                                summarizer=self.agent.summarize),
+                self.config.server_session_queue_size,
+            )
+            state.task = asyncio.create_task(self.run_session(state))
+            self.sessions[session_id] = state
+        if websocket is not None:
+            state.websockets.add(websocket)
+        return state
+
+    def close_session(self, session_id):
+        state = self.sessions.pop(session_id, None)
+        if state is not None:
+            state.task.cancel()
+            self.agent.close_session(session_id)
 
-    async def process_message(self, websocket, message):
-        data = json.loads(message)
+    async def run_session(self, state):
+        # Messages of one conversation are handled strictly in order
+        while True:
+            enqueued_at, data = await state.inbox.get()
+            try:
+                async with self.generation_slots:
+                    # Covers both the inbox and the wait for a generation slot
+                    GENERATION_QUEUE_SECONDS.observe(time.perf_counter() - enqueued_at)
+                    await self.process_message(state, data)
+            except Exception as e:
+                self.visualizer.show_error_message(str(e))
+
+    async def process_message(self, state, data):
         content = data.get("content", "")
         role = data.get("role", "user")
 
         # Add message to history
-        self.response_history.append({"role": role, "content": content})
+        await state.history.aappend(role, content)
 
-        # Still decrypt for internal processing but don't display
-        decrypted_client_message = await self.decryptor.decrypt(content)
+        # Decrypt in the background; the response never waits for it
+        self.submit_for_decryption(content)
 
         # Visualize client message without decryption
-        print(self.visualizer.visualize_message(role, content))
+        self.visualizer.show_message(role, content)
 
-        # Generate response
-        response = self.agent.chat(self.response_history)
+        # Generate response, streaming partial chunks to peers if enabled
+        message_id = uuid.uuid4().hex
+        if self.config.stream_responses:
+            response = await self.stream_response(state, message_id)
+        else:
+            response = await self.agent.achat(state.history, session_id=state.session_id)
         formatted_response = response.strip().replace('\n', ' ').replace('  ', ' ')
 
-        # Still decrypt for internal processing but don't display
-        decrypted_server_response = await self.decryptor.decrypt(formatted_response)
-
         # Visualize server response without decryption
-        print(self.visualizer.visualize_server_message(formatted_response))
+        self.visualizer.show_message("Server-Agent", formatted_response)
 
         # Add to history
-        self.response_history.append({"role": "server-agent", "content": formatted_response})
+        await state.history.aappend("server-agent", formatted_response)
 
         # Send response to all clients (without decrypted content)
-        await self.broadcast(json.dumps({
+        await self.broadcast({
+            "type": "message",
+            "id": message_id,
             "role": "server-agent",
-            "content": formatted_response
-        }))
+            "content": formatted_response,
+            "session": state.session_id
+        })
 
-    async def broadcast(self, message):
-        if self.clients:
-            await asyncio.gather(
-                *[client.send(message) for client in self.clients]
-            )
+        self.submit_for_decryption(formatted_response)
+
+    async def stream_response(self, state, message_id):
+        chunks = []
+        async for chunk in self.agent.astream(state.history, session_id=state.session_id):
+            chunks.append(chunk)
+            await self.broadcast({
+                "type": "delta",
+                "id": message_id,
+                "role": "server-agent",
+                "content": chunk,
+                "session": state.session_id
+            })
+        return "".join(chunks)
+
+    def submit_for_decryption(self, content):
+        if self.decryption_pipeline and not self.decryption_pipeline.submit(content):
+            logger.warning("Decryption queue full, skipping message")
 
-    async def handler(self, websocket, path):
+    async def broadcast(self, frame):
+        # Queued per subscriber; slow or dead clients can't stall the fan-out
+        self.sequence += 1
+        # Other workers number their frames too; keep the numbers apart
+        frame["seq"] = self.sequence if self.cluster is None else self.cluster.sequence(self.sequence)
+        self.broadcaster.publish(frame)
+        if self.cluster is not None:
+            # Observers connected to other workers see the frame too
+            self.cluster.publish(frame)
+
+    async def handler(self, websocket, path=None):
         await self.register(websocket)
         try:
             async for message in websocket:
                 if not self.running:
                     break
-                await self.process_message(websocket, message)
+                try:
+                    data = decode_frame(message, self.config.wire_max_frame_size)
+                except ProtocolError as e:
+                    logger.warning(f"Dropping malformed frame: {e}")
+                    continue
+                # Clients without a session id get one conversation per connection
+                session_id = data.get("session") or f"conn-{id(websocket)}"
+                if self.cluster is not None and not self.cluster.owns(session_id):
+                    # Another worker owns this conversation; the reply comes
+                    # back through the broadcast relay
+                    self.remote_sessions.setdefault(session_id, set()).add(websocket)
+                    data["session"] = session_id
+                    self.cluster.forward(session_id, data)
+                    continue
+                state = self.get_session(session_id, websocket)
+                # Waits when the conversation's inbox is full (backpressure)
+                await state.inbox.put((time.perf_counter(), data))
         except Exception as e:
-            print(TerminalColors.colorize(f"Error: {e}", TerminalColors.RED))
+            self.visualizer.show_error_message(str(e))
         finally:
             await self.unregister(websocket)
 
+    def deliver(self, session_id, data):
+        """
+        Queue a message forwarded by another worker for a session owned here.
+
+        Args:
+            session_id (str): The session the message belongs to.
+            data (dict): The decoded frame.
+
+        Returns:
+            bool: False if the session's inbox was full and the message was dropped.
+        """
+        state = self.get_session(session_id)
+        try:
+            state.inbox.put_nowait((time.perf_counter(), data))
+            return True
+        except asyncio.QueueFull:
+            logger.warning(f"Inbox of session {session_id} full, dropping forwarded message")
+            return False
+
+    async def shutdown(self):
+        """
+        Stop background work, the generation threads and close the
+        conversation store.
+        """
+        if self.decryption_pipeline:
+            await self.decryption_pipeline.stop()
+        # Calls still running finish in their threads; queued ones are dropped
+        self.generation_executor.shutdown(wait=False, cancel_futures=True)
+        _servers.discard(self)
+        if self.store:
+            self.store.close()
+
     def stop(self):
         self.running = False
-        print(TerminalColors.colorize("Server stopping...", TerminalColors.YELLOW))
+        self.visualizer.show_status("Server stopping...")
 
 # Handle Ctrl+C for Windows
 def signal_handler():
@@ -107,23 +347,44 @@ async def main():
         # We'll rely on KeyboardInterrupt exception instead
         pass
 
-    server = await serve(agent_server.handler, "localhost", 8765)
-    print("Server started at ws://localhost:8765")
-    print("Press Ctrl+C to stop the server")
+    server = await serve(
+        agent_server.handler, "localhost", 8765,
+        subprotocols=SUBPROTOCOLS,
+        compression="deflate" if agent_server.config.wire_transport_compression else None,
+        max_size=agent_server.config.wire_max_frame_size,
+    )
+    agent_server.start()
+    agent_server.visualizer.show_status("Server started at ws://localhost:8765", color=None)
+    metrics_server = None
+    if agent_server.config.metrics_port is not None:
+        metrics_server = MetricsServer(host=agent_server.config.metrics_host, port=agent_server.config.metrics_port)
+        await metrics_server.start()
+        agent_server.visualizer.show_status(f"Metrics at http://{metrics_server.host}:{metrics_server.port}/metrics", color=None)
+    agent_server.visualizer.show_status("Press Ctrl+C to stop the server", color=None)
 
     try:
         while agent_server.running:
             await asyncio.sleep(1)
     except KeyboardInterrupt:
-        print(TerminalColors.colorize("\nStopping server...", TerminalColors.YELLOW))
+        agent_server.visualizer.show_status("\nStopping server...")
     finally:
         server.close()
         await server.wait_closed()
-        print(TerminalColors.colorize("Server closed", TerminalColors.YELLOW))
+        await agent_server.shutdown()
+        if metrics_server:
+            await metrics_server.stop()
+        agent_server.visualizer.show_status("Server closed")
+        agent_server.visualizer.flush()
 
 if __name__ == "__main__":
     try:
-        asyncio.run(main())
+        if GeminiConfig.get_default_config().server_workers > 1:
+            from multiprocess_server import run_supervisor
+            # The supervisor reports startup and worker restarts at INFO
+            logging.getLogger("multiprocess_server").setLevel(logging.INFO)
+            run_supervisor(GeminiConfig.get_default_config(), "localhost", 8765)
+        else:
+            asyncio.run(main())
     except KeyboardInterrupt:
         signal_handler()
 
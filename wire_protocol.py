@@ -0,0 +1,247 @@
+"""
+Wire protocol for frames exchanged between agents, the server and translators.
+
+Frames are plain dicts (type, id, role, content, session, seq). How they are
+put on the wire is negotiated through WebSocket subprotocols:
+
+    lolang.v1.bin+deflate  binary frames, payloads deflated when it pays off
+    lolang.v1.bin          binary frames
+    lolang.v1.json         compact UTF-8 JSON
+
+Peers that offer no subprotocol get JSON, so older clients keep working.
+
+Binary frame layout (big endian):
+
+    u8  version
+    u8  flags            bit 0: body is raw-deflated
+    --- body ---
+    u8  frame type id    0 message, 1 delta
+    u8  role id          index into ROLES, 255 = role string follows
+    u32 sequence number
+    u16 + bytes          message id (UTF-8)
+    u16 + bytes          session id (UTF-8)
+    [u16 + bytes]        role, only when the role id is 255
+    u32 + bytes          content (UTF-8)
+"""
+import json
+import struct
+import zlib
+
+PROTOCOL_VERSION = 1
+
+DEFLATE_SUBPROTOCOL = "lolang.v1.bin+deflate"
+BINARY_SUBPROTOCOL = "lolang.v1.bin"
+JSON_SUBPROTOCOL = "lolang.v1.json"
+# In order of preference
+SUBPROTOCOLS = (DEFLATE_SUBPROTOCOL, BINARY_SUBPROTOCOL, JSON_SUBPROTOCOL)
+
+FRAME_TYPES = ("message", "delta")
+ROLES = ("client-agent", "server-agent", "user", "system")
+CUSTOM_ROLE = 255
+FLAG_DEFLATE = 0x01
+
+# Largest frame body accepted after decompression; the websockets default max_size
+DEFAULT_MAX_FRAME_SIZE = 2 ** 20
+
+_PREAMBLE = struct.Struct("!BB")
+_HEADER = struct.Struct("!BBI")
+_SHORT = struct.Struct("!H")
+_LONG = struct.Struct("!I")
+_FRAME_TYPE_IDS = {name: index for index, name in enumerate(FRAME_TYPES)}
+_ROLE_IDS = {name: index for index, name in enumerate(ROLES)}
+
+
+class ProtocolError(ValueError):
+    """
+    Raised for frames that cannot be decoded.
+    """
+
+
+class JsonCodec:
+    """
+    Compact JSON frames. Glyphs are sent as UTF-8 instead of \\u escapes.
+    """
+
+    name = JSON_SUBPROTOCOL
+
+    def encode(self, frame):
+        return json.dumps(frame, ensure_ascii=False, separators=(",", ":"))
+
+    def decode(self, message):
+        try:
+            if isinstance(message, bytes):
+                message = message.decode("utf-8")
+            frame = json.loads(message)
+        except ValueError as e:
+            # Includes UnicodeDecodeError
+            raise ProtocolError(f"Invalid JSON frame: {e}") from e
+        if not isinstance(frame, dict):
+            raise ProtocolError(f"Expected a JSON object, got {type(frame).__name__}")
+        return frame
+
+
+class BinaryCodec:
+    """
+    Binary frames with interned frame types and roles, length-prefixed
+    UTF-8 fields and optional raw deflate of the body.
+    """
+
+    def __init__(self, deflate=False, deflate_min_size=64, max_size=DEFAULT_MAX_FRAME_SIZE):
+        """
+        Initialize the codec.
+
+        Args:
+            deflate (bool): Compress frame bodies.
+            deflate_min_size (int): Bodies smaller than this many bytes are
+                sent as is; deflate only adds overhead to short frames.
+            max_size (int): Largest body accepted once inflated, so a small
+                compressed frame cannot expand without bound.
+        """
+        self.deflate = deflate
+        self.deflate_min_size = deflate_min_size
+        self.max_size = max_size
+        self.name = DEFLATE_SUBPROTOCOL if deflate else BINARY_SUBPROTOCOL
+
+    def encode(self, frame):
+        frame_type = frame.get("type", "message")
+        role = frame.get("role", "")
+        role_id = _ROLE_IDS.get(role, CUSTOM_ROLE)
+        parts = [
+            _HEADER.pack(_FRAME_TYPE_IDS.get(frame_type, 0), role_id, frame.get("seq", 0) & 0xFFFFFFFF),
+            *_short_field(frame.get("id") or ""),
+            *_short_field(frame.get("session") or ""),
+        ]
+        if role_id == CUSTOM_ROLE:
+            parts.extend(_short_field(role))
+        content = (frame.get("content") or "").encode("utf-8")
+        parts.append(_LONG.pack(len(content)))
+        parts.append(content)
+        body = b"".join(parts)
+
+        flags = 0
+        if self.deflate and len(body) >= self.deflate_min_size:
+            compressor = zlib.compressobj(wbits=-15)
+            compressed = compressor.compress(body) + compressor.flush()
+            if len(compressed) < len(body):
+                body = compressed
+                flags |= FLAG_DEFLATE
+        return _PREAMBLE.pack(PROTOCOL_VERSION, flags) + body
+
+    def decode(self, message):
+        if isinstance(message, str):
+            raise ProtocolError("Expected a binary frame")
+        try:
+            version, flags = _PREAMBLE.unpack_from(message, 0)
+            if version != PROTOCOL_VERSION:
+                raise ProtocolError(f"Unsupported protocol version: {version}")
+            body = memoryview(message)[_PREAMBLE.size:]
+            if flags & FLAG_DEFLATE:
+                decompressor = zlib.decompressobj(wbits=-15)
+                body = decompressor.decompress(body, self.max_size)
+                if decompressor.unconsumed_tail:
+                    raise ProtocolError(f"Frame inflates to more than {self.max_size} bytes")
+                body = memoryview(body)
+
+            type_id, role_id, seq = _HEADER.unpack_from(body, 0)
+            offset = _HEADER.size
+            message_id, offset = _read_field(body, offset, _SHORT)
+            session, offset = _read_field(body, offset, _SHORT)
+            if role_id == CUSTOM_ROLE:
+                role, offset = _read_field(body, offset, _SHORT)
+            else:
+                role = ROLES[role_id]
+            content, offset = _read_field(body, offset, _LONG)
+        except (struct.error, zlib.error, IndexError, UnicodeDecodeError) as e:
+            raise ProtocolError(f"Invalid binary frame: {e}") from e
+
+        frame = {
+            "type": FRAME_TYPES[type_id] if type_id < len(FRAME_TYPES) else "message",
+            "role": role,
+            "content": content,
+            "seq": seq,
+        }
+        # Match the JSON frames, which omit fields that were never set
+        if message_id:
+            frame["id"] = message_id
+        if session:
+            frame["session"] = session
+        return frame
+
+
+def _short_field(text):
+    data = text.encode("utf-8")
+    if len(data) > 0xFFFF:
+        raise ProtocolError("Field too long for a binary frame")
+    return _SHORT.pack(len(data)), data
+
+
+def _read_field(body, offset, length_struct):
+    (length,) = length_struct.unpack_from(body, offset)
+    offset += length_struct.size
+    end = offset + length
+    if end > len(body):
+        raise ProtocolError("Truncated binary frame")
+    return str(body[offset:end], "utf-8"), end
+
+
+def get_codec(subprotocol, deflate_min_size=64, max_size=DEFAULT_MAX_FRAME_SIZE):
+    """
+    Return the codec for a negotiated subprotocol.
+
+    Args:
+        subprotocol (str): The subprotocol chosen in the handshake, or None.
+        deflate_min_size (int): Smallest body worth deflating.
+        max_size (int): Largest frame body accepted once inflated.
+
+    Returns:
+        JsonCodec or BinaryCodec: The codec to encode outgoing frames with.
+    """
+    if subprotocol == DEFLATE_SUBPROTOCOL:
+        return BinaryCodec(deflate=True, deflate_min_size=deflate_min_size, max_size=max_size)
+    if subprotocol == BINARY_SUBPROTOCOL:
+        return BinaryCodec(max_size=max_size)
+    return JsonCodec()
+
+
+def offered_subprotocols(wire_format):
+    """
+    Subprotocols a client offers for a preferred wire format, best first.
+
+    Args:
+        wire_format (str): "bin+deflate", "bin" or "json".
+
+    Returns:
+        list: Subprotocols to offer in the handshake.
+    """
+    preferred = f"lolang.v{PROTOCOL_VERSION}.{wire_format}"
+    if preferred not in SUBPROTOCOLS:
+        raise ValueError(f"Unknown wire format: {wire_format}")
+    return list(SUBPROTOCOLS[SUBPROTOCOLS.index(preferred):])
+
+
+_JSON = JsonCodec()
+_BINARY = BinaryCodec()
+
+
+def decode_frame(message, max_size=DEFAULT_MAX_FRAME_SIZE):
+    """
+    Decode a frame of any supported encoding.
+
+    Text messages are JSON and binary messages use the binary layout, so a
+    peer can always be read regardless of what was negotiated.
+
+    Args:
+        message (str or bytes): The message received from the socket.
+        max_size (int): Largest binary frame body accepted once inflated;
+            use the max_size of the websocket.
+
+    Returns:
+        dict: The decoded frame.
+
+    Raises:
+        ProtocolError: The message is not a valid frame.
+    """
+    if isinstance(message, str):
+        return _JSON.decode(message)
+    codec = _BINARY if max_size == _BINARY.max_size else BinaryCodec(max_size=max_size)
+    return codec.decode(message)